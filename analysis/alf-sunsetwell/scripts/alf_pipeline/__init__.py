@@ -0,0 +1,14 @@
+"""Stage-based rebuild pipeline for the ALF SunsetWell analysis artifacts."""
+
+from .config import PipelineConfig
+from .dag import ArtifactCache, Pipeline, Stage, StageResult
+from .stages import PIPELINE
+
+__all__ = [
+    "ArtifactCache",
+    "PIPELINE",
+    "Pipeline",
+    "PipelineConfig",
+    "Stage",
+    "StageResult",
+]
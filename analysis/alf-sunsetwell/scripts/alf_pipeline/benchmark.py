@@ -0,0 +1,289 @@
+"""Synthetic state exports and a timed, baseline-compared pipeline benchmark.
+
+:func:`generate_state_files` writes ``alf-processed_<stamp>.csv`` files with
+the columns the state processors emit (and ``load_state_frame`` reads) for
+any number of facilities and states. As with FL today, only one state carries
+the regulatory and service columns, sized so they cover ``detail_share`` of
+all rows (~14% by default); the other states omit those columns entirely.
+
+:func:`run_scenario` generates a cohort, runs the full pipeline on it in a
+fresh process (so peak RSS belongs to that scenario alone), and returns the
+per-stage metrics recorded by :mod:`alf_pipeline.instrument`.
+:func:`compare_to_baseline` flags stages that got slower or larger than a
+stored baseline by more than a tolerance.
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import platform
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .config import REG_COLS, SERVICE_COLS, PipelineConfig
+
+
+SCALES = {"20k": 20_000, "100k": 100_000, "500k": 500_000}
+BENCHMARK_STAGES = ("ingest", "combine", "features", "umap", "impute", "score", "sensitivity")
+BENCHMARK_RUN_DATE = datetime(2026, 1, 5)
+
+US_STATES = [
+    "ca", "fl", "tx", "co", "ny", "mn", "al", "ak", "az", "ar", "ct", "de", "ga", "hi", "id", "il", "in",
+    "ia", "ks", "ky", "la", "me", "md", "ma", "mi", "ms", "mo", "mt", "ne", "nv", "nh", "nj", "nm", "nc",
+    "nd", "oh", "ok", "or", "pa", "ri", "sc", "sd", "tn", "ut", "vt", "va", "wa", "wv", "wi", "wy",
+]
+
+LICENSE_STATUSES = ["ACTIVE", "ACTIVE", "ACTIVE", "CURRENT", "PENDING", "IN REVIEW", "INACTIVE", "EXPIRED", "CLOSED"]
+PROVIDER_TYPES = ["assisted_living", "residential_care", "memory_care", "adult_family_home"]
+TYPE_DETAILS = ["Standard", "Extended Congregate Care", "Limited Nursing", "Limited Mental Health"]
+ACTIVITIES = ["bingo", "music", "gardening", "exercise", "crafts", "outings", "worship"]
+NURSING = ["RN on site", "LPN on site", "24h nursing", "on call"]
+PROGRAMS = ["memory care", "hospice", "respite", "rehab", "diabetes care"]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class SyntheticCohort:
+    facilities: int
+    states: int
+    detail_share: float = 0.14
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        scale = next((label for label, size in SCALES.items() if size == self.facilities), str(self.facilities))
+        return f"{scale}x{self.states}"
+
+    def state_codes(self) -> Dict[str, str]:
+        if not 1 <= self.states <= len(US_STATES):
+            raise ValueError(f"states must be between 1 and {len(US_STATES)}")
+        return {code: code.upper() for code in US_STATES[: self.states]}
+
+    def state_sizes(self) -> List[int]:
+        """Rows per state: the detail state gets ``detail_share``, the rest a skewed split."""
+        if self.states == 1:
+            return [self.facilities]
+        rng = np.random.default_rng(self.seed)
+        detail_rows = int(round(self.facilities * self.detail_share))
+        weights = rng.lognormal(mean=0.0, sigma=0.8, size=self.states - 1)
+        rest = np.floor(weights / weights.sum() * (self.facilities - detail_rows)).astype(int)
+        rest[0] += self.facilities - detail_rows - rest.sum()
+        return [int(rest[0]), detail_rows, *map(int, rest[1:])]
+
+
+def _list_column(rng: np.random.Generator, n: int, vocabulary: Sequence[str], counts: np.ndarray) -> List[str]:
+    picks = rng.integers(0, len(vocabulary), size=(n, max(int(counts.max(initial=0)), 1)))
+    return [";".join(vocabulary[i] for i in row[:count]) for row, count in zip(picks, counts)]
+
+
+def synthetic_state_frame(code: str, rows: int, with_details: bool, rng: np.random.Generator) -> pd.DataFrame:
+    """One state's processed export with realistic types, vocabularies, and gaps."""
+    issue = pd.to_datetime(rng.integers(0, 16_000, rows), unit="D", origin="1980-01-01")
+    frame = pd.DataFrame(
+        {
+            "state": code.upper(),
+            "state_license_number": [f"{code.upper()}{i:07d}" for i in range(rows)],
+            "facility_name": [f"Synthetic Residence {code.upper()} {i}" for i in range(rows)],
+            "address": [f"{n} Main St" for n in rng.integers(1, 9999, rows)],
+            "city": rng.choice([f"City {i}" for i in range(200)], rows),
+            "zip_code": [f"{z:05d}" for z in rng.integers(1000, 99999, rows)],
+            "county": rng.choice([f"County {i}" for i in range(60)], rows),
+            "phone": [f"({a}) 555-{b:04d}" for a, b in zip(rng.integers(200, 999, rows), rng.integers(0, 9999, rows))],
+            "license_status": rng.choice(LICENSE_STATUSES, rows),
+            "licensed_capacity": rng.gamma(2.0, 30.0, rows).round().clip(2, 400).astype(int).astype(str),
+            "license_issue_date": issue.strftime("%Y-%m-%d"),
+            "license_expiration_date": (issue + pd.to_timedelta(rng.integers(365, 3 * 365, rows), unit="D")).strftime(
+                "%Y-%m-%d"
+            ),
+            "provider_type": rng.choice(PROVIDER_TYPES, rows),
+            "facility_type_detail": rng.choice(TYPE_DETAILS, rows),
+            "latitude": (rng.random(rows) * 18 + 27).round(6).astype(str),
+            "longitude": (rng.random(rows) * 50 - 122).round(6).astype(str),
+            "description": ["Licensed assisted living residence offering personal care and supervision."] * rows,
+            "is_closed": np.where(rng.random(rows) < 0.03, "true", "false"),
+            "source": f"SYNTHETIC_{code.upper()}",
+        }
+    )
+    gaps = {"license_status": 0.05, "licensed_capacity": 0.05, "license_issue_date": 0.1, "facility_type_detail": 0.3}
+    for col, share in gaps.items():
+        frame.loc[rng.random(rows) < share, col] = ""
+
+    if with_details:
+        for col in REG_COLS:
+            frame[col] = rng.poisson(2.5 if col != "fine_amount" else 1.0, rows).astype(float)
+        frame["fine_amount"] *= rng.choice([250.0, 500.0, 1000.0], rows)
+        frame["deficiency_unclassified"] = rng.poisson(0.5, rows).astype(float)
+        lists = {
+            "activities": (ACTIVITIES, "activities_count"),
+            "nurse_availability": (NURSING, "nurse_availability_count"),
+            "special_programs": (PROGRAMS, "special_programs_count"),
+        }
+        for prefix, (vocabulary, count_col) in lists.items():
+            counts = rng.integers(0, len(vocabulary) + 1, rows)
+            frame[count_col] = counts.astype(float)
+            frame[f"{prefix}_list"] = _list_column(rng, rows, vocabulary, counts)
+        # Detail columns are themselves incomplete within the reporting state
+        for col in REG_COLS + SERVICE_COLS:
+            frame[col] = frame[col].where(rng.random(rows) >= 0.05)
+    return frame
+
+
+def generate_state_files(root: Path, cohort: SyntheticCohort, stamp: str = "20260101") -> Dict[str, str]:
+    """Write one processed export per synthetic state under ``root`` and return the state codes."""
+    rng = np.random.default_rng(cohort.seed)
+    codes = cohort.state_codes()
+    for position, (code, rows) in enumerate(zip(codes, cohort.state_sizes())):
+        frame = synthetic_state_frame(code, rows, with_details=position == 1 or cohort.states == 1, rng=rng)
+        state_dir = root / code
+        state_dir.mkdir(parents=True, exist_ok=True)
+        frame.to_csv(state_dir / f"alf-processed_{stamp}.csv", index=False)
+    return codes
+
+
+# ---------------------------------------------------------------------------
+# Scenario runs
+# ---------------------------------------------------------------------------
+
+
+def _run_in_process(cohort: SyntheticCohort, workdir: str, stream_chunk_rows: int) -> Dict[str, Any]:
+    """Process-pool entry point: generate the cohort, run the pipeline, collect metrics."""
+    from .instrument import max_rss_bytes
+    from .stages import OPT_IN_STAGES, PIPELINE
+
+    root = Path(workdir)
+    if root.exists():
+        shutil.rmtree(root)
+    state_dir = root / "state"
+    codes = generate_state_files(state_dir, cohort)
+    config = PipelineConfig(
+        state_data_dir=state_dir,
+        data_dir=root / "data",
+        cache_dir=root / "data" / ".cache",
+        run_date=BENCHMARK_RUN_DATE,
+        state_codes=codes,
+        ingest_cache=False,
+        stream_chunk_rows=stream_chunk_rows,
+    )
+    config.data_dir.mkdir(parents=True)
+    results = PIPELINE.run(config, use_cache=False, exclude=OPT_IN_STAGES)
+    return {
+        "facilities": cohort.facilities,
+        "states": cohort.states,
+        "peak_rss_mb": round(max_rss_bytes() / 1024**2, 1),
+        "stages": {
+            result.name: {
+                "wall_seconds": result.metrics.wall_seconds,
+                "cpu_seconds": result.metrics.cpu_seconds,
+                "peak_rss_mb": result.metrics.peak_rss_mb,
+                "rows_out": result.metrics.rows_out,
+            }
+            for result in results
+            if result.metrics is not None
+        },
+    }
+
+
+def run_scenario(cohort: SyntheticCohort, workdir: Path, stream_chunk_rows: int = 0, keep: bool = False) -> Dict[str, Any]:
+    """Benchmark one cohort in a fresh interpreter so its memory peak is isolated."""
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            return pool.submit(_run_in_process, cohort, str(workdir), stream_chunk_rows).result()
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": multiprocessing.cpu_count(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Baseline comparison
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Regression:
+    scenario: str
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self) -> str:
+        change = self.current / self.baseline - 1 if self.baseline else float("inf")
+        return (
+            f"{self.scenario} {self.stage} {self.metric}: "
+            f"{self.baseline:.2f} -> {self.current:.2f} ({change:+.0%})"
+        )
+
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_baseline(path: Path, scenarios: Dict[str, Dict[str, Any]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"machine": machine_info(), "scenarios": scenarios}
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, indent=2)
+
+
+def compare_to_baseline(
+    scenarios: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    min_seconds: float = 1.0,
+    min_rss_mb: float = 50.0,
+) -> List[Regression]:
+    """Stages whose wall time or peak RSS exceeds the baseline by more than ``tolerance``.
+
+    Differences below ``min_seconds`` / ``min_rss_mb`` are treated as noise.
+    """
+    slack = {"wall_seconds": min_seconds, "peak_rss_mb": min_rss_mb}
+    regressions: List[Regression] = []
+    for name, current in scenarios.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for stage in BENCHMARK_STAGES:
+            now, before = current["stages"].get(stage), previous["stages"].get(stage)
+            if now is None or before is None:
+                continue
+            for metric, floor in slack.items():
+                if now.get(metric) is None or before.get(metric) is None:
+                    continue
+                if now[metric] > before[metric] * (1 + tolerance) and now[metric] - before[metric] > floor:
+                    regressions.append(Regression(name, stage, metric, before[metric], now[metric]))
+    return regressions
+
+
+def scenario_table(scenarios: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    rows = [
+        {"scenario": name, "stage": stage, **metrics}
+        for name, result in scenarios.items()
+        for stage, metrics in result["stages"].items()
+    ]
+    return pd.DataFrame(rows)
+
@@ -0,0 +1,259 @@
+"""Bootstrap intervals for ``composite_raw`` and ``sunsetwell_percentile``.
+
+Each replicate perturbs the two modelling choices behind the score:
+
+* every imputed facility redraws its k imputation neighbors with replacement
+  (same inverse-distance weighting and distance confidence as the impute
+  stage), which moves its service values, its service confidence and, through
+  the cohort-wide service ranks, everyone's ``service_score``;
+* the component weights are drawn from a Dirichlet centred on
+  ``base_weights`` (higher ``concentration`` = tighter).
+
+The composite and its cohort percentile are then recomputed with the score
+stage's math and the interval is read from the replicate quantiles.
+
+Replicate ``r`` draws from its own generator, spawned from ``seed`` with
+``spawn_key=(r,)``, and writes row ``r`` of the result matrices, so the
+intervals depend only on the seed and replicate count, never on how
+replicates are spread over workers. With more than one worker the input and
+result matrices live in shared memory and each process scores a contiguous
+block of replicates.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from multiprocessing import shared_memory
+from typing import Dict, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .imputation import ImputationNeighbors, weighted_services
+from .sensitivity import WEIGHT_KEYS, composite_batch
+from .utils import service_confidence_from_distances
+
+
+SERVICE_COMPONENT = WEIGHT_KEYS.index("service")
+
+
+@dataclass
+class BootstrapInputs:
+    """Arrays one replicate reads; every field is shared with worker processes."""
+
+    # (facility × component) in WEIGHT_KEYS order; the service column is recomputed
+    components: np.ndarray
+    reg_available: np.ndarray
+    services: np.ndarray
+    confidence: np.ndarray
+    # Imputed facilities, their observed cells (never resampled) and k neighbors
+    imputed_rows: np.ndarray
+    observed: np.ndarray
+    distances: np.ndarray
+    indices: np.ndarray
+    donor_values: np.ndarray
+
+    @classmethod
+    def build(
+        cls,
+        components: np.ndarray,
+        reg_available: np.ndarray,
+        services: np.ndarray,
+        confidence: np.ndarray,
+        neighbors: ImputationNeighbors,
+    ) -> "BootstrapInputs":
+        return cls(
+            components=np.ascontiguousarray(components, dtype=float),
+            reg_available=np.asarray(reg_available, dtype=float),
+            services=np.ascontiguousarray(services, dtype=float),
+            confidence=np.asarray(confidence, dtype=float),
+            imputed_rows=np.asarray(neighbors.rows, dtype=np.int64),
+            observed=np.asarray(neighbors.observed, dtype=bool),
+            distances=np.ascontiguousarray(neighbors.distances, dtype=float),
+            indices=np.ascontiguousarray(neighbors.indices, dtype=np.int64),
+            donor_values=np.ascontiguousarray(neighbors.values, dtype=float),
+        )
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+def replicate_rng(seed: int, replicate: int) -> np.random.Generator:
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(replicate,)))
+
+
+def _pct_rank(values: np.ndarray) -> np.ndarray:
+    return pd.DataFrame(values).rank(pct=True).to_numpy()
+
+
+def run_replicate(
+    inputs: BootstrapInputs,
+    replicate: int,
+    seed: int,
+    alpha: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """``(composite_raw, sunsetwell_percentile)`` for one bootstrap replicate."""
+    rng = replicate_rng(seed, replicate)
+    services = inputs.services.copy()
+    confidence = inputs.confidence.copy()
+
+    rows = inputs.imputed_rows
+    if len(rows) and inputs.distances.shape[1]:
+        draw = rng.integers(0, inputs.distances.shape[1], size=inputs.distances.shape)
+        distances = np.take_along_axis(inputs.distances, draw, axis=1)
+        indices = np.take_along_axis(inputs.indices, draw, axis=1)
+        predicted = weighted_services(distances, inputs.donor_values[indices])
+        services[rows] = np.where(inputs.observed, services[rows], predicted)
+        confidence[rows] = service_confidence_from_distances(distances)
+
+    components = inputs.components.copy()
+    with np.errstate(invalid="ignore"):
+        service_score = np.nanmean(_pct_rank(services), axis=1)
+    components[:, SERVICE_COMPONENT] = np.where(np.isnan(service_score), 0.5, service_score)
+
+    weights = rng.dirichlet(alpha)
+    modifiers = np.ones_like(components)
+    modifiers[:, WEIGHT_KEYS.index("reg")] = inputs.reg_available
+    modifiers[:, SERVICE_COMPONENT] = confidence
+    composite = composite_batch(
+        weights[np.newaxis, np.newaxis, :],
+        np.zeros(len(components), dtype=np.int64),
+        components,
+        modifiers,
+    )[0]
+    percentile = _pct_rank(composite[:, np.newaxis])[:, 0]
+    return composite, percentile
+
+
+# ---------------------------------------------------------------------------
+# Shared-memory worker pool
+# ---------------------------------------------------------------------------
+
+
+class SharedArrays:
+    """Copies of named arrays in ``multiprocessing.shared_memory`` segments."""
+
+    def __init__(self, arrays: Mapping[str, np.ndarray]) -> None:
+        self.segments: Dict[str, shared_memory.SharedMemory] = {}
+        self.spec: Dict[str, Tuple[str, Tuple[int, ...], str]] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        try:
+            for name, array in arrays.items():
+                segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self.segments[name] = segment
+                self.spec[name] = (segment.name, array.shape, array.dtype.str)
+                self.arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+                self.arrays[name][...] = array
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self.arrays.clear()
+        for segment in self.segments.values():
+            segment.close()
+            segment.unlink()
+        self.segments.clear()
+
+
+def attach_arrays(
+    spec: Mapping[str, Tuple[str, Tuple[int, ...], str]],
+) -> Tuple[Dict[str, np.ndarray], Dict[str, shared_memory.SharedMemory]]:
+    """Map the segments described by ``SharedArrays.spec`` in another process."""
+    segments, arrays = {}, {}
+    for name, (segment_name, shape, dtype) in spec.items():
+        # Pool workers share the creator's resource tracker, which unlinks on close
+        segment = shared_memory.SharedMemory(name=segment_name)
+        segments[name] = segment
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+    return arrays, segments
+
+
+_WORKER: Dict[str, object] = {}
+
+
+def _init_worker(spec: Mapping[str, Tuple[str, Tuple[int, ...], str]], seed: int, alpha: np.ndarray) -> None:
+    arrays, segments = attach_arrays(spec)
+    _WORKER.update(
+        inputs=BootstrapInputs(**{field.name: arrays[field.name] for field in fields(BootstrapInputs)}),
+        outputs=(arrays["composite"], arrays["percentile"]),
+        segments=segments,
+        seed=seed,
+        alpha=alpha,
+    )
+
+
+def _run_block(start: int, stop: int) -> int:
+    composite_out, percentile_out = _WORKER["outputs"]
+    for replicate in range(start, stop):
+        composite_out[replicate], percentile_out[replicate] = run_replicate(
+            _WORKER["inputs"], replicate, _WORKER["seed"], _WORKER["alpha"]
+        )
+    return stop - start
+
+
+def run_replicates(
+    inputs: BootstrapInputs,
+    replicates: int,
+    seed: int,
+    alpha: np.ndarray,
+    workers: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(replicate × facility) float32 composites and percentiles."""
+    n = len(inputs.components)
+    workers = min(workers or os.cpu_count() or 1, replicates)
+    if workers <= 1:
+        composite = np.empty((replicates, n), dtype=np.float32)
+        percentile = np.empty((replicates, n), dtype=np.float32)
+        for replicate in range(replicates):
+            composite[replicate], percentile[replicate] = run_replicate(inputs, replicate, seed, alpha)
+        return composite, percentile
+
+    shared = SharedArrays(
+        {
+            **inputs.arrays(),
+            "composite": np.zeros((replicates, n), dtype=np.float32),
+            "percentile": np.zeros((replicates, n), dtype=np.float32),
+        }
+    )
+    try:
+        # A few blocks per worker keeps the pool busy when replicate costs differ
+        bounds = np.linspace(0, replicates, min(replicates, workers * 4) + 1).astype(int)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(shared.spec, seed, alpha)
+        ) as pool:
+            list(pool.map(_run_block, bounds[:-1].tolist(), bounds[1:].tolist()))
+        return shared.arrays["composite"].copy(), shared.arrays["percentile"].copy()
+    finally:
+        shared.close()
+
+
+def bootstrap_intervals(
+    inputs: BootstrapInputs,
+    base_weights: Mapping[str, float],
+    replicates: int,
+    level: float = 0.9,
+    concentration: float = 200.0,
+    seed: int = 42,
+    workers: int = 0,
+) -> pd.DataFrame:
+    """Equal-tailed ``level`` intervals for the composite and its percentile.
+
+    Returns ``composite_raw_lo/hi`` and ``sunsetwell_percentile_lo/hi`` per
+    facility, in the row order of ``inputs``.
+    """
+    alpha = concentration * np.array([base_weights[key] for key in WEIGHT_KEYS], dtype=float)
+    composite, percentile = run_replicates(inputs, replicates, seed, alpha, workers)
+    tails = [(1.0 - level) / 2.0, (1.0 + level) / 2.0]
+    composite_q = np.quantile(composite, tails, axis=0)
+    percentile_q = np.quantile(percentile, tails, axis=0)
+    return pd.DataFrame(
+        {
+            "composite_raw_lo": composite_q[0],
+            "composite_raw_hi": composite_q[1],
+            "sunsetwell_percentile_lo": percentile_q[0],
+            "sunsetwell_percentile_hi": percentile_q[1],
+        }
+    )
@@ -0,0 +1,129 @@
+"""Facility-level changeset between two score runs.
+
+Rows are matched on ``(state, state_license_number)`` plus the occurrence of
+that key within its run, so duplicated licenses pair up in file order. One
+outer merge classifies every facility as ``inserted`` (only in the current
+run), ``removed`` (only in the previous run), ``changed`` (a compared number
+moved by more than its column's tolerance, or a compared label differs) or
+unchanged; unchanged facilities are left out of the changeset so loaders only
+upsert the delta. Tolerances should sit above the run-to-run drift of
+unchanged facilities (tenure ageing, percentile ranks shuffling by a few
+places), or every refresh reports most of the table.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+KEY_COLS = ["state", "state_license_number"]
+OCCURRENCE = "_occurrence"
+PREVIOUS_PREFIX = "previous_"
+DELTA_SUFFIX = "_delta"
+CHANGE = "change"
+# Tolerance for compared columns without their own
+DEFAULT_TOLERANCE = 1e-3
+
+
+def _keyed(scores: pd.DataFrame) -> pd.DataFrame:
+    keyed = scores.assign(**{col: scores[col].astype(str) for col in KEY_COLS})
+    return keyed.assign(**{OCCURRENCE: keyed.groupby(KEY_COLS, sort=False).cumcount()})
+
+
+def _shift_stats(delta: pd.Series) -> Dict[str, float]:
+    magnitude = delta.abs().dropna()
+    if magnitude.empty:
+        return {"mean_abs": 0.0, "p50_abs": 0.0, "p95_abs": 0.0, "max_abs": 0.0, "mean": 0.0}
+    return {
+        "mean_abs": round(float(magnitude.mean()), 6),
+        "p50_abs": round(float(magnitude.quantile(0.5)), 6),
+        "p95_abs": round(float(magnitude.quantile(0.95)), 6),
+        "max_abs": round(float(magnitude.max()), 6),
+        "mean": round(float(delta.mean()), 6),
+    }
+
+
+def score_changeset(
+    previous: pd.DataFrame,
+    current: pd.DataFrame,
+    numeric_cols: Sequence[str],
+    label_cols: Sequence[str] = (),
+    tolerances: Optional[Mapping[str, float]] = None,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Changed rows and summary statistics from ``previous`` to ``current``.
+
+    The changeset holds the current row for inserted and changed facilities
+    (the previous row for removed ones), ``previous_<col>`` and
+    ``<col>_delta`` for each numeric column, and a ``change`` label. Columns
+    missing from the previous run compare as NaN; NaN on both sides counts as
+    unchanged. ``tolerances`` maps numeric columns to the largest move that
+    does not count as a change (:data:`DEFAULT_TOLERANCE` otherwise).
+    """
+    numeric_cols = [col for col in numeric_cols if col in current.columns]
+    tolerance = {col: float((tolerances or {}).get(col, DEFAULT_TOLERANCE)) for col in numeric_cols}
+    label_cols = [col for col in label_cols if col in current.columns]
+    compared = [*numeric_cols, *label_cols]
+    previous = _keyed(previous).reindex(columns=[*KEY_COLS, OCCURRENCE, *compared])
+    current = _keyed(current)
+
+    merged = current.merge(
+        previous,
+        on=[*KEY_COLS, OCCURRENCE],
+        how="outer",
+        suffixes=("", "_prev"),
+        indicator=True,
+        sort=False,
+    )
+    inserted = (merged["_merge"] == "left_only").to_numpy()
+    removed = (merged["_merge"] == "right_only").to_numpy()
+    matched = ~inserted & ~removed
+
+    moved = np.zeros(len(merged), dtype=bool)
+    for col in numeric_cols:
+        new = pd.to_numeric(merged[col], errors="coerce").to_numpy(dtype=float)
+        old = pd.to_numeric(merged[f"{col}_prev"], errors="coerce").to_numpy(dtype=float)
+        with np.errstate(invalid="ignore"):
+            differs = (np.abs(new - old) > tolerance[col]) | (np.isnan(new) != np.isnan(old))
+        moved |= differs
+        merged[f"{col}{DELTA_SUFFIX}"] = new - old
+    for col in label_cols:
+        new, old = merged[col].astype(object), merged[f"{col}_prev"].astype(object)
+        moved |= ~((new == old) | (new.isna() & old.isna())).to_numpy()
+    changed = matched & moved
+
+    # Removed facilities only exist on the previous side: report their previous values
+    for col in compared:
+        merged[col] = merged[col].where(~removed, merged[f"{col}_prev"])
+
+    merged[CHANGE] = np.select([inserted, removed, changed], ["inserted", "removed", "changed"], "unchanged")
+    changes = merged.loc[merged[CHANGE] != "unchanged"].rename(
+        columns={f"{col}_prev": f"{PREVIOUS_PREFIX}{col}" for col in numeric_cols}
+    )
+    ordered = [
+        *KEY_COLS,
+        CHANGE,
+        *[col for col in current.columns if col not in (*KEY_COLS, OCCURRENCE)],
+        *[f"{PREVIOUS_PREFIX}{col}" for col in numeric_cols],
+        *[f"{col}{DELTA_SUFFIX}" for col in numeric_cols],
+    ]
+    changes = changes[ordered].reset_index(drop=True)
+
+    counts = merged[CHANGE].value_counts()
+    by_state = (
+        merged.loc[merged[CHANGE] != "unchanged"].groupby(["state", CHANGE]).size().unstack(fill_value=0)
+    )
+    summary = {
+        "tolerances": tolerance,
+        "rows": {"previous": int((~inserted).sum()), "current": int((~removed).sum())},
+        **{label: int(counts.get(label, 0)) for label in ("inserted", "removed", "changed", "unchanged")},
+        "by_state": {
+            state: {label: int(value) for label, value in row.items()} for state, row in by_state.iterrows()
+        },
+        "shift": {
+            col: _shift_stats(merged.loc[matched, f"{col}{DELTA_SUFFIX}"]) for col in numeric_cols
+        },
+    }
+    return changes, summary
@@ -0,0 +1,273 @@
+"""Paths, column groups, and run configuration for the ALF rebuild pipeline."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+# ---------------------------------------------------------------------------
+# Paths & configuration
+# ---------------------------------------------------------------------------
+
+PACKAGE_PATH = Path(__file__).resolve()
+SCRIPTS_DIR = PACKAGE_PATH.parents[1]
+ANALYSIS_DIR = PACKAGE_PATH.parents[2]
+REPO_ROOT = PACKAGE_PATH.parents[4]
+STATE_DATA_DIR = REPO_ROOT / "data" / "state"
+ANALYSIS_DATA_DIR = ANALYSIS_DIR / "data"
+CACHE_DIR = ANALYSIS_DATA_DIR / ".cache"
+
+STATE_CODES = {
+    "ca": "CA",
+    "fl": "FL",
+    "tx": "TX",
+    "co": "CO",
+    "ny": "NY",
+    "mn": "MN",
+}
+
+REG_COLS = [
+    "complaint_count",
+    "sanction_count",
+    "fine_amount",
+    "deficiencies_total",
+    "deficiency_class1",
+    "deficiency_class2",
+    "deficiency_class3",
+    "deficiency_class4",
+]
+
+SERVICE_COLS = [
+    "activities_count",
+    "nurse_availability_count",
+    "special_programs_count",
+]
+
+NUMERIC_OPTIONAL = [
+    "deficiency_unclassified",
+    "licensed_capacity",
+    "latitude",
+    "longitude",
+]
+
+NUMERIC_COLS = list(dict.fromkeys(REG_COLS + SERVICE_COLS + NUMERIC_OPTIONAL))
+
+FEATURE_COLS = REG_COLS + SERVICE_COLS + ["licensed_capacity"]
+Z_COLS = [f"{col}_z" for col in FEATURE_COLS]
+
+COMPONENT_COLS = ["reg_score", "service_score", "capacity_score", "licensure_score"]
+WEIGHT_COLS = ["reg_weight", "service_weight", "capacity_weight", "licensure_weight"]
+
+BASE_WEIGHTS = {
+    "reg": 0.4,
+    "service": 0.25,
+    "capacity": 0.2,
+    "licensure": 0.15,
+}
+
+# Largest move per score column that score_diff does not report as a change. Scores are 0–1 and
+# served as whole points out of 100: 1e-3 is a tenth of a point, above the week-to-week tenure
+# drift; the percentile is a rank, so it gets half a displayed point to absorb rank jitter.
+DIFF_TOLERANCES = {
+    "sunsetwell_percentile": 5e-3,
+    "composite_raw": 1e-3,
+    **{col: 1e-3 for col in COMPONENT_COLS},
+    "service_confidence": 1e-3,
+}
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class PipelineConfig:
+    """Runtime settings shared by every stage.
+
+    Stages declare which of these fields they depend on; those values are
+    folded into the stage's cache key, so changing e.g. ``base_weights`` only
+    invalidates scoring and the stages downstream of it.
+    """
+
+    state_data_dir: Path = STATE_DATA_DIR
+    data_dir: Path = ANALYSIS_DATA_DIR
+    cache_dir: Path = CACHE_DIR
+    run_date: datetime = field(default_factory=utc_now)
+    state_codes: Dict[str, str] = field(default_factory=lambda: dict(STATE_CODES))
+    # CPUs the whole run may use (0 = all available), split per stage into processes and threads
+    cpu_budget: int = 0
+    # "reproducible" seeds UMAP and pins native thread pools (bit-stable outputs);
+    # "fast" runs UMAP unseeded and multi-threaded within the budget
+    run_mode: str = "reproducible"
+    # Worker processes for state parsing (0 = the CPU budget); unchanged states are reused
+    ingest_workers: int = 0
+    ingest_cache: bool = True
+    # Rows per block when streaming states through ingest/combine/profile (0 = whole frames in memory)
+    stream_chunk_rows: int = 0
+
+    umap_n_neighbors: int = 25
+    umap_min_dist: float = 0.3
+    umap_random_state: int = 42
+    # "refit" fits UMAP from scratch; "incremental" reuses the saved model in umap_model/
+    umap_mode: str = "refit"
+    umap_refit_fraction: float = 0.25
+    umap_drift_threshold: float = 0.25
+    knn_neighbors: int = 25
+    # Rows per batched neighbor query; bounds memory, does not change results
+    knn_chunk_size: int = 8192
+    # Shared neighbor index over the embedding: "kdtree" (exact) or "rpforest" (approximate)
+    neighbor_backend: str = "kdtree"
+    neighbor_trees: int = 8
+    neighbor_leaf_size: int = 64
+    neighbor_seed: int = 42
+    # Inserted facilities beyond this share of the saved index trigger a rebuild
+    neighbor_rebuild_fraction: float = 0.1
+    # Similar facilities exported per facility in facility_peers.csv
+    peer_count: int = 10
+
+    base_weights: Dict[str, float] = field(default_factory=lambda: dict(BASE_WEIGHTS))
+    sensitivity_reg_weights: Tuple[float, ...] = (0.3, 0.35, 0.4, 0.45, 0.5)
+    sensitivity_service_weights: Tuple[float, ...] = (0.15, 0.25, 0.35)
+    # "product" sweeps the reg × service lists above; "dirichlet" samples weightings around base_weights
+    sensitivity_grid: str = "product"
+    sensitivity_samples: int = 1000
+    sensitivity_concentration: float = 50.0
+    sensitivity_seed: int = 42
+    # Kendall tau uses a fixed facility sample above this size
+    sensitivity_tau_sample: int = 20000
+    # Memory bound for one batch of grid points; does not change results
+    sensitivity_max_bytes: int = 256 * 1024**2
+
+    # Bootstrap intervals in alf_scores_v1.csv (0 replicates = no interval columns): imputation
+    # neighbors are resampled and weights drawn from a Dirichlet around base_weights
+    bootstrap_replicates: int = 200
+    bootstrap_level: float = 0.9
+    bootstrap_concentration: float = 200.0
+    bootstrap_seed: int = 42
+    # Worker processes for bootstrap replicates (0 = the CPU budget); does not change results
+    bootstrap_workers: int = 0
+
+    # Extra weight versions (JSON files) scored and compared against base_weights by compare_versions
+    score_version_files: Tuple[Path, ...] = ()
+    version_top_n: Tuple[int, ...] = (100, 250)
+
+    # Imputation sweep (tune_imputation.py): held-out FL service values re-imputed across this grid
+    sweep_umap_neighbors: Tuple[int, ...] = (10, 15, 25, 50)
+    sweep_min_dist: Tuple[float, ...] = (0.0, 0.1, 0.3, 0.5)
+    sweep_knn_neighbors: Tuple[int, ...] = (5, 10, 25, 50)
+    sweep_holdout_state: str = "FL"
+    sweep_holdout_share: float = 0.2
+    sweep_seed: int = 42
+    # Worker processes for sweep fits (0 = the CPU budget)
+    sweep_workers: int = 0
+
+    # Leave-one-state-out holdout (opt-in generalization stage): each state is scored against an
+    # embedding, imputation index and percentile references refit without it (empty = every state)
+    holdout_states: Tuple[str, ...] = ()
+    # Worker processes for holdout folds (0 = the CPU budget)
+    holdout_workers: int = 0
+
+    # Peer-group scoring: nested group keys (capacity_band is derived from licensed_capacity);
+    # groups smaller than peer_min_group_size fall back to their parent group
+    peer_group_keys: Tuple[str, ...] = ("state", "capacity_band", "provider_type")
+    peer_capacity_bands: Tuple[float, ...] = (0, 7, 17, 50, 100)
+    peer_min_group_size: int = 30
+
+    # Score moves up to these sizes (per column) are not reported as changes by the score_diff stage
+    diff_tolerances: Dict[str, float] = field(default_factory=lambda: dict(DIFF_TOLERANCES))
+
+    # Record linkage: other facility files (CSV/Parquet) linked to the cohort by the link stage
+    linkage_sources: Tuple[Path, ...] = ()
+    linkage_min_confidence: float = 0.8
+    # Block key values with more candidate pairs than this are skipped (e.g. a shared switchboard phone)
+    linkage_max_block_pairs: int = 250_000
+    # Worker processes for scoring block partitions (0 = the CPU budget); does not change results
+    linkage_workers: int = 0
+
+    # Spatial stage: facility counts within these radii and nearest geocoded neighbors exported per facility
+    spatial_radii_miles: Tuple[float, ...] = (5.0, 10.0, 25.0)
+    spatial_neighbors: int = 10
+
+    extremes_per_state: int = 150
+    prototype_top_n: int = 250
+    # Leaderboards: top/bottom N per state, county and metro; metros as listed for the web app
+    leaderboard_size: int = 30
+    high_performer_score: float = 75.0
+    metro_definitions: Path = REPO_ROOT / "data" / "top-50-metros.json"
+    # Worker processes for rendering figures in the plots stage (0 = the CPU budget)
+    plot_workers: int = 0
+
+    @property
+    def run_stamp(self) -> str:
+        return self.run_date.strftime("%Y%m%d")
+
+    @property
+    def run_day(self) -> str:
+        return self.run_date.date().isoformat()
+
+    @property
+    def sweep_dir(self) -> Path:
+        return self.cache_dir / "sweep"
+
+    @property
+    def stream_dir(self) -> Path:
+        return self.cache_dir / "stream"
+
+    @property
+    def umap_model_dir(self) -> Path:
+        return self.data_dir / "umap_model"
+
+    @property
+    def neighbor_index_dir(self) -> Path:
+        return self.data_dir / "neighbor_index"
+
+    @property
+    def scoring_reference_dir(self) -> Path:
+        return self.data_dir / "scoring_reference"
+
+    @property
+    def matrices_dir(self) -> Path:
+        return self.data_dir / "matrices"
+
+    @property
+    def score_history_dir(self) -> Path:
+        return self.data_dir / "score_history"
+
+    @property
+    def scores_snapshot_filename(self) -> str:
+        return f"alf_scores_{self.run_stamp}.parquet"
+
+    @property
+    def state_file_prefix(self) -> str:
+        return "alf_" + "_".join(self.state_codes.keys())
+
+    @property
+    def combined_filename(self) -> str:
+        return f"{self.state_file_prefix}_{self.run_stamp}.csv"
+
+    def previous_combined_path(self) -> Optional[Path]:
+        """Latest combined table from an earlier run (used for column order)."""
+        previous_files = [
+            path
+            for path in sorted(self.data_dir.glob(f"{self.state_file_prefix}_*.csv"))
+            if path.name != self.combined_filename
+        ]
+        return previous_files[-1] if previous_files else None
+
+    def previous_scores_path(self) -> Optional[Path]:
+        """Latest score snapshot from a run dated before this one (the score_diff baseline)."""
+        previous_files = [
+            path
+            for path in sorted(self.score_history_dir.glob("alf_scores_*.parquet"))
+            if path.name < self.scores_snapshot_filename
+        ]
+        return previous_files[-1] if previous_files else None
+
+    def template_vars(self) -> Dict[str, str]:
+        return {
+            "run_stamp": self.run_stamp,
+            "state_file_prefix": self.state_file_prefix,
+        }
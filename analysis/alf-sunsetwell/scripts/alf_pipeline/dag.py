@@ -0,0 +1,566 @@
+"""Stage registry, content-hashed artifact cache, and DAG runner.
+
+Each stage declares the artifacts it consumes (``inputs``), the artifacts it
+produces (``outputs``), the config fields it reads (``params``), and the files
+it publishes under the analysis data directory (``files``). A stage's cache
+key hashes its code, its params, any external fingerprint (e.g. source file
+contents), and the content hashes of its input artifacts. A rerun therefore
+only recomputes stages whose upstream data or configuration actually changed.
+
+A stage's code is the stage function, the functions, classes and plain
+constants of its own module that it reaches, and the full source of every
+other ``alf_pipeline`` module it uses, directly or through their imports
+(:func:`code_dependencies`). Editing a helper such as ``imputation.py``
+therefore reruns the stages that call it, and through their outputs the
+stages downstream of them.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pstats
+import shutil
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .config import PipelineConfig
+from .instrument import StageMetrics, StageMonitor, total_rows
+from .runtime import apply_plan, stage_plan
+from .store import ParquetTable, load_artifact, project, save_artifact
+
+
+CACHE_ENTRIES_PER_STAGE = 3
+# Bumped whenever the on-disk layout of cache entries changes
+CACHE_FORMAT = 2
+PACKAGE = __name__.rpartition(".")[0]
+
+
+# ---------------------------------------------------------------------------
+# Hashing
+# ---------------------------------------------------------------------------
+
+
+def _update_hash(hasher: Any, value: Any) -> None:
+    if isinstance(value, pd.DataFrame):
+        hasher.update(b"frame")
+        hasher.update(json.dumps([str(c) for c in value.columns]).encode())
+        hasher.update(json.dumps([str(t) for t in value.dtypes]).encode())
+        if len(value):
+            hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        hasher.update(b"series")
+        hasher.update(str(value.name).encode())
+        hasher.update(str(value.dtype).encode())
+        if len(value):
+            hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, ParquetTable):
+        hasher.update(b"parquet")
+        hasher.update(file_digest(value.path).encode())
+    elif isinstance(value, np.ndarray):
+        hasher.update(b"array")
+        hasher.update(str(value.dtype).encode())
+        hasher.update(str(value.shape).encode())
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        hasher.update(b"dict")
+        for key in sorted(value, key=str):
+            hasher.update(str(key).encode())
+            _update_hash(hasher, value[key])
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b"list")
+        for item in value:
+            _update_hash(hasher, item)
+    else:
+        hasher.update(json.dumps(value, default=str, sort_keys=True).encode())
+
+
+def content_hash(value: Any) -> str:
+    hasher = hashlib.sha256()
+    _update_hash(hasher, value)
+    return hasher.hexdigest()
+
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Code dependencies
+# ---------------------------------------------------------------------------
+
+
+def _referenced_names(code: Any) -> Iterator[str]:
+    yield from code.co_names
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            yield from _referenced_names(const)
+
+
+def _package_module(obj: Any) -> Optional[str]:
+    """Name of the ``alf_pipeline`` module defining ``obj`` (None outside the package)."""
+    name = obj.__name__ if inspect.ismodule(obj) else getattr(obj, "__module__", None)
+    if isinstance(name, str) and (name == PACKAGE or name.startswith(PACKAGE + ".")):
+        return name
+    return None
+
+
+def _is_constant(value: Any) -> bool:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_constant(item) for item in value)
+    if isinstance(value, dict):
+        return all(_is_constant(k) and _is_constant(v) for k, v in value.items())
+    return value is None or isinstance(value, (str, bytes, bool, int, float))
+
+
+@functools.lru_cache(maxsize=None)
+def _module_imports(name: str) -> Tuple[str, ...]:
+    """Other package modules whose objects ``name`` holds at module level."""
+    found = {_package_module(value) for value in vars(sys.modules[name]).values()}
+    return tuple(sorted(module for module in found if module and module != name))
+
+
+@functools.lru_cache(maxsize=None)
+def module_digest(name: str) -> str:
+    try:
+        source = inspect.getsource(sys.modules[name])
+    except (OSError, TypeError):
+        source = name
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def _source(obj: Any) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return obj.__qualname__
+
+
+def code_dependencies(func: Callable[..., Any]) -> Tuple[List[Any], Dict[str, Any], List[str]]:
+    """What ``func``'s behavior depends on inside the package.
+
+    Returns the functions and classes of ``func``'s own module it reaches
+    (``func`` first), the plain constants of that module they read, and every
+    other package module they use, closed over those modules' own imports.
+    """
+    home = func.__module__
+    helpers: Dict[str, Any] = {}
+    constants: Dict[str, Any] = {}
+    modules = set()
+    pending = [func]
+    while pending:
+        current = pending.pop()
+        if inspect.isclass(current):
+            pending.extend(value for value in vars(current).values() if inspect.isfunction(value))
+            continue
+        for name in sorted(set(_referenced_names(current.__code__))):
+            if name not in current.__globals__:
+                continue
+            value = current.__globals__[name]
+            module = _package_module(value)
+            if module is not None and module != home:
+                modules.add(module)
+            elif (inspect.isfunction(value) or inspect.isclass(value)) and module == home:
+                if value.__qualname__ not in helpers:
+                    helpers[value.__qualname__] = value
+                    pending.append(value)
+            elif _is_constant(value):
+                constants[name] = value
+
+    frontier = sorted(modules)
+    while frontier:
+        for module in _module_imports(frontier.pop()):
+            if module != home and module not in modules:
+                modules.add(module)
+                frontier.append(module)
+    ordered = [func, *(helpers[name] for name in sorted(helpers) if helpers[name] is not func)]
+    return ordered, dict(sorted(constants.items())), sorted(modules)
+
+
+# ---------------------------------------------------------------------------
+# Stage definitions
+# ---------------------------------------------------------------------------
+
+
+StageFunc = Callable[..., Dict[str, Any]]
+Fingerprint = Callable[[PipelineConfig], Any]
+ColumnSpec = Union[Tuple[str, ...], Callable[[PipelineConfig], Sequence[str]]]
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    func: StageFunc
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    params: Tuple[str, ...] = ()
+    files: Tuple[str, ...] = ()
+    columns: Dict[str, ColumnSpec] = field(default_factory=dict)
+    fingerprint: Optional[Fingerprint] = None
+    # Config field holding the stage's worker-process count, for stages that fan out
+    workers: Optional[str] = None
+    version: int = 1
+    cached: bool = True
+    description: str = ""
+
+    def code_hash(self) -> str:
+        """Hash of the stage's code: see :func:`code_dependencies`."""
+        helpers, constants, modules = code_dependencies(self.func)
+        payload = {
+            "source": [_source(obj) for obj in helpers],
+            "constants": constants,
+            "modules": {module: module_digest(module) for module in modules},
+        }
+        return content_hash(payload)
+
+    def input_columns(self, config: PipelineConfig, artifact: str) -> Optional[Sequence[str]]:
+        """Projection for ``artifact``: a fixed tuple, or one derived from the config."""
+        spec = self.columns.get(artifact)
+        if callable(spec):
+            return list(dict.fromkeys(spec(config)))
+        return spec
+
+    def param_values(self, config: PipelineConfig) -> Dict[str, Any]:
+        return {name: getattr(config, name) for name in self.params}
+
+    def published_paths(self, config: PipelineConfig) -> List[Path]:
+        template_vars = config.template_vars()
+        return [config.data_dir / name.format(**template_vars) for name in self.files]
+
+    def cache_key(self, config: PipelineConfig, input_hashes: Dict[str, str]) -> str:
+        payload = {
+            "stage": self.name,
+            "version": self.version,
+            "cache_format": CACHE_FORMAT,
+            "code": self.code_hash(),
+            "params": self.param_values(config),
+            "inputs": input_hashes,
+            "external": self.fingerprint(config) if self.fingerprint else None,
+        }
+        return content_hash(payload)
+
+
+# ---------------------------------------------------------------------------
+# Artifact cache
+# ---------------------------------------------------------------------------
+
+
+class ArtifactCache:
+    """Columnar store of stage outputs, one directory per cache key."""
+
+    def __init__(self, root: Path, enabled: bool = True) -> None:
+        self.root = root
+        self.enabled = enabled
+
+    def entry_dir(self, stage: str, key: str) -> Path:
+        return self.root / stage / key
+
+    def lookup(self, stage: str, key: str) -> Optional[Dict[str, Dict[str, str]]]:
+        """Return ``{output: {"hash", "format"}}`` recorded for ``key`` or None on a miss."""
+        if not self.enabled:
+            return None
+        entry = self.entry_dir(stage, key)
+        manifest_path = entry / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        # Refresh the entry's mtime so pruning keeps recently used keys
+        os.utime(entry)
+        return manifest["outputs"]
+
+    def load(
+        self,
+        stage: str,
+        key: str,
+        output: str,
+        fmt: str,
+        columns: Optional[Sequence[str]] = None,
+    ) -> Any:
+        return load_artifact(self.entry_dir(stage, key), output, fmt, columns)
+
+    def store(self, stage: str, key: str, outputs: Dict[str, Any]) -> Dict[str, str]:
+        output_hashes = {name: content_hash(value) for name, value in outputs.items()}
+        if not self.enabled:
+            return output_hashes
+
+        entry = self.entry_dir(stage, key)
+        tmp = entry.with_name(entry.name + ".tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        manifest_outputs = {}
+        for name, value in outputs.items():
+            fmt = save_artifact(tmp, name, value)
+            manifest_outputs[name] = {"hash": output_hashes[name], "format": fmt}
+        with open(tmp / "manifest.json", "w", encoding="utf-8") as fh:
+            json.dump({"stage": stage, "key": key, "outputs": manifest_outputs}, fh, indent=2)
+        if entry.exists():
+            shutil.rmtree(entry)
+        tmp.rename(entry)
+        self.prune(stage)
+        return output_hashes
+
+    def prune(self, stage: str, keep: int = CACHE_ENTRIES_PER_STAGE) -> None:
+        stage_dir = self.root / stage
+        entries = sorted(
+            (p for p in stage_dir.iterdir() if p.is_dir() and not p.name.endswith(".tmp")),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        for stale in entries[keep:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Pipeline runner
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ArtifactRef:
+    """Stage output that is only materialized (and projected) when consumed.
+
+    ``loader(columns)`` reads the artifact from the cache; a full read is
+    memoized, projected reads are not so each consumer gets only its columns.
+    """
+
+    hash: str
+    loader: Callable[[Optional[Sequence[str]]], Any]
+    _value: Any = field(default=None, repr=False)
+    _loaded: bool = field(default=False, repr=False)
+
+    def get(self, columns: Optional[Sequence[str]] = None) -> Any:
+        if self._loaded:
+            return project(self._value, columns)
+        if columns is not None:
+            return self.loader(columns)
+        self._value = self.loader(None)
+        self._loaded = True
+        return self._value
+
+    @classmethod
+    def resolved(cls, value_hash: str, value: Any) -> "ArtifactRef":
+        return cls(hash=value_hash, loader=lambda columns: project(value, columns), _value=value, _loaded=True)
+
+
+@dataclass
+class StageResult:
+    name: str
+    key: str
+    cached: bool
+    seconds: float
+    metrics: Optional[StageMetrics] = None
+    profile: Optional[pstats.Stats] = None
+
+
+class Pipeline:
+    def __init__(self) -> None:
+        self.stages: Dict[str, Stage] = {}
+        self.producers: Dict[str, str] = {}
+
+    def stage(
+        self,
+        name: str,
+        *,
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+        params: Sequence[str] = (),
+        files: Sequence[str] = (),
+        columns: Optional[Dict[str, Union[Sequence[str], ColumnSpec]]] = None,
+        fingerprint: Optional[Fingerprint] = None,
+        workers: Optional[str] = None,
+        version: int = 1,
+        cached: bool = True,
+    ) -> Callable[[StageFunc], StageFunc]:
+        """Register the decorated function as a pipeline stage.
+
+        Stages must be registered in execution order; every input has to be an
+        output of a previously registered stage. ``columns`` optionally limits
+        a table input to the listed columns (read via Parquet projection), or
+        to the columns a callable derives from the config. ``workers`` names the
+        config field with the stage's process-pool size, which the runtime plan
+        splits the CPU budget by. ``cached=False`` stages always run (e.g. when they keep their own
+        finer-grained cache); their outputs are still content-hashed.
+        """
+
+        def decorator(func: StageFunc) -> StageFunc:
+            if name in self.stages:
+                raise ValueError(f"Stage '{name}' is already registered")
+            for artifact in inputs:
+                if artifact not in self.producers:
+                    raise ValueError(f"Stage '{name}' consumes unknown artifact '{artifact}'")
+            for artifact in columns or {}:
+                if artifact not in inputs:
+                    raise ValueError(f"Stage '{name}' projects '{artifact}', which is not an input")
+            for artifact in outputs:
+                if artifact in self.producers:
+                    raise ValueError(
+                        f"Artifact '{artifact}' is already produced by '{self.producers[artifact]}'"
+                    )
+                self.producers[artifact] = name
+            self.stages[name] = Stage(
+                name=name,
+                func=func,
+                inputs=tuple(inputs),
+                outputs=tuple(outputs),
+                params=tuple(params),
+                files=tuple(files),
+                columns={
+                    artifact: cols if callable(cols) else tuple(cols) for artifact, cols in (columns or {}).items()
+                },
+                fingerprint=fingerprint,
+                workers=workers,
+                version=version,
+                cached=cached,
+                description=(inspect.getdoc(func) or "").split("\n")[0],
+            )
+            return func
+
+        return decorator
+
+    @property
+    def order(self) -> List[str]:
+        return list(self.stages)
+
+    def upstream(self, name: str) -> List[str]:
+        """All stages ``name`` transitively depends on, in execution order."""
+        needed = set()
+        frontier = [name]
+        while frontier:
+            stage = self.stages[frontier.pop()]
+            for artifact in stage.inputs:
+                producer = self.producers[artifact]
+                if producer not in needed:
+                    needed.add(producer)
+                    frontier.append(producer)
+        return [s for s in self.order if s in needed]
+
+    def select(
+        self,
+        only: Optional[Iterable[str]] = None,
+        start: Optional[str] = None,
+        until: Optional[str] = None,
+        exclude: Iterable[str] = (),
+    ) -> List[str]:
+        exclude = set(exclude)
+        for name in [*(only or []), *exclude, start, until]:
+            if name is not None and name not in self.stages:
+                raise KeyError(f"Unknown stage '{name}'. Known stages: {', '.join(self.order)}")
+        if only:
+            wanted = set(only) - exclude
+            return [s for s in self.order if s in wanted]
+        begin = self.order.index(start) if start else 0
+        end = self.order.index(until) if until else len(self.order) - 1
+        if begin > end:
+            raise ValueError(f"--from stage '{start}' runs after --until stage '{until}'")
+        return [s for s in self.order[begin : end + 1] if s not in exclude]
+
+    def run(
+        self,
+        config: PipelineConfig,
+        *,
+        only: Optional[Iterable[str]] = None,
+        start: Optional[str] = None,
+        until: Optional[str] = None,
+        exclude: Iterable[str] = (),
+        force: bool = False,
+        use_cache: bool = True,
+        profile: bool = False,
+    ) -> List[StageResult]:
+        """Execute the selected stages, resolving upstream artifacts from cache.
+
+        Stages outside the selection are never forced; they are loaded from
+        cache and only recomputed when their cache entry is missing. Stages in
+        ``exclude`` are dropped from the selection (``--no-plots``). Executed
+        stages are measured with :class:`StageMonitor`; ``profile`` also runs
+        them under cProfile and attaches the statistics to their result.
+        """
+        selected = self.select(only=only, start=start, until=until, exclude=exclude)
+        required = set(selected)
+        for name in selected:
+            required.update(self.upstream(name))
+
+        cache = ArtifactCache(config.cache_dir, enabled=use_cache)
+        artifacts: Dict[str, ArtifactRef] = {}
+        results: List[StageResult] = []
+
+        for name in self.order:
+            if name not in required:
+                continue
+            stage = self.stages[name]
+            input_hashes = {artifact: artifacts[artifact].hash for artifact in stage.inputs}
+            key = stage.cache_key(config, input_hashes)
+
+            cached_outputs = None
+            if stage.cached and not (force and name in selected):
+                cached_outputs = cache.lookup(name, key)
+                if cached_outputs is not None and not all(
+                    path.exists() for path in stage.published_paths(config)
+                ):
+                    cached_outputs = None
+
+            started = time.perf_counter()
+            if cached_outputs is not None:
+                for output in stage.outputs:
+                    recorded = cached_outputs[output]
+                    artifacts[output] = ArtifactRef(
+                        hash=recorded["hash"],
+                        loader=lambda columns, n=name, k=key, o=output, f=recorded["format"]: cache.load(
+                            n, k, o, f, columns
+                        ),
+                    )
+                results.append(StageResult(name, key, True, time.perf_counter() - started))
+                print(f"[{name}] cached ({key[:12]})")
+                continue
+
+            plan = stage_plan(config, stage.workers)
+            print(f"[{name}] running ({plan.mode}, {plan.processes} process(es) x {plan.threads} thread(s))")
+            stats = None
+            with StageMonitor() as monitor, apply_plan(plan):
+                kwargs = {
+                    artifact: artifacts[artifact].get(stage.input_columns(config, artifact))
+                    for artifact in stage.inputs
+                }
+                if profile:
+                    profiler = cProfile.Profile()
+                    produced = profiler.runcall(stage.func, config, **kwargs) or {}
+                    stats = pstats.Stats(profiler)
+                else:
+                    produced = stage.func(config, **kwargs) or {}
+                missing = [o for o in stage.outputs if o not in produced]
+                if missing:
+                    raise RuntimeError(f"Stage '{name}' did not produce {', '.join(missing)}")
+                outputs = {o: produced[o] for o in stage.outputs}
+                if stage.cached:
+                    output_hashes = cache.store(name, key, outputs)
+                else:
+                    output_hashes = {o: content_hash(value) for o, value in outputs.items()}
+            monitor.metrics.processes = plan.processes
+            monitor.metrics.threads = plan.threads
+            monitor.metrics.rows_in = total_rows(list(kwargs.values()))
+            monitor.metrics.rows_out = total_rows(list(outputs.values()))
+            for output, value in outputs.items():
+                artifacts[output] = ArtifactRef.resolved(output_hashes[output], value)
+            elapsed = time.perf_counter() - started
+            results.append(StageResult(name, key, False, elapsed, metrics=monitor.metrics, profile=stats))
+            print(
+                f"[{name}] done in {elapsed:.1f}s "
+                f"(cpu {monitor.metrics.cpu_seconds:.1f}s, peak rss {monitor.metrics.peak_rss_mb} MB)"
+            )
+
+        return results
@@ -0,0 +1,137 @@
+"""Compact in-memory representation of the combined table.
+
+The published combined CSV/Parquet keep every column at full precision. The
+``combined`` artifact handed to later stages is the *core* frame instead: the
+free-text columns no stage reads after the combined write are dropped (they
+stay available out-of-core in the published Parquet file), and count columns
+are stored as float32 when that is lossless (integer counts below 2**24 keep
+their exact values and NaN stays the missing marker). Low-cardinality text
+fields are already categorical through the schema. :func:`footprint` measures
+both representations for the run report.
+
+With ``--stream`` the combined table never sits in memory: :func:`write_core_table`
+writes the same core projection from the published Parquet file batch by
+batch, and :func:`table_footprint` measures both files one column at a time.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import NUMERIC_OPTIONAL, REG_COLS, SERVICE_COLS
+from .store import ParquetTable
+
+
+# Free text only needed in the published combined table
+TEXT_COLS = ["description", "activities_list", "nurse_availability_list", "special_programs_list"]
+
+# Integer-valued columns that fit float32 exactly (fine_amount and coordinates stay float64)
+COUNT_COLS = [
+    col
+    for col in dict.fromkeys(REG_COLS + SERVICE_COLS + NUMERIC_OPTIONAL)
+    if col not in ("fine_amount", "latitude", "longitude")
+]
+
+
+def _fits_float32(series: pd.Series) -> bool:
+    values = series.to_numpy(dtype=np.float64)
+    return bool(np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True))
+
+
+def core_frame(combined: pd.DataFrame) -> pd.DataFrame:
+    """The combined table without free text and with float32 counts where lossless."""
+    core = combined.drop(columns=[col for col in TEXT_COLS if col in combined.columns])
+    downcast = {
+        col: "float32"
+        for col in COUNT_COLS
+        if col in core.columns and core[col].dtype == np.float64 and _fits_float32(core[col])
+    }
+    return core.astype(downcast) if downcast else core
+
+
+def write_core_table(full: ParquetTable, path: Path, batch_rows: int) -> ParquetTable:
+    """:func:`core_frame` of a published Parquet table, written to ``path`` one batch at a time."""
+    source = pq.ParquetFile(full.path)
+    schema = source.schema_arrow
+    columns = [col for col in schema.names if col not in TEXT_COLS]
+    counts = [col for col in COUNT_COLS if col in columns and schema.field(col).type == pa.float64()]
+
+    # A count column is downcast only when every batch of it fits float32 exactly
+    fits = dict.fromkeys(counts, True)
+    if counts:
+        for batch in source.iter_batches(batch_size=batch_rows, columns=counts):
+            chunk = batch.to_pandas()
+            for col in counts:
+                fits[col] = fits[col] and _fits_float32(chunk[col])
+    # The pandas metadata keeps nullable booleans and categoricals loading as they do from the full table
+    core_schema = pa.schema(
+        [pa.field(col, pa.float32()) if fits.get(col) else schema.field(col) for col in columns],
+        metadata=schema.metadata,
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with pq.ParquetWriter(tmp, core_schema) as writer:
+        for batch in source.iter_batches(batch_size=batch_rows, columns=columns):
+            writer.write_table(pa.Table.from_batches([batch]).cast(core_schema))
+    os.replace(tmp, path)
+    return ParquetTable(path)
+
+
+# Per column: dtype, deep bytes, and deep bytes as object (categorical columns only)
+ColumnSize = Tuple[str, int, int]
+
+
+def _size(series: pd.Series) -> ColumnSize:
+    as_object = 0
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        as_object = int(series.astype(object).memory_usage(index=False, deep=True))
+    return str(series.dtype), int(series.memory_usage(index=False, deep=True)), as_object
+
+
+def _mb(sizes: Dict[str, ColumnSize], columns: List[str]) -> float:
+    return round(float(sum(sizes[col][1] for col in columns)) / 1024**2, 3)
+
+
+def _footprint(rows: int, full: Dict[str, ColumnSize], core: Dict[str, ColumnSize]) -> Dict[str, Any]:
+    dropped = [col for col in full if col not in core]
+    downcast = [col for col in core if core[col][0] != full[col][0]]
+    categorical = [col for col in core if core[col][0] == "category"]
+    return {
+        "rows": rows,
+        "full_mb": _mb(full, list(full)),
+        "core_mb": _mb(core, list(core)),
+        "dropped_text_mb": _mb(full, dropped),
+        "dropped_columns": dropped,
+        "float32_columns": downcast,
+        "float32_saved_mb": round(_mb(full, downcast) - _mb(core, downcast), 3),
+        "categorical_columns": categorical,
+        "categorical_mb": _mb(core, categorical),
+        "categorical_as_object_mb": round(float(sum(core[col][2] for col in categorical)) / 1024**2, 3),
+    }
+
+
+def footprint(full: pd.DataFrame, core: pd.DataFrame) -> Dict[str, Any]:
+    """Deep memory use of the full and core combined frames, split by what changed."""
+    return _footprint(
+        int(len(full)),
+        {col: _size(full[col]) for col in full.columns},
+        {col: _size(core[col]) for col in core.columns},
+    )
+
+
+def table_footprint(full: ParquetTable, core: ParquetTable) -> Dict[str, Any]:
+    """:func:`footprint` of two Parquet tables as they would load, reading one column at a time."""
+
+    def sizes(table: ParquetTable) -> Dict[str, ColumnSize]:
+        names = pq.ParquetFile(table.path).schema_arrow.names
+        return {col: _size(table.read([col])[col]) for col in names}
+
+    return _footprint(pq.ParquetFile(full.path).metadata.num_rows, sizes(full), sizes(core))
@@ -0,0 +1,253 @@
+"""Leave-one-state-out holdout: score each state as if it were being onboarded.
+
+For every held-out state a fold refits, on the remaining states only,
+everything the batch run learns from the cohort:
+
+* the feature means/stds and the UMAP embedding; the held-out facilities are
+  then placed with ``transform``, as a new state's facilities would be;
+* the k-NN imputation index (the remaining states' fully observed
+  facilities are the only donors);
+* the percentile references: every component column, plus ``composite_raw``
+  recomputed with the score stage's math over the remaining states.
+
+The held-out facilities are scored against that reference with
+:class:`~.online.OnlineScorer` and compared with their in-sample scores:
+Spearman rank correlation of the percentiles, mean / mean absolute / p95
+absolute percentile shift, composite shift and service-confidence shift.
+Columns that only the held-out state reports (FL's regulatory counts today)
+have no reference and are scored as unreported, as they would be for a new
+state. ``licensure_score`` depends only on a facility's own license, so
+folds reuse the in-sample values.
+
+Folds run in a process pool. The feature matrix, licensure scores and state
+codes are copied once into shared memory (:class:`~.bootstrap.SharedArrays`)
+and every worker maps them read-only; a fold's result is only its held-out
+rows.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+from umap import UMAP
+
+from .bootstrap import SharedArrays, attach_arrays
+from .config import FEATURE_COLS, REG_COLS, SERVICE_COLS
+from .imputation import impute_services
+from .online import (
+    CAPACITY_COL,
+    COMPOSITE_COL,
+    KEY_COLS,
+    SERVICE_PREFIX,
+    OnlineScorer,
+    ScoringReference,
+    sorted_distribution,
+)
+from .umap_model import frozen_zscores
+from .utils import composite_scores, percentile_scores, reg_component, service_component
+
+
+SCORE_COLS = ["sunsetwell_percentile", "composite_raw", "service_confidence"]
+HOLDOUT_TABLE_COLS = [
+    "state",
+    "state_license_number",
+    "facility_name",
+    *SCORE_COLS,
+    *[f"holdout_{col}" for col in SCORE_COLS],
+    "percentile_shift",
+]
+
+
+@dataclass(frozen=True)
+class FoldSettings:
+    """What every fold needs besides the shared arrays."""
+
+    umap_params: Dict[str, Any]
+    knn_neighbors: int
+    chunk_size: int
+    base_weights: Dict[str, float]
+    run_date: str
+    threads: int = 1
+
+
+def fold_arrays(features: pd.DataFrame, licensure: pd.Series, state_codes: np.ndarray) -> Dict[str, np.ndarray]:
+    """The read-only inputs shared by every fold."""
+    return {
+        "features": features[FEATURE_COLS].to_numpy(dtype=float, copy=True),
+        "licensure": licensure.to_numpy(dtype=float, copy=True),
+        "state": np.ascontiguousarray(state_codes, dtype=np.intp),
+    }
+
+
+def _fit_stats(values: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+    return {col: {"mean": float(values[col].mean()), "std": float(values[col].std())} for col in FEATURE_COLS}
+
+
+def _batch_composite(
+    values: pd.DataFrame,
+    services: np.ndarray,
+    confidence: np.ndarray,
+    licensure: np.ndarray,
+    weights: Mapping[str, float],
+) -> pd.Series:
+    """``composite_raw`` exactly as the score stage computes it over ``values``' rows."""
+    reg_available = values[REG_COLS].notna().any(axis=1)
+    component_matrix = pd.DataFrame(
+        {
+            "reg_score": reg_component(values[REG_COLS].rank(pct=True), reg_available),
+            "service_score": service_component(pd.DataFrame(services, columns=SERVICE_COLS).rank(pct=True)),
+            "capacity_score": percentile_scores(values[CAPACITY_COL]).fillna(0.5),
+            "licensure_score": licensure,
+        }
+    )
+    _, composite_raw = composite_scores(component_matrix, reg_available, pd.Series(confidence), weights)
+    return composite_raw
+
+
+def score_fold(arrays: Mapping[str, np.ndarray], code: int, settings: FoldSettings) -> Dict[str, Any]:
+    """Refit without state ``code`` and score its facilities against the refit."""
+    started = time.perf_counter()
+    held = arrays["state"] == code
+    values = pd.DataFrame(arrays["features"], columns=FEATURE_COLS)
+    train, test = values.loc[~held].reset_index(drop=True), values.loc[held].reset_index(drop=True)
+
+    # Embedding: scaler and UMAP from the remaining states, held-out rows transformed into it
+    stats = _fit_stats(train)
+    reducer = UMAP(**settings.umap_params, n_jobs=settings.threads)
+    train_coords = reducer.fit_transform(frozen_zscores(train, stats))
+    test_coords = reducer.transform(frozen_zscores(test, stats))
+
+    # Imputation and percentile references from the remaining states
+    train_services, train_confidence, observed = impute_services(
+        train_coords,
+        train[SERVICE_COLS].to_numpy(dtype=float),
+        n_neighbors=settings.knn_neighbors,
+        chunk_size=settings.chunk_size,
+    )
+    train_composite = _batch_composite(
+        train, train_services, train_confidence, arrays["licensure"][~held], settings.base_weights
+    )
+    distributions = {col: sorted_distribution(train[col]) for col in [*REG_COLS, CAPACITY_COL]}
+    for position, col in enumerate(SERVICE_COLS):
+        distributions[SERVICE_PREFIX + col] = sorted_distribution(pd.Series(train_services[:, position]))
+    distributions[COMPOSITE_COL] = sorted_distribution(train_composite)
+    reference = ScoringReference(
+        distributions=distributions,
+        index_coords=train_coords[observed],
+        index_values=train.loc[observed, SERVICE_COLS].to_numpy(dtype=float),
+        embedding=pd.DataFrame(columns=[*KEY_COLS, "umap_x", "umap_y"]),
+        manifest={
+            "run_date": settings.run_date,
+            "base_weights": dict(settings.base_weights),
+            "knn_neighbors": settings.knn_neighbors,
+        },
+    )
+
+    # A column no remaining state reports has nothing to rank against: score it as unreported
+    unreferenced = [col for col in [*REG_COLS, CAPACITY_COL] if len(distributions[col]) == 0]
+    facilities = test.assign(
+        state="",
+        state_license_number="",
+        umap_x=test_coords[:, 0],
+        umap_y=test_coords[:, 1],
+        **{col: np.nan for col in unreferenced},
+    )
+    scored = OnlineScorer(reference).score(facilities, licensure_score=pd.Series(arrays["licensure"][held]))
+    return {
+        "code": code,
+        "rows": np.flatnonzero(held),
+        "train_facilities": int((~held).sum()),
+        "unreferenced_columns": len(unreferenced),
+        "fit_seconds": time.perf_counter() - started,
+        **{col: scored[col].to_numpy(dtype=float) for col in SCORE_COLS},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Worker pool
+# ---------------------------------------------------------------------------
+
+
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(spec: Mapping[str, Any], settings: FoldSettings) -> None:
+    arrays, segments = attach_arrays(spec)
+    for array in arrays.values():
+        array.flags.writeable = False
+    _WORKER.update(arrays=arrays, segments=segments, settings=settings)
+
+
+def _run_fold(code: int) -> Dict[str, Any]:
+    return score_fold(_WORKER["arrays"], code, _WORKER["settings"])
+
+
+def run_folds(
+    arrays: Mapping[str, np.ndarray],
+    codes: Sequence[int],
+    settings: FoldSettings,
+    workers: int = 1,
+) -> List[Dict[str, Any]]:
+    """One :func:`score_fold` result per code, in ``codes`` order."""
+    workers = max(1, min(workers, len(codes)))
+    if workers == 1:
+        return [score_fold(arrays, code, settings) for code in codes]
+
+    shared = SharedArrays(arrays)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(shared.spec, settings)
+        ) as pool:
+            return list(pool.map(_run_fold, codes))
+    finally:
+        shared.close()
+
+
+# ---------------------------------------------------------------------------
+# Comparison with the in-sample run
+# ---------------------------------------------------------------------------
+
+
+def fold_table(scores: pd.DataFrame, fold: Mapping[str, Any]) -> pd.DataFrame:
+    """In-sample and held-out scores side by side, one row per held-out facility."""
+    table = scores.iloc[fold["rows"]][["state", "state_license_number", "facility_name", *SCORE_COLS]]
+    table = table.reset_index(drop=True)
+    for col in SCORE_COLS:
+        table[f"holdout_{col}"] = fold[col]
+    table["percentile_shift"] = table["holdout_sunsetwell_percentile"] - table["sunsetwell_percentile"]
+    return table
+
+
+def _rank_correlation(a: pd.Series, b: pd.Series) -> float:
+    if len(a) < 2 or np.ptp(a.to_numpy()) == 0 or np.ptp(b.to_numpy()) == 0:
+        return float("nan")
+    return float(spearmanr(a, b).statistic)
+
+
+def compare_fold(table: pd.DataFrame, fold: Mapping[str, Any]) -> Dict[str, Any]:
+    """Agreement between one state's held-out and in-sample scores."""
+    shift = table["percentile_shift"]
+    composite_shift = table["holdout_composite_raw"] - table["composite_raw"]
+    confidence_shift = table["holdout_service_confidence"] - table["service_confidence"]
+    return {
+        "facilities": int(len(table)),
+        "train_facilities": fold["train_facilities"],
+        "unreferenced_columns": fold["unreferenced_columns"],
+        "spearman": _rank_correlation(table["sunsetwell_percentile"], table["holdout_sunsetwell_percentile"]),
+        "mean_percentile": float(table["sunsetwell_percentile"].mean()),
+        "holdout_mean_percentile": float(table["holdout_sunsetwell_percentile"].mean()),
+        "mean_shift": float(shift.mean()),
+        "mean_abs_shift": float(shift.abs().mean()),
+        "p95_abs_shift": float(shift.abs().quantile(0.95)),
+        "composite_mean_shift": float(composite_shift.mean()),
+        "mean_confidence": float(table["service_confidence"].mean()),
+        "holdout_mean_confidence": float(table["holdout_service_confidence"].mean()),
+        "confidence_shift": float(confidence_shift.mean()),
+        "fit_seconds": round(float(fold["fit_seconds"]), 3),
+    }
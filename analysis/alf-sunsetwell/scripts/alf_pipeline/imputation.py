@@ -0,0 +1,169 @@
+"""Batched k-NN service imputation over the UMAP embedding.
+
+Facilities missing any ``SERVICE_COLS`` value take the inverse-distance
+weighted mean of their nearest fully observed neighbors. All unobserved rows
+are queried in chunks of ``chunk_size`` so memory stays bounded at roughly
+``chunk_size * n_neighbors`` distances, while the weighting and confidence
+math runs as array operations instead of one sklearn call per facility.
+Neighbors come from a :class:`~.neighbors.NeighborIndex`: either one built
+over the donors here, or the run's shared index restricted to donor rows.
+The neighbor sets can be kept as :class:`ImputationNeighbors` so the score
+bootstrap can resample them without querying the index again.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .neighbors import DEFAULT_CHUNK_SIZE, KDTreeIndex, NeighborIndex
+from .utils import service_confidence_from_distances
+
+
+@dataclass
+class ImputationNeighbors:
+    """Neighbor sets behind each imputed row.
+
+    ``rows`` are the imputed facilities, ``observed`` marks which of their
+    service cells were reported, ``distances``/``indices`` are their
+    (rows × k) neighbors, and ``indices`` point into ``values`` (service
+    values per index row).
+    """
+
+    rows: np.ndarray
+    observed: np.ndarray
+    distances: np.ndarray
+    indices: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def empty(cls, n_services: int) -> "ImputationNeighbors":
+        return cls(
+            rows=np.empty(0, dtype=np.int64),
+            observed=np.empty((0, n_services), dtype=bool),
+            distances=np.empty((0, 0)),
+            indices=np.empty((0, 0), dtype=np.int64),
+            values=np.empty((0, n_services)),
+        )
+
+
+def weighted_services(distances: np.ndarray, neighbor_vals: np.ndarray) -> np.ndarray:
+    """Inverse-distance weighted mean of (rows × k × services) neighbor values."""
+    weights = 1.0 / (distances + 1e-6)
+    weights_sum = weights.sum(axis=1)
+    weighted = np.matmul(weights[:, np.newaxis, :], neighbor_vals)[:, 0, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            weights_sum[:, np.newaxis] == 0,
+            neighbor_vals.mean(axis=1),
+            weighted / weights_sum[:, np.newaxis],
+        )
+
+
+class KnnServiceImputer:
+    def __init__(self, n_neighbors: int = 25, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self.n_neighbors = n_neighbors
+        self.chunk_size = max(1, chunk_size)
+        self.index: Optional[NeighborIndex] = None
+        self.donors: Optional[np.ndarray] = None
+        self.values: Optional[np.ndarray] = None
+        self.neigh_count = 0
+
+    def fit(self, coords: np.ndarray, values: np.ndarray) -> "KnnServiceImputer":
+        """Index the embedding coordinates of facilities with observed services."""
+        return self.use_index(KDTreeIndex().build(coords), values, donors=None)
+
+    def use_index(
+        self,
+        index: NeighborIndex,
+        values: np.ndarray,
+        donors: Optional[np.ndarray] = None,
+    ) -> "KnnServiceImputer":
+        """Impute from an existing index; ``values`` align with its rows, ``donors`` masks eligible ones."""
+        self.index = index
+        self.values = values
+        self.donors = donors
+        available = len(values) if donors is None else int(donors.sum())
+        self.neigh_count = min(self.n_neighbors, available)
+        return self
+
+    def kneighbors(self, coords: np.ndarray) -> Iterator[Tuple[slice, np.ndarray, np.ndarray]]:
+        """Yield ``(rows, distances, indices)`` for ``coords`` one chunk at a time."""
+        if self.neigh_count < 1:
+            raise RuntimeError("KnnServiceImputer has no observed facilities to draw neighbors from")
+        for start in range(0, len(coords), self.chunk_size):
+            rows = slice(start, min(start + self.chunk_size, len(coords)))
+            distances, indices = self.index.query(coords[rows], self.neigh_count, mask=self.donors)
+            yield rows, distances, indices
+
+    def predict(
+        self,
+        coords: np.ndarray,
+        neighbors: Optional[ImputationNeighbors] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return imputed service values and confidences for each row of ``coords``.
+
+        With ``neighbors`` the (rows × k) distances and indices are also
+        stored on it, alongside the imputer's value table.
+        """
+        predicted = np.empty((len(coords), self.values.shape[1]), dtype=float)
+        confidence = np.empty(len(coords), dtype=float)
+        if neighbors is not None:
+            neighbors.distances = np.empty((len(coords), self.neigh_count), dtype=float)
+            neighbors.indices = np.empty((len(coords), self.neigh_count), dtype=np.int64)
+            neighbors.values = self.values
+        for rows, distances, indices in self.kneighbors(coords):
+            predicted[rows] = weighted_services(distances, self.values[indices])
+            confidence[rows] = service_confidence_from_distances(distances)
+            if neighbors is not None:
+                neighbors.distances[rows] = distances
+                neighbors.indices[rows] = indices
+        return predicted, confidence
+
+
+def impute_services(
+    coords: np.ndarray,
+    service_array: np.ndarray,
+    n_neighbors: int = 25,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    index: Optional[NeighborIndex] = None,
+    index_rows: Optional[np.ndarray] = None,
+    neighbors: Optional[ImputationNeighbors] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fill facilities with incomplete services from their embedding neighbors.
+
+    With ``index`` (and ``index_rows``, the index row of each facility) the
+    shared neighbor index is queried with observed facilities as the only
+    eligible neighbors; otherwise an exact index over them is built here.
+
+    Returns ``(imputed, confidence, observed_mask)``: observed rows keep their
+    values with confidence 1.0; when nothing is observed, rows pass through
+    unchanged with confidence 0.0. Pass an empty ``neighbors`` to also
+    collect the neighbor sets of the imputed rows.
+    """
+    observed_mask = ~np.isnan(service_array).any(axis=1)
+    imputed = np.array(service_array, dtype=float, copy=True)
+    confidence = np.where(observed_mask, 1.0, 0.0)
+
+    imputer = KnnServiceImputer(n_neighbors=n_neighbors, chunk_size=chunk_size)
+    if index is not None:
+        rows = np.arange(len(coords)) if index_rows is None else index_rows
+        values = np.full((len(index), imputed.shape[1]), np.nan)
+        values[rows] = imputed
+        donors = np.zeros(len(index), dtype=bool)
+        donors[rows] = observed_mask
+        imputer.use_index(index, values, donors=donors)
+    else:
+        imputer.fit(coords[observed_mask], imputed[observed_mask])
+    missing_rows = np.flatnonzero(~observed_mask)
+    if imputer.neigh_count >= 1 and len(missing_rows):
+        predicted, missing_confidence = imputer.predict(coords[missing_rows], neighbors)
+        imputed[missing_rows] = predicted
+        confidence[missing_rows] = missing_confidence
+        if neighbors is not None:
+            neighbors.rows = missing_rows
+            neighbors.observed = ~np.isnan(service_array[missing_rows])
+
+    return imputed, confidence, observed_mask
@@ -0,0 +1,210 @@
+"""Parallel state ingestion with a per-state normalized-frame cache.
+
+Each state's latest ``alf-processed_*.csv`` is parsed and normalized (column
+lowercasing, NA sentinels, numeric coercion, license dates parsed with the
+state's detected format) into a Parquet file under
+``<cache_dir>/states/<code>/``. A state is only re-parsed when its source file
+changed: the recorded size and mtime are checked first, and the SHA-256 is
+only recomputed when those differ. States that need parsing are normalized in
+a process pool; workers write their Parquet output directly so frames never
+cross process boundaries. With ``stream_chunk_rows`` set, workers parse and
+write their state in blocks of that many rows instead of all at once; the date
+formats detected in the first block are reused for the rest of the file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import PipelineConfig
+from .dag import file_digest
+from .licensure import detect_date_format, normalize_dates, parse_dates
+from .runtime import worker_count
+from .schema import COMBINED_SCHEMA, coerce_numeric
+from .utils import iter_state_chunks, latest_state_file, load_state_frame, normalize_state_chunk
+
+
+StateManifest = Dict[str, Dict[str, Any]]
+
+
+def normalizer_version() -> str:
+    """Changes whenever the per-state normalization code or schema changes."""
+    source = "".join(
+        inspect.getsource(func) for func in (
+            load_state_frame,
+            normalize_state_chunk,
+            coerce_numeric,
+            detect_date_format,
+            parse_dates,
+            normalize_dates,
+        )
+    )
+    payload = source + json.dumps(COMBINED_SCHEMA, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class StateSource:
+    code: str
+    state: str
+    path: Path
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def discover(cls, config: PipelineConfig) -> List["StateSource"]:
+        sources = []
+        for code, state in config.state_codes.items():
+            path = latest_state_file(config.state_data_dir, code)
+            stat = path.stat()
+            sources.append(cls(code, state, path, stat.st_size, stat.st_mtime_ns))
+        return sources
+
+
+def _normalize_state(state: str, source_path: str, target_path: str, chunk_rows: int = 0) -> Dict[str, Any]:
+    """Process-pool worker: parse one state export and write it as Parquet."""
+    target = Path(target_path)
+    tmp = target.with_name(target.name + ".tmp")
+    if not chunk_rows:
+        frame = load_state_frame(Path(source_path), state).frame
+        dates = normalize_dates(frame)
+        frame.to_parquet(tmp, index=False)
+        os.replace(tmp, target)
+        return {"rows": int(len(frame)), "columns": list(frame.columns), "dates": dates}
+
+    rows, columns, dates, writer = 0, [], {}, None
+    try:
+        for chunk in iter_state_chunks(Path(source_path), state, chunk_rows):
+            # Detect once per file (a column that is empty so far is detected again next block)
+            chunk_dates = normalize_dates(chunk, {col: stats["format"] for col, stats in dates.items()})
+            for col, stats in chunk_dates.items():
+                total = dates.setdefault(col, {"format": None, "values": 0, "failed": 0})
+                total["format"] = total["format"] or stats["format"]
+                total["values"] += stats["values"]
+                total["failed"] += stats["failed"]
+            if writer is None:
+                columns = list(chunk.columns)
+                writer = pq.ParquetWriter(tmp, pa.Schema.from_pandas(chunk, preserve_index=False))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, target)
+    return {"rows": rows, "columns": columns, "dates": dates}
+
+
+class StateIngestCache:
+    def __init__(self, root: Path, enabled: bool = True) -> None:
+        self.root = root
+        self.enabled = enabled
+        self.version = normalizer_version()
+        self._digests: Dict[Path, str] = {}
+
+    def frame_path(self, source: StateSource) -> Path:
+        return self.root / source.code / "normalized.parquet"
+
+    def meta_path(self, source: StateSource) -> Path:
+        return self.root / source.code / "meta.json"
+
+    def read_meta(self, source: StateSource) -> Optional[Dict[str, Any]]:
+        meta_path = self.meta_path(source)
+        if not self.enabled or not meta_path.exists():
+            return None
+        with open(meta_path, encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def write_meta(self, source: StateSource, meta: Dict[str, Any]) -> None:
+        with open(self.meta_path(source), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, indent=2)
+
+    def digest(self, source: StateSource) -> str:
+        """SHA-256 of the source file, reusing the recorded hash when size and mtime match."""
+        if source.path in self._digests:
+            return self._digests[source.path]
+        meta = self.read_meta(source)
+        if (
+            meta is not None
+            and meta["source"] == str(source.path)
+            and meta["size"] == source.size
+            and meta["mtime_ns"] == source.mtime_ns
+        ):
+            digest = meta["sha256"]
+        else:
+            digest = file_digest(source.path)
+        self._digests[source.path] = digest
+        return digest
+
+    def lookup(self, source: StateSource) -> Optional[Dict[str, Any]]:
+        meta = self.read_meta(source)
+        if meta is None or meta.get("normalizer") != self.version:
+            return None
+        if not self.frame_path(source).exists() or meta["sha256"] != self.digest(source):
+            return None
+        if meta["size"] != source.size or meta["mtime_ns"] != source.mtime_ns or meta["source"] != str(source.path):
+            # Touched but unchanged content: refresh the stat so the next run skips hashing
+            meta.update(source=str(source.path), size=source.size, mtime_ns=source.mtime_ns)
+            self.write_meta(source, meta)
+        return meta
+
+
+def ingest_states(config: PipelineConfig) -> StateManifest:
+    """Normalize every state (in parallel, skipping unchanged files) and return the manifest."""
+    cache = StateIngestCache(config.cache_dir / "states", enabled=config.ingest_cache)
+    sources = StateSource.discover(config)
+
+    metas: Dict[str, Dict[str, Any]] = {}
+    pending: List[StateSource] = []
+    for source in sources:
+        meta = cache.lookup(source)
+        if meta is None:
+            pending.append(source)
+        else:
+            metas[source.code] = meta
+            print(f"Reused {meta['rows']:>5} rows for {source.state} from {source.path.name} (unchanged)")
+
+    for source in pending:
+        cache.frame_path(source).parent.mkdir(parents=True, exist_ok=True)
+
+    jobs = [(s.state, str(s.path), str(cache.frame_path(s)), config.stream_chunk_rows) for s in pending]
+    workers = min(worker_count(config, config.ingest_workers), len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_normalize_state, *zip(*jobs)))
+    else:
+        results = [_normalize_state(*job) for job in jobs]
+
+    for source, result in zip(pending, results):
+        meta = {
+            "source": str(source.path),
+            "size": source.size,
+            "mtime_ns": source.mtime_ns,
+            "sha256": cache.digest(source),
+            "normalizer": cache.version,
+            **result,
+        }
+        cache.write_meta(source, meta)
+        metas[source.code] = meta
+        print(f"Loaded {meta['rows']:>5} rows for {source.state} from {source.path.name}")
+
+    return {
+        source.state: {
+            "frame": str(cache.frame_path(source)),
+            "source": source.path.name,
+            "sha256": metas[source.code]["sha256"],
+            "rows": metas[source.code]["rows"],
+            "columns": metas[source.code]["columns"],
+            "dates": metas[source.code]["dates"],
+        }
+        for source in sources
+    }
@@ -0,0 +1,243 @@
+"""Per-stage wall/CPU time, peak memory, and row-count instrumentation.
+
+:class:`StageMonitor` wraps one stage execution: it records wall time, CPU
+time of this process and of finished worker processes, and samples resident
+memory on a background thread to get the stage's peak RSS. Stages can mark
+named sub-sections (``with section("fit"): ...``) that are timed the same way,
+and attach details such as memory footprints with :func:`note`.
+:func:`write_run_report` turns the pipeline results into ``run_report.json``
+next to ``generalization_report.json``; with ``--profile`` the heaviest
+executed stage's cProfile statistics are dumped alongside it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .config import PipelineConfig, utc_now
+from .runtime import runtime_summary
+from .store import ParquetTable
+
+try:
+    import psutil
+except ImportError:  # optional; /proc is read directly on Linux
+    psutil = None
+
+
+RSS_SAMPLE_SECONDS = 0.05
+PROFILE_TOP_N = 40
+
+
+# ---------------------------------------------------------------------------
+# Memory and CPU probes
+# ---------------------------------------------------------------------------
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where it cannot be read."""
+    if psutil is not None:
+        return int(psutil.Process().memory_info().rss)
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss_bytes(who: int = resource.RUSAGE_SELF) -> int:
+    """High-water RSS reported by getrusage (KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+def cpu_seconds() -> float:
+    """User + system CPU time of this process and its reaped worker processes."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def artifact_rows(value: Any) -> Optional[int]:
+    """Row count of a table-like artifact (None for scalars and mappings of stats)."""
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return int(len(value))
+    if isinstance(value, ParquetTable):
+        return int(pq.ParquetFile(value.path).metadata.num_rows)
+    if isinstance(value, dict) and value and all(isinstance(v, pd.DataFrame) for v in value.values()):
+        return int(sum(len(v) for v in value.values()))
+    return None
+
+
+def total_rows(values: Sequence[Any]) -> Optional[int]:
+    """Rows of the largest table among ``values`` (inputs share rows, so no summing)."""
+    counts = [rows for rows in (artifact_rows(value) for value in values) if rows is not None]
+    return max(counts) if counts else None
+
+
+# ---------------------------------------------------------------------------
+# Monitors
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class SectionMetrics:
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_mb: Optional[float]
+
+
+@dataclass
+class StageMetrics:
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    processes: Optional[int] = None
+    threads: Optional[int] = None
+    sections: List[SectionMetrics] = field(default_factory=list)
+    notes: Dict[str, Any] = field(default_factory=dict)
+
+
+class _RssSampler:
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS) -> None:
+        self.interval = interval
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def start(self) -> "_RssSampler":
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def stop(self) -> Optional[float]:
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+        self.sample()
+        return round(self.peak / 1024**2, 1) if self.peak is not None else None
+
+
+_active: List[StageMetrics] = []
+
+
+class StageMonitor:
+    """Context manager measuring one stage; ``metrics`` is filled on exit."""
+
+    def __init__(self) -> None:
+        self.metrics = StageMetrics()
+
+    def __enter__(self) -> "StageMonitor":
+        self._sampler = _RssSampler().start()
+        self._wall = time.perf_counter()
+        self._cpu = cpu_seconds()
+        _active.append(self.metrics)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        _active.remove(self.metrics)
+        self.metrics.wall_seconds = round(time.perf_counter() - self._wall, 3)
+        self.metrics.cpu_seconds = round(cpu_seconds() - self._cpu, 3)
+        self.metrics.peak_rss_mb = self._sampler.stop()
+
+
+@contextmanager
+def section(name: str) -> Iterator[None]:
+    """Time a named part of the running stage (no-op outside a monitored stage)."""
+    if not _active:
+        yield
+        return
+    sampler = _RssSampler().start()
+    wall, cpu = time.perf_counter(), cpu_seconds()
+    try:
+        yield
+    finally:
+        _active[-1].sections.append(
+            SectionMetrics(
+                name=name,
+                wall_seconds=round(time.perf_counter() - wall, 3),
+                cpu_seconds=round(cpu_seconds() - cpu, 3),
+                peak_rss_mb=sampler.stop(),
+            )
+        )
+
+
+def note(name: str, value: Any) -> None:
+    """Attach a JSON-compatible detail to the running stage's report entry."""
+    if _active:
+        _active[-1].notes[name] = value
+
+
+# ---------------------------------------------------------------------------
+# Run report
+# ---------------------------------------------------------------------------
+
+
+def dump_profile(config: PipelineConfig, stage: str, stats: pstats.Stats) -> Path:
+    """Write ``run_profile_<stage>.pstats`` plus a cumulative-time text summary."""
+    path = config.data_dir / f"run_profile_{stage}.pstats"
+    stats.dump_stats(str(path))
+    with open(path.with_suffix(".txt"), "w", encoding="utf-8") as fh:
+        pstats.Stats(str(path), stream=fh).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    return path
+
+
+def write_run_report(config: PipelineConfig, results: Sequence[Any], started_at: str) -> Path:
+    """Write ``run_report.json`` (and the heaviest stage's profile when one was collected)."""
+    executed = [result for result in results if not result.cached]
+    report: Dict[str, Any] = {
+        "run_date": config.run_day,
+        "started_at": started_at,
+        "finished_at": utc_now().isoformat(timespec="seconds"),
+        "wall_seconds": round(sum(result.seconds for result in results), 3),
+        "max_rss_mb": round(max_rss_bytes() / 1024**2, 1),
+        "max_worker_rss_mb": round(max_rss_bytes(resource.RUSAGE_CHILDREN) / 1024**2, 1),
+        "runtime": runtime_summary(config),
+        "stages": [
+            {
+                "name": result.name,
+                "cached": result.cached,
+                "key": result.key[:12],
+                **(asdict(result.metrics) if result.metrics else {"wall_seconds": round(result.seconds, 3)}),
+            }
+            for result in results
+        ],
+    }
+
+    profiled = [result for result in executed if result.profile is not None]
+    if profiled:
+        heaviest = max(profiled, key=lambda result: result.seconds)
+        profile_path = dump_profile(config, heaviest.name, heaviest.profile)
+        report["profile"] = {"stage": heaviest.name, "path": profile_path.name}
+
+    path = config.data_dir / "run_report.json"
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    return path
@@ -0,0 +1,251 @@
+"""Ranked state, county and metro leaderboards from the score table.
+
+Every scope is one grouped pass: rows are bucketed by group code with a
+single stable integer argsort, and each bucket's top and bottom ``n`` come
+from :func:`top_positions`, which uses ``np.partition`` to find the cut-off
+and only sorts the rows at or above it. Ties rank by row order, so boards
+are deterministic, bottom ranks agree with a full ranking, and no scope ever
+sorts the whole table. Group sizes,
+average scores and high-performer shares are ``np.bincount`` aggregates.
+
+Metros follow ``data/top-50-metros.json``: a facility belongs to a metro
+when its city is one of the principal cities in the metro title (or the
+metro's anchor city) and it is in the metro's state. Metro aggregates are
+written in the ``data/metros/<slug>.json`` shape the web app serves.
+
+Scores on the boards are SunsetWell percentiles on the app's 0-100 scale.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+SCOPES = ("state", "county", "metro")
+METRO_CITY_SEPARATORS = re.compile(r"[–—-]")
+METRO_CITY_STOPWORDS = {"THE", "COUNTY"}
+ENTRY_COLS = ["scope", "group", "state", "board", "rank", "row"]
+GROUP_COLS = ["scope", "group", "state", "count", "average_score", "high_performer_share"]
+
+
+def top_positions(values: np.ndarray, n: int, descending: bool = True) -> np.ndarray:
+    """Positions of the ``n`` highest values in rank order, or the ``n`` lowest read from the end.
+
+    Ties rank by row order, so the lowest ``n`` are exactly the tail of the
+    descending ranking, reversed. NaN never ranks.
+    """
+    positions = np.flatnonzero(~np.isnan(values))
+    key = -values[positions] if descending else values[positions]
+    if n < len(positions):
+        cutoff = np.partition(key, n - 1)[n - 1]
+        keep = key <= cutoff
+        positions, key = positions[keep], key[keep]
+    return positions[np.lexsort((positions if descending else -positions, key))[:n]]
+
+
+def grouped_boards(codes: np.ndarray, values: np.ndarray, n: int) -> pd.DataFrame:
+    """Top and bottom ``n`` rows of every group (codes < 0 belong to no group).
+
+    Returns ``code``, ``board`` ("top"/"bottom"), ``rank`` (1 = best within
+    the group's scored rows, so bottom entries carry their true rank) and
+    ``row`` (position in ``values``).
+    """
+    member = codes >= 0
+    order = np.flatnonzero(member)[np.argsort(codes[member], kind="stable")]
+    sizes = np.bincount(codes[member], minlength=int(codes.max(initial=-1)) + 1)
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+
+    parts: List[Tuple[np.ndarray, ...]] = []
+    for code in np.flatnonzero(sizes):
+        rows = order[bounds[code] : bounds[code + 1]]
+        group_values = values[rows]
+        scored = int(np.count_nonzero(~np.isnan(group_values)))
+        top = rows[top_positions(group_values, n)]
+        bottom = rows[top_positions(group_values, n, descending=False)]
+        parts.append((np.full(len(top), code), np.full(len(top), "top"), np.arange(1, len(top) + 1), top))
+        parts.append(
+            (np.full(len(bottom), code), np.full(len(bottom), "bottom"), scored - np.arange(len(bottom)), bottom)
+        )
+    if not parts:
+        return pd.DataFrame({"code": [], "board": [], "rank": [], "row": []})
+    code, board, rank, row = (np.concatenate(column) for column in zip(*parts))
+    return pd.DataFrame({"code": code, "board": board, "rank": rank, "row": row})
+
+
+def group_aggregates(codes: np.ndarray, scores: np.ndarray, threshold: float) -> Dict[str, np.ndarray]:
+    """Per-code facility count, mean score and share scoring at least ``threshold``."""
+    member = (codes >= 0) & ~np.isnan(scores)
+    length = int(codes.max(initial=-1)) + 1
+    count = np.bincount(codes[member], minlength=length)
+    total = np.bincount(codes[member], weights=scores[member], minlength=length)
+    high = np.bincount(codes[member], weights=scores[member] >= threshold, minlength=length)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "count": count,
+            "average_score": np.where(count > 0, total / np.maximum(count, 1), 0.0),
+            "high_performer_share": np.where(count > 0, high / np.maximum(count, 1), 0.0),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Metro membership
+# ---------------------------------------------------------------------------
+
+
+def metro_slug(name: str) -> str:
+    """File name the web app uses for a metro (``data/metros/<slug>.json``)."""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def load_metros(path: Path) -> List[Dict[str, str]]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def metro_lookup(metros: Sequence[Mapping[str, str]]) -> pd.DataFrame:
+    """``(city, state) -> metro slug``; a city named by two metros stays with the first."""
+    rows = []
+    for metro in metros:
+        cities = [part.strip() for part in METRO_CITY_SEPARATORS.split(metro["name"])]
+        for city in dict.fromkeys([*cities, metro["city"]]):
+            if city and city.upper() not in METRO_CITY_STOPWORDS:
+                rows.append((city.upper(), metro["state"], metro_slug(metro["name"])))
+    lookup = pd.DataFrame(rows, columns=["_city", "_state", "metro"])
+    return lookup.drop_duplicates(["_city", "_state"], keep="first")
+
+
+def assign_metros(city: pd.Series, state: pd.Series, metros: Sequence[Mapping[str, str]]) -> pd.Series:
+    """Metro slug per facility (NaN outside every listed metro)."""
+    keys = pd.DataFrame(
+        {
+            "_city": city.astype("string").str.strip().str.upper().to_numpy(),
+            "_state": state.astype("string").to_numpy(),
+        }
+    )
+    lookup = metro_lookup(metros)
+    if lookup.empty:
+        return pd.Series(np.nan, index=city.index, dtype=object)
+    lookup = lookup.astype({"_city": "string", "_state": "string"})
+    return pd.Series(keys.merge(lookup, on=["_city", "_state"], how="left")["metro"].to_numpy(), index=city.index)
+
+
+# ---------------------------------------------------------------------------
+# Boards and metro files
+# ---------------------------------------------------------------------------
+
+
+def build_leaderboards(
+    scores: pd.DataFrame,
+    groups: Mapping[str, Tuple[pd.Series, pd.Series]],
+    size: int,
+    high_performer_score: float,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """``(entries, aggregates)`` for every scope in ``groups``.
+
+    ``groups`` maps a scope to ``(group label, group state)`` per score row;
+    rows with a missing label are left out of that scope.
+    """
+    values = scores["sunsetwell_percentile"].to_numpy(dtype=float) * 100.0
+    entries, aggregates = [], []
+    for scope, (label, state) in groups.items():
+        keys = pd.DataFrame({"group": label.to_numpy(), "state": state.to_numpy()})
+        # Numbered in order of first appearance, matching drop_duplicates below; missing labels get -1
+        codes = keys.groupby(["group", "state"], sort=False).ngroup().fillna(-1).to_numpy(dtype=np.intp)
+        group_keys = keys.loc[codes >= 0].drop_duplicates().reset_index(drop=True)
+
+        boards = grouped_boards(codes, values, size)
+        boards = pd.concat(
+            [
+                pd.DataFrame({"scope": scope}, index=boards.index),
+                group_keys.iloc[boards["code"].to_numpy(dtype=np.intp)].reset_index(drop=True),
+                boards[["board", "rank", "row"]],
+            ],
+            axis=1,
+        )
+        entries.append(boards)
+
+        stats = group_aggregates(codes, values, high_performer_score)
+        present = np.flatnonzero(stats["count"])
+        aggregates.append(
+            pd.concat(
+                [
+                    pd.DataFrame({"scope": scope}, index=range(len(present))),
+                    group_keys.iloc[present].reset_index(drop=True),
+                    pd.DataFrame({name: column[present] for name, column in stats.items()}),
+                ],
+                axis=1,
+            )
+        )
+
+    entries_df = pd.concat(entries, ignore_index=True) if entries else pd.DataFrame(columns=ENTRY_COLS)
+    rows = entries_df["row"].to_numpy(dtype=np.intp)
+    entries_df = pd.concat(
+        [
+            entries_df[ENTRY_COLS[:-1]],
+            scores.iloc[rows][
+                ["state_license_number", "facility_name", "sunsetwell_percentile", "composite_raw"]
+            ].reset_index(drop=True),
+        ],
+        axis=1,
+    )
+    aggregates_df = pd.concat(aggregates, ignore_index=True) if aggregates else pd.DataFrame(columns=GROUP_COLS)
+    return entries_df, aggregates_df[GROUP_COLS]
+
+
+def _performer_trend(high: int, table_size: int) -> str:
+    share = high / table_size if table_size else 0.0
+    if share >= 0.4:
+        return "a sizable cluster of high-performing facilities"
+    if share >= 0.2:
+        return "a meaningful group of above-average performers"
+    return "a smaller share of top performers"
+
+
+def metro_document(
+    metro: Mapping[str, str],
+    aggregate: Mapping[str, float],
+    board: pd.DataFrame,
+    high_performer_score: float,
+) -> Dict[str, Any]:
+    """One metro in the ``data/metros/<slug>.json`` shape (ALFs carry no CMS star ratings)."""
+    table = [
+        {
+            "rank": int(entry.rank),
+            "facilityId": str(entry.state_license_number),
+            "title": str(entry.facility_name),
+            "score": int(round(entry.sunsetwell_percentile * 100)),
+            "percentile": int(round(entry.sunsetwell_percentile * 100)),
+            "health": None,
+            "staffing": None,
+            "quality": None,
+            "rnHours": None,
+            "totalNurseHours": None,
+            "topUp": False,
+        }
+        for entry in board.itertuples(index=False)
+    ]
+    average = float(aggregate.get("average_score", 0.0))
+    high = sum(row["score"] >= high_performer_score for row in table)
+    tier = "generally excellent" if average >= 75 else "solid" if average >= 60 else "mixed"
+    return {
+        "metro": metro["name"],
+        "city": metro["city"],
+        "state": metro["state"],
+        "count": int(aggregate.get("count", 0)),
+        "averageScore": f"{average:.1f}",
+        "highPerformerShare": int(round(float(aggregate.get("high_performer_share", 0.0)) * 100)),
+        "narrative": (
+            f"Overall, {metro['city']} shows {_performer_trend(high, len(table))}. The average SunsetWell "
+            f"score suggests {tier} quality across the market. Families should still compare options on "
+            "inspection history, staffing hours, and care stability."
+        ),
+        "table": table,
+    }
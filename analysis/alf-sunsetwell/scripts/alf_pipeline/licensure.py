@@ -0,0 +1,131 @@
+"""License date parsing and status weights behind ``licensure_score``.
+
+State exports write their license dates differently (ISO dates, ISO
+timestamps, US ``MM/DD/YYYY``...), and ``pd.to_datetime`` without a format
+infers one from the first value and silently coerces the rest. Instead, each
+state's date columns are parsed at ingest:
+
+* :func:`detect_date_format` tries :data:`DATE_FORMATS` on a sample of the
+  column's distinct values and keeps the one that parses the most;
+* :func:`parse_dates` parses the whole column with that explicit format in
+  one vectorized call and counts the values it could not parse.
+
+Parsed columns land in the per-state ingest cache, so a source file's dates
+are only parsed again when the file (or this code) changes. The formats and
+failure counts travel in the state manifest to ``date_parse_report.csv``.
+
+License status weights are looked up once per category, not per row.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .schema import DATE, columns_of_kind
+
+
+# Candidates in preference order; ties in the detection sample go to the earlier format
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "ISO8601",
+    "%m/%d/%Y",
+    "%m/%d/%y",
+    "%Y/%m/%d",
+    "%m-%d-%Y",
+    "%Y%m%d",
+    "%d-%b-%Y",
+    "%b %d, %Y",
+)
+# Distinct values tried per candidate format
+DETECT_SAMPLE = 500
+DATE_DTYPE = "datetime64[us]"
+
+STATUS_WEIGHTS = {
+    "ACTIVE": 1.0,
+    "CURRENT": 1.0,
+    "IN REVIEW": 0.6,
+    "PENDING": 0.5,
+    "INACTIVE": 0.2,
+    "EXPIRED": 0.2,
+    "SUSPENDED": 0.1,
+    "REVOKED": 0.0,
+    "CLOSED": 0.0,
+}
+# Unknown or missing status
+DEFAULT_STATUS_WEIGHT = 0.4
+
+
+def _to_datetime(values: pd.Series, fmt: str) -> pd.Series:
+    # Timestamps with offsets are converted to UTC; plain dates are unchanged
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce", utc=True)
+    return parsed.dt.tz_localize(None).astype(DATE_DTYPE)
+
+
+def detect_date_format(values: pd.Series, sample: int = DETECT_SAMPLE) -> Optional[str]:
+    """The :data:`DATE_FORMATS` entry parsing most of ``values``' first distinct values (None if none do)."""
+    distinct = pd.Series(values.dropna().astype(str).str.strip().unique()[:sample])
+    distinct = distinct[distinct != ""]
+    if distinct.empty:
+        return None
+    parsed = [int(_to_datetime(distinct, fmt).notna().sum()) for fmt in DATE_FORMATS]
+    best = int(np.argmax(parsed))
+    return DATE_FORMATS[best] if parsed[best] else None
+
+
+def parse_dates(values: pd.Series, fmt: Optional[str] = None) -> Tuple[pd.Series, Dict[str, object]]:
+    """``values`` as datetimes with ``fmt`` (detected when omitted), and the parse stats.
+
+    Stats are the format used, the count of non-missing values and how many
+    of them failed to parse. Values that are already datetimes pass through.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.astype(DATE_DTYPE), {"format": None, "values": int(values.notna().sum()), "failed": 0}
+    text = values.astype("string").str.strip().replace("", pd.NA)
+    fmt = fmt or detect_date_format(text)
+    present = int(text.notna().sum())
+    if fmt is None:
+        parsed = pd.Series(pd.NaT, index=values.index, dtype=DATE_DTYPE)
+    else:
+        parsed = _to_datetime(text, fmt)
+    return parsed, {"format": fmt, "values": present, "failed": present - int(parsed.notna().sum())}
+
+
+def normalize_dates(
+    frame: pd.DataFrame,
+    formats: Optional[Dict[str, Optional[str]]] = None,
+) -> Dict[str, Dict[str, object]]:
+    """Parse the schema's date columns in ``frame`` in place; return per-column stats.
+
+    ``formats`` (column -> format) skips detection, e.g. for later chunks of
+    a file whose first chunk was already detected.
+    """
+    stats = {}
+    for col in columns_of_kind(DATE):
+        if col in frame.columns:
+            frame[col], stats[col] = parse_dates(frame[col], (formats or {}).get(col))
+    return stats
+
+
+def status_weights(status: pd.Series) -> np.ndarray:
+    """:data:`STATUS_WEIGHTS` per row, matched case-insensitively once per distinct status."""
+    categorical = status if isinstance(status.dtype, pd.CategoricalDtype) else status.astype("category")
+    levels = pd.Series(categorical.cat.categories.astype(str)).str.strip().str.upper()
+    weights = levels.map(STATUS_WEIGHTS).fillna(DEFAULT_STATUS_WEIGHT).to_numpy(dtype=float)
+    codes = categorical.cat.codes.to_numpy()
+    # Code -1 (missing) takes the last slot, the default weight
+    return np.append(weights, DEFAULT_STATUS_WEIGHT)[codes]
+
+
+PARSE_REPORT_COLS = ["state", "column", "format", "values", "failed", "failure_rate"]
+
+
+def parse_report(dates: Mapping[str, Mapping[str, Mapping[str, object]]]) -> pd.DataFrame:
+    """One row per state and date column from ``{state: normalize_dates stats}``."""
+    rows = [{"state": state, "column": col, **stats} for state, columns in dates.items() for col, stats in columns.items()]
+    report = pd.DataFrame(rows, columns=PARSE_REPORT_COLS[:-1])
+    values = report["values"].astype(float)
+    report["failure_rate"] = (report["failed"] / values.where(values > 0)).fillna(0.0).round(4)
+    return report[PARSE_REPORT_COLS]
@@ -0,0 +1,378 @@
+"""Link cohort facilities to records from other facility sources.
+
+State license numbers rarely survive the trip into CMS feeds, geocoder
+output or other rosters, so records are linked on what they share instead:
+
+1. **Normalize** ZIP (first five digits), phone (last ten digits), city,
+   name and street address (lowercase alphanumerics, common suffixes and
+   street words abbreviated) with vectorized string operations.
+2. **Block**: candidate pairs are hash joins of the two sides on each
+   blocking key (ZIP, state + city, phone), so only records sharing a key
+   are ever compared. Key values whose block would exceed
+   ``max_block_pairs`` (a shared switchboard number, a ZIP-less export) are
+   skipped rather than allowed to go quadratic.
+3. **Score** every candidate pair at once: names and addresses become
+   L2-normalized character-trigram vectors (hashed, so workers need no shared
+   vocabulary) and the similarity of a pair is the row-wise dot product.
+   ZIP and phone agreement add exact-match evidence; the confidence is the
+   weighted mean over the fields both records have.
+4. **Select** the best candidate per cohort facility and source, keeping the
+   runner-up confidence so ambiguous links stand out.
+
+Blocks are grouped into partitions by a stable hash of the key value and the
+partitions are joined and scored in a process pool; the result does not
+depend on the worker count.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+BLOCK_KEYS = ("zip", "city", "phone")
+FIELD_WEIGHTS = {"name": 0.5, "address": 0.3, "zip": 0.1, "phone": 0.1}
+
+# Source columns are matched after lowercasing and replacing non-alphanumerics with "_"
+SOURCE_FIELDS = {
+    "facility_name": ("facility_name", "provider_name", "name"),
+    "address": ("address", "provider_address", "street_address", "address_line_1"),
+    "city": ("city", "provider_city", "city_town"),
+    "state": ("state", "provider_state"),
+    "zip_code": ("zip_code", "zip", "provider_zip_code", "postal_code"),
+    "phone": ("phone", "phone_number", "telephone_number", "provider_phone_number"),
+}
+SOURCE_ID_COLS = (
+    "source_id",
+    "cms_certification_number_ccn",
+    "ccn",
+    "federal_provider_number",
+    "state_license_number",
+    "id",
+)
+
+PAIR_COLS = [
+    "left_row",
+    "right_row",
+    "name_similarity",
+    "address_similarity",
+    "zip_match",
+    "phone_match",
+    "confidence",
+    "blocks",
+]
+MATCH_COLS = [
+    "state",
+    "state_license_number",
+    "facility_name",
+    "source",
+    "source_id",
+    "source_facility_name",
+    "confidence",
+    "name_similarity",
+    "address_similarity",
+    "zip_match",
+    "phone_match",
+    "blocks",
+    "candidates",
+    "runner_up_confidence",
+    "source_links",
+]
+
+NAME_STOPWORDS = {"the", "of", "and", "llc", "inc", "corp", "corporation", "co", "ltd", "lp", "pllc"}
+ADDRESS_WORDS = {
+    "street": "st",
+    "avenue": "ave",
+    "road": "rd",
+    "drive": "dr",
+    "boulevard": "blvd",
+    "lane": "ln",
+    "court": "ct",
+    "place": "pl",
+    "highway": "hwy",
+    "parkway": "pkwy",
+    "suite": "ste",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+}
+
+_VECTORIZER = HashingVectorizer(
+    analyzer="char_wb", ngram_range=(3, 3), n_features=2**18, alternate_sign=False, norm="l2"
+)
+
+
+# ---------------------------------------------------------------------------
+# Normalization
+# ---------------------------------------------------------------------------
+
+
+def _text(values: pd.Series) -> pd.Series:
+    text = values.astype("string").str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+    return text.where(text != "")
+
+
+def _drop_words(text: pd.Series, words: Sequence[str]) -> pd.Series:
+    pattern = r"\b(?:" + "|".join(map(re.escape, sorted(words))) + r")\b"
+    cleaned = text.str.replace(pattern, " ", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+    return cleaned.where(cleaned != "")
+
+
+def _column(frame: pd.DataFrame, name: str) -> pd.Series:
+    return frame[name] if name in frame.columns else pd.Series(pd.NA, index=frame.index, dtype="string")
+
+
+def normalize_records(frame: pd.DataFrame) -> pd.DataFrame:
+    """Comparison fields and blocking keys for records with the combined-table columns."""
+    state = _text(_column(frame, "state")).str.upper()
+    city = _text(_column(frame, "city"))
+    address = _text(_column(frame, "address")).str.replace(
+        r"\b(" + "|".join(ADDRESS_WORDS) + r")\b", lambda match: ADDRESS_WORDS[match.group(1)], regex=True
+    )
+    phone = _column(frame, "phone").astype("string").str.replace(r"\D", "", regex=True).str[-10:]
+    return pd.DataFrame(
+        {
+            "name": _drop_words(_text(_column(frame, "facility_name")), NAME_STOPWORDS),
+            "address": address,
+            "zip": _column(frame, "zip_code").astype("string").str.extract(r"(\d{5})", expand=False),
+            "city": (state + "|" + city).where(state.notna() & city.notna()),
+            "phone": phone.where(phone.str.len() == 10),
+        },
+        index=frame.index,
+    )
+
+
+def load_source(path: Path) -> pd.DataFrame:
+    """Read a facility source and map its columns onto the combined-table names.
+
+    The record id is the first of ``SOURCE_ID_COLS`` present (else the row
+    number); a source needs at least a facility name column.
+    """
+    if path.suffix.lower() == ".parquet":
+        raw = pd.read_parquet(path)
+    else:
+        raw = pd.read_csv(path, dtype=str, low_memory=False)
+    raw.columns = [re.sub(r"[^a-z0-9]+", "_", str(col).lower()).strip("_") for col in raw.columns]
+
+    mapped = {}
+    for field, aliases in SOURCE_FIELDS.items():
+        present = [alias for alias in aliases if alias in raw.columns]
+        if present:
+            mapped[field] = raw[present[0]]
+    if "facility_name" not in mapped:
+        raise ValueError(f"{path} has no facility name column (expected one of {SOURCE_FIELDS['facility_name']})")
+    id_col = next((col for col in SOURCE_ID_COLS if col in raw.columns), None)
+    source_id = raw[id_col].astype(str) if id_col else pd.Series(np.arange(len(raw)).astype(str), index=raw.index)
+    return pd.DataFrame({"source_id": source_id, **mapped}).reset_index(drop=True)
+
+
+# ---------------------------------------------------------------------------
+# Blocking and pair scoring
+# ---------------------------------------------------------------------------
+
+
+def _similarity(
+    left: pd.Series,
+    right: pd.Series,
+    left_pos: np.ndarray,
+    right_pos: np.ndarray,
+) -> np.ndarray:
+    """Trigram cosine similarity of ``left[left_pos]`` and ``right[right_pos]`` (NaN if either is missing).
+
+    Each record is vectorized once; pairs only index into the two matrices.
+    """
+    left_vectors = _VECTORIZER.transform(left.fillna("").tolist())
+    right_vectors = _VECTORIZER.transform(right.fillna("").tolist())
+    similarity = np.asarray(left_vectors[left_pos].multiply(right_vectors[right_pos]).sum(axis=1)).ravel()
+    missing = left.isna().to_numpy()[left_pos] | right.isna().to_numpy()[right_pos]
+    return np.where(missing, np.nan, similarity)
+
+
+def _agreement(left: pd.Series, right: pd.Series, left_pos: np.ndarray, right_pos: np.ndarray) -> np.ndarray:
+    """1.0 where both values are present and equal, 0.0 where they differ, NaN if either is missing."""
+    left_values = left.to_numpy(dtype=object, na_value=None)[left_pos]
+    right_values = right.to_numpy(dtype=object, na_value=None)[right_pos]
+    missing = left.isna().to_numpy()[left_pos] | right.isna().to_numpy()[right_pos]
+    return np.where(missing, np.nan, (left_values == right_values).astype(float))
+
+
+def score_pairs(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    left_pos: np.ndarray,
+    right_pos: np.ndarray,
+) -> pd.DataFrame:
+    """Field evidence and confidence for pairs of normalized records given by position."""
+    evidence = {
+        "name": _similarity(left["name"], right["name"], left_pos, right_pos),
+        "address": _similarity(left["address"], right["address"], left_pos, right_pos),
+        "zip": _agreement(left["zip"], right["zip"], left_pos, right_pos),
+        "phone": _agreement(left["phone"], right["phone"], left_pos, right_pos),
+    }
+    weights = np.array([FIELD_WEIGHTS[field] for field in evidence])
+    matrix = np.column_stack(list(evidence.values()))
+    available = ~np.isnan(matrix)
+    weight_sum = (available * weights).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        confidence = np.where(available, matrix, 0.0) @ weights / weight_sum
+    return pd.DataFrame(
+        {
+            "left_row": left["left_row"].to_numpy()[left_pos],
+            "right_row": right["right_row"].to_numpy()[right_pos],
+            "name_similarity": evidence["name"],
+            "address_similarity": evidence["address"],
+            "zip_match": evidence["zip"],
+            "phone_match": evidence["phone"],
+            "confidence": np.nan_to_num(confidence, nan=0.0),
+        }
+    )
+
+
+def _link_partition(key: str, left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    """Process-pool worker: hash-join one partition of blocks on ``key`` and score the pairs."""
+    pairs = pd.DataFrame({key: left[key].to_numpy(), "left_pos": np.arange(len(left))}).merge(
+        pd.DataFrame({key: right[key].to_numpy(), "right_pos": np.arange(len(right))}), on=key
+    )
+    scored = score_pairs(left, right, pairs["left_pos"].to_numpy(), pairs["right_pos"].to_numpy())
+    scored["block"] = 1 << BLOCK_KEYS.index(key)
+    return scored
+
+
+def block_jobs(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    max_block_pairs: int,
+    partitions: int,
+) -> Tuple[List[Tuple[str, pd.DataFrame, pd.DataFrame]], Dict[str, int]]:
+    """Split both sides into (key, left part, right part) jobs; also count skipped key values."""
+    jobs, skipped = [], {}
+    for key in BLOCK_KEYS:
+        left_sizes = left[key].value_counts()
+        right_sizes = right[key].value_counts()
+        sizes = left_sizes.mul(right_sizes, fill_value=0)
+        keep = sizes[(sizes > 0) & (sizes <= max_block_pairs)].index
+        skipped[key] = int((sizes > max_block_pairs).sum())
+        if not len(keep):
+            continue
+        left_rows = left[left[key].isin(keep)]
+        right_rows = right[right[key].isin(keep)]
+        left_part = pd.util.hash_pandas_object(left_rows[key], index=False).to_numpy() % partitions
+        right_part = pd.util.hash_pandas_object(right_rows[key], index=False).to_numpy() % partitions
+        for part in range(partitions):
+            left_block, right_block = left_rows[left_part == part], right_rows[right_part == part]
+            if len(left_block) and len(right_block):
+                jobs.append((key, left_block, right_block))
+    return jobs, skipped
+
+
+def link_records(
+    cohort: pd.DataFrame,
+    source: pd.DataFrame,
+    max_block_pairs: int = 250_000,
+    workers: int = 0,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Every blocked candidate pair between ``cohort`` and ``source`` rows, scored.
+
+    Returns one row per distinct pair (``left_row``/``right_row`` are
+    positions in the two frames) with the blocking keys that produced it, and
+    blocking statistics.
+    """
+    left = normalize_records(cohort).assign(left_row=np.arange(len(cohort)))
+    right = normalize_records(source).assign(right_row=np.arange(len(source)))
+    workers = workers or os.cpu_count() or 1
+    jobs, skipped = block_jobs(left, right, max_block_pairs, partitions=max(1, workers * 4))
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_link_partition, *zip(*jobs)))
+    else:
+        results = [_link_partition(*job) for job in jobs]
+
+    stats = {"candidate_pairs": 0, "skipped_blocks": skipped, "jobs": len(jobs)}
+    if not results:
+        return pd.DataFrame(columns=PAIR_COLS), stats
+    scored = pd.concat(results, ignore_index=True)
+    stats["candidate_pairs"] = int(len(scored))
+    # Each key yields a pair at most once, so summing key bits gives the set of blocks that found it
+    bits = scored.groupby(["left_row", "right_row"], sort=True)["block"].sum().to_numpy()
+    labels = np.array(
+        ["|".join(key for i, key in enumerate(BLOCK_KEYS) if mask >> i & 1) for mask in range(2 ** len(BLOCK_KEYS))]
+    )
+    pairs = scored.drop(columns="block").drop_duplicates(["left_row", "right_row"])
+    pairs = pairs.sort_values(["left_row", "right_row"]).reset_index(drop=True)
+    pairs["blocks"] = labels[bits]
+    stats["distinct_pairs"] = int(len(pairs))
+    return pairs, stats
+
+
+def best_matches(pairs: pd.DataFrame, min_confidence: float) -> pd.DataFrame:
+    """Highest-confidence pair per cohort row, with the runner-up confidence and candidate count.
+
+    ``source_links`` counts the kept cohort rows linked to the same source
+    record; above 1 it flags duplicates or an under-specified source row.
+    """
+    if pairs.empty:
+        return pairs.assign(
+            candidates=pd.Series(dtype=int),
+            runner_up_confidence=pd.Series(dtype=float),
+            source_links=pd.Series(dtype=int),
+        )
+    ranked = pairs.sort_values(["left_row", "confidence", "right_row"], ascending=[True, False, True])
+    position = ranked.groupby("left_row").cumcount()
+    best = ranked[position == 0].set_index("left_row")
+    runner_up = ranked[position == 1].set_index("left_row")["confidence"]
+    best["candidates"] = ranked.groupby("left_row").size()
+    best["runner_up_confidence"] = runner_up.reindex(best.index)
+    best = best[best["confidence"] >= min_confidence].reset_index()
+    best["source_links"] = best.groupby("right_row")["right_row"].transform("size")
+    return best
+
+
+def match_table(
+    cohort: pd.DataFrame,
+    sources: Dict[str, pd.DataFrame],
+    min_confidence: float = 0.8,
+    max_block_pairs: int = 250_000,
+    workers: int = 0,
+) -> Tuple[pd.DataFrame, Dict[str, Dict[str, Any]]]:
+    """Best link per cohort facility and source, plus per-source blocking statistics."""
+    tables: List[pd.DataFrame] = []
+    report: Dict[str, Dict[str, Any]] = {}
+    for name, source in sources.items():
+        pairs, stats = link_records(cohort, source, max_block_pairs=max_block_pairs, workers=workers)
+        matches = best_matches(pairs, min_confidence)
+        left = cohort.iloc[matches["left_row"].to_numpy()].reset_index(drop=True)
+        right = source.iloc[matches["right_row"].to_numpy()].reset_index(drop=True)
+        tables.append(
+            pd.DataFrame(
+                {
+                    "state": left["state"].astype(str),
+                    "state_license_number": left["state_license_number"].astype(str),
+                    "facility_name": left["facility_name"].astype(str),
+                    "source": name,
+                    "source_id": right["source_id"],
+                    "source_facility_name": right["facility_name"],
+                    "confidence": matches["confidence"].round(4),
+                    "name_similarity": matches["name_similarity"].round(4),
+                    "address_similarity": matches["address_similarity"].round(4),
+                    "zip_match": matches["zip_match"],
+                    "phone_match": matches["phone_match"],
+                    "blocks": matches["blocks"],
+                    "candidates": matches["candidates"],
+                    "runner_up_confidence": matches["runner_up_confidence"].round(4),
+                    "source_links": matches["source_links"],
+                }
+            )
+        )
+        report[name] = {"records": int(len(source)), "matched": int(len(matches)), **stats}
+    table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=MATCH_COLS)
+    return table, report
+
@@ -0,0 +1,128 @@
+"""Aligned, memory-mappable copies of the modeling matrices.
+
+The ``matrices`` stage writes under ``data/matrices/``:
+
+* ``features_z.npy``: z-scored features (``Z_COLS``);
+* ``embedding.npy``: UMAP coordinates (``umap_x``, ``umap_y``);
+* ``services.npy``: final service counts (observed, else imputed);
+* ``components.npy``: the four component scores (``COMPONENT_COLS``);
+* ``rows.arrow``: the shared row index (position, ``row_key``, state,
+  license number, facility name) as an uncompressed Arrow IPC file;
+* ``manifest.json``: row count, row-key hash and, per matrix, its file,
+  shape, dtype and column names.
+
+Row ``i`` of every matrix is row ``i`` of ``rows.arrow``. Matrices are
+C-contiguous float64 ``.npy`` files, so ``np.load(path, mmap_mode="r")``
+maps them without parsing or copying, and worker processes that map the same
+file share its pages. :func:`load_matrices` does this for every file.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .dag import content_hash
+
+
+MANIFEST = "manifest.json"
+ROW_INDEX = "rows.arrow"
+
+
+def _write_atomic(path: Path, write: Any) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    with open(path, "wb") as fh:
+        np.save(fh, array, allow_pickle=False)
+
+
+def _save_arrow(path: Path, table: pa.Table) -> None:
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def write_matrices(
+    directory: Path,
+    rows: pd.DataFrame,
+    matrices: Mapping[str, pd.DataFrame],
+) -> Dict[str, Any]:
+    """Write ``matrices`` (name -> row-aligned numeric frame) and the ``rows`` index.
+
+    ``rows`` needs a ``row_key`` column; the manifest is returned.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    row_table = pa.Table.from_pandas(rows.reset_index(drop=True).astype("string"), preserve_index=False)
+    row_table = row_table.add_column(0, "row", pa.array(np.arange(len(rows), dtype=np.int64)))
+    _write_atomic(directory / ROW_INDEX, lambda path: _save_arrow(path, row_table))
+
+    manifest: Dict[str, Any] = {
+        "rows": int(len(rows)),
+        "row_index": ROW_INDEX,
+        "row_key_hash": content_hash(row_table.column("row_key").to_pylist()),
+        "matrices": {},
+    }
+    for name, frame in matrices.items():
+        if len(frame) != len(rows):
+            raise ValueError(f"Matrix '{name}' has {len(frame)} rows; the row index has {len(rows)}")
+        array = np.ascontiguousarray(frame.to_numpy(dtype=np.float64))
+        filename = f"{name}.npy"
+        _write_atomic(directory / filename, lambda path: _save_npy(path, array))
+        manifest["matrices"][name] = {
+            "file": filename,
+            "shape": list(array.shape),
+            "dtype": array.dtype.str,
+            "columns": [str(col) for col in frame.columns],
+        }
+    # The manifest goes last: readers never see it ahead of the files it describes
+    _write_atomic(
+        directory / MANIFEST, lambda path: path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    )
+    return manifest
+
+
+@dataclass
+class Matrices:
+    """Memory-mapped matrices and their row index, as published by the matrices stage."""
+
+    directory: Path
+    manifest: Dict[str, Any]
+    rows: pa.Table
+    arrays: Dict[str, np.ndarray]
+
+    def columns(self, name: str) -> Sequence[str]:
+        return self.manifest["matrices"][name]["columns"]
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """``name`` as a DataFrame over the mapped array (no copy for float64)."""
+        return pd.DataFrame(self.arrays[name], columns=list(self.columns(name)), copy=False)
+
+    def row_frame(self) -> pd.DataFrame:
+        return self.rows.to_pandas()
+
+
+def load_matrices(directory: Path, names: Sequence[str] = (), mmap: bool = True) -> Matrices:
+    """Map (or with ``mmap=False`` read) the published matrices; ``names`` limits which ones."""
+    with open(directory / MANIFEST, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    row_path = str(directory / manifest["row_index"])
+    rows = pa.ipc.open_file(pa.memory_map(row_path) if mmap else pa.OSFile(row_path)).read_all()
+    arrays = {}
+    for name, entry in manifest["matrices"].items():
+        if names and name not in names:
+            continue
+        array = np.load(directory / entry["file"], mmap_mode="r" if mmap else None, allow_pickle=False)
+        if list(array.shape) != entry["shape"]:
+            raise ValueError(f"{directory / entry['file']} has shape {array.shape}; manifest says {entry['shape']}")
+        arrays[name] = array
+    return Matrices(directory=directory, manifest=manifest, rows=rows, arrays=arrays)
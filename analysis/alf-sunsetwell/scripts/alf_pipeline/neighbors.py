@@ -0,0 +1,444 @@
+"""Persistent nearest-neighbor indexes over the UMAP embedding.
+
+One :class:`NeighborIndex` interface, two backends:
+
+* ``kdtree`` – exact search with scikit-learn's KD-tree (what the original
+  per-run ``NearestNeighbors`` fit used for the 2-D embedding).
+* ``rpforest`` – approximate search with a forest of balanced random
+  projection trees (annoy-style, pure NumPy). A query descends every tree to
+  the deepest node still holding ``max(k, leaf_size)`` facilities and the
+  union of those nodes is ranked exactly.
+
+Both keep the built structure static: :meth:`NeighborIndex.add` appends new
+facilities to a pending block that queries scan exactly, and the structure is
+rebuilt once pending rows exceed ``rebuild_fraction`` of the index. Queries
+run in row chunks and can be restricted to a boolean ``mask`` of eligible
+rows (e.g. facilities with observed services); rows whose neighborhood holds
+too few eligible facilities fall back to an exact tree over just those rows.
+An index is saved as a
+directory with ``manifest.json``, ``points.npy``, ``keys.npy`` and the
+backend state.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+from .config import PipelineConfig
+
+
+DEFAULT_CHUNK_SIZE = 8192
+DEFAULT_REBUILD_FRACTION = 0.1
+# Candidate (row, facility) pairs ranked at once by the approximate backend
+CANDIDATE_BLOCK_ELEMENTS = 2**21
+
+
+class NeighborIndex:
+    """Base class: point storage, pending inserts, masked chunked queries, persistence."""
+
+    backend = ""
+
+    def __init__(self, rebuild_fraction: float = DEFAULT_REBUILD_FRACTION) -> None:
+        self.rebuild_fraction = rebuild_fraction
+        self.points = np.empty((0, 0))
+        self.keys = np.empty(0, dtype=object)
+        self.built_rows = 0
+        self._subset: Optional[Tuple[Any, KDTree, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {**self.__dict__, "_subset": None}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update({**state, "_subset": None})
+
+    def params(self) -> Dict[str, Any]:
+        return {"rebuild_fraction": self.rebuild_fraction}
+
+    # -- building -----------------------------------------------------------
+
+    def build(self, points: np.ndarray, keys: Optional[Sequence[str]] = None) -> "NeighborIndex":
+        """Index ``points`` from scratch; ``keys`` label rows (default: row numbers)."""
+        self.points = np.ascontiguousarray(points, dtype=float)
+        self.keys = np.asarray(keys if keys is not None else np.arange(len(points)).astype(str), dtype=object)
+        self.rebuild()
+        return self
+
+    def rebuild(self) -> None:
+        self._build(self.points)
+        self.built_rows = len(self.points)
+
+    def add(self, points: np.ndarray, keys: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Insert facilities and return their row ids."""
+        if not len(self):
+            self.build(points, keys)
+            return np.arange(len(self))
+        points = np.asarray(points, dtype=float).reshape(-1, self.points.shape[1])
+        ids = np.arange(len(self.points), len(self.points) + len(points))
+        self.points = np.vstack([self.points, points])
+        self.keys = np.concatenate([self.keys, np.asarray(keys if keys is not None else ids.astype(str), dtype=object)])
+        if len(self.points) - self.built_rows > self.rebuild_fraction * max(self.built_rows, 1):
+            self.rebuild()
+        return ids
+
+    def positions(self, keys: Sequence[str]) -> np.ndarray:
+        """Row id of each key; raises KeyError for keys not in the index."""
+        lookup = {key: row for row, key in enumerate(self.keys)}
+        missing = [key for key in keys if key not in lookup]
+        if missing:
+            raise KeyError(f"{len(missing)} keys are not in the neighbor index, e.g. {missing[0]!r}")
+        return np.fromiter((lookup[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    # -- querying -----------------------------------------------------------
+
+    def query(
+        self,
+        points: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """``(distances, ids)`` of the ``k`` nearest rows (restricted to ``mask``), nearest first."""
+        points = np.asarray(points, dtype=float)
+        eligible = len(self) if mask is None else int(mask.sum())
+        k = min(k, eligible)
+        distances = np.empty((len(points), k))
+        ids = np.empty((len(points), k), dtype=np.int64)
+        if k == 0:
+            return distances, ids
+        for start in range(0, len(points), max(1, chunk_size)):
+            rows = slice(start, min(start + chunk_size, len(points)))
+            distances[rows], ids[rows] = self._query_chunk(points[rows], k, mask, eligible)
+        return distances, ids
+
+    def _query_chunk(
+        self,
+        points: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray],
+        eligible: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if mask is None:
+            return self._search(points, k)
+        # One pass with twice the expected search width; rows still short of
+        # eligible neighbors (e.g. donors clustered elsewhere) use an exact
+        # tree over the eligible rows
+        distances = np.empty((len(points), k))
+        ids = np.empty((len(points), k), dtype=np.int64)
+        pending = np.arange(len(points))
+        search_k = 2 * math.ceil(k * len(self) / eligible)
+        if search_k < len(self) // 2:
+            found_d, found_i = self._search(points, search_k)
+            keep = (found_i >= 0) & mask[np.maximum(found_i, 0)]
+            complete = keep.sum(axis=1) >= k
+            order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+            distances[complete] = np.take_along_axis(found_d, order, axis=1)[complete]
+            ids[complete] = np.take_along_axis(found_i, order, axis=1)[complete]
+            pending = pending[~complete]
+        if len(pending):
+            tree, eligible_ids = self._eligible_tree(mask)
+            distances[pending], found = tree.query(points[pending], k=k)
+            ids[pending] = eligible_ids[found]
+        return distances, ids
+
+    def _eligible_tree(self, mask: np.ndarray) -> Tuple[KDTree, np.ndarray]:
+        """Exact KD-tree over the masked rows, kept while the same mask is queried."""
+        signature = (len(self), hashlib.sha1(np.packbits(mask).tobytes()).hexdigest())
+        if self._subset is None or self._subset[0] != signature:
+            eligible_ids = np.flatnonzero(mask)
+            self._subset = (signature, KDTree(self.points[eligible_ids], leaf_size=30), eligible_ids)
+        return self._subset[1], self._subset[2]
+
+    def _search(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest over built and pending rows, padded with (inf, -1)."""
+        distances, ids = self._search_built(points, min(k, self.built_rows))
+        if len(self) > self.built_rows:
+            pending = self.points[self.built_rows :]
+            extra_d = np.sqrt(((points[:, None, :] - pending[None, :, :]) ** 2).sum(axis=2))
+            extra_i = np.broadcast_to(np.arange(self.built_rows, len(self)), extra_d.shape)
+            distances = np.concatenate([distances, extra_d], axis=1)
+            ids = np.concatenate([ids, extra_i], axis=1)
+            distances, ids = _nearest(distances, ids, k)
+        return distances, ids
+
+    # -- backend hooks ------------------------------------------------------
+
+    def _build(self, points: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def _search_built(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def _state(self) -> Any:
+        raise NotImplementedError
+
+    def _restore(self, state: Any) -> None:
+        raise NotImplementedError
+
+    # -- persistence --------------------------------------------------------
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "points.npy", self.points, allow_pickle=False)
+        np.save(directory / "keys.npy", self.keys.astype(str), allow_pickle=False)
+        with open(directory / "state.pkl", "wb") as fh:
+            pickle.dump(self._state(), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        manifest = {
+            "backend": self.backend,
+            "params": self.params(),
+            "rows": len(self),
+            "built_rows": self.built_rows,
+        }
+        with open(directory / "manifest.json", "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=2)
+
+    @staticmethod
+    def load(directory: Path) -> Optional["NeighborIndex"]:
+        """Load a saved index, or None when ``directory`` holds none."""
+        manifest_path = directory / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        index = BACKENDS[manifest["backend"]](**manifest["params"])
+        index.points = np.load(directory / "points.npy", allow_pickle=False)
+        index.keys = np.load(directory / "keys.npy", allow_pickle=False).astype(object)
+        index.built_rows = manifest["built_rows"]
+        with open(directory / "state.pkl", "rb") as fh:
+            index._restore(pickle.load(fh))
+        return index
+
+
+def _nearest(distances: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise k smallest distances (ascending) with their ids."""
+    if distances.shape[1] > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    order = np.argsort(distances, axis=1, kind="stable")
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def _nearest_candidates(
+    points: np.ndarray,
+    indexed: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact k nearest among each row's candidate ids (-1 = empty slot), in row blocks of bounded size."""
+    distances = np.empty((len(points), k))
+    ids = np.empty((len(points), k), dtype=np.int64)
+    block = max(1, CANDIDATE_BLOCK_ELEMENTS // max(1, candidates.shape[1]))
+    for start in range(0, len(points), block):
+        rows = slice(start, min(start + block, len(points)))
+        chunk = candidates[rows]
+        diff = points[rows, None, :] - indexed[np.maximum(chunk, 0)]
+        found = np.where(chunk >= 0, np.sqrt((diff**2).sum(axis=2)), np.inf)
+        distances[rows], ids[rows] = _nearest(found, chunk, k)
+    return distances, ids
+
+
+# ---------------------------------------------------------------------------
+# Exact backend
+# ---------------------------------------------------------------------------
+
+
+class KDTreeIndex(NeighborIndex):
+    """Exact Euclidean search with a KD-tree."""
+
+    backend = "kdtree"
+
+    def __init__(self, leaf_size: int = 30, rebuild_fraction: float = DEFAULT_REBUILD_FRACTION) -> None:
+        super().__init__(rebuild_fraction)
+        self.leaf_size = leaf_size
+        self.tree: Optional[KDTree] = None
+
+    def params(self) -> Dict[str, Any]:
+        return {**super().params(), "leaf_size": self.leaf_size}
+
+    def _build(self, points: np.ndarray) -> None:
+        self.tree = KDTree(points, leaf_size=self.leaf_size) if len(points) else None
+
+    def _search_built(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if k == 0 or self.tree is None:
+            return np.empty((len(points), 0)), np.empty((len(points), 0), dtype=np.int64)
+        return self.tree.query(points, k=k)
+
+    def _state(self) -> Any:
+        return self.tree
+
+    def _restore(self, state: Any) -> None:
+        self.tree = state
+
+
+# ---------------------------------------------------------------------------
+# Approximate backend
+# ---------------------------------------------------------------------------
+
+
+class RandomProjectionForest(NeighborIndex):
+    """Approximate search over balanced random-projection trees.
+
+    Each tree splits a node at the median projection onto the direction
+    between two of its facilities, so node ``i`` (heap order) covers the
+    contiguous slice ``order[start[i]:end[i]]`` of a per-tree permutation.
+    """
+
+    backend = "rpforest"
+
+    def __init__(
+        self,
+        n_trees: int = 8,
+        leaf_size: int = 64,
+        seed: int = 42,
+        rebuild_fraction: float = DEFAULT_REBUILD_FRACTION,
+    ) -> None:
+        super().__init__(rebuild_fraction)
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.seed = seed
+        self.depth = 0
+        self.normals = np.empty((n_trees, 0, 0))
+        self.thresholds = np.empty((n_trees, 0))
+        self.order = np.empty((n_trees, 0), dtype=np.int64)
+        self.start = np.empty((n_trees, 0), dtype=np.int64)
+        self.end = np.empty((n_trees, 0), dtype=np.int64)
+
+    def params(self) -> Dict[str, Any]:
+        return {**super().params(), "n_trees": self.n_trees, "leaf_size": self.leaf_size, "seed": self.seed}
+
+    def _build(self, points: np.ndarray) -> None:
+        n, dim = points.shape
+        self.depth = max(0, int(math.floor(math.log2(n / self.leaf_size)))) if n > self.leaf_size else 0
+        internal = 2**self.depth - 1
+        nodes = 2 ** (self.depth + 1) - 1
+        rng = np.random.default_rng(self.seed)
+        self.normals = np.zeros((self.n_trees, internal, dim))
+        self.thresholds = np.zeros((self.n_trees, internal))
+        self.order = np.tile(np.arange(n), (self.n_trees, 1))
+        self.start = np.zeros((self.n_trees, nodes), dtype=np.int64)
+        self.end = np.zeros((self.n_trees, nodes), dtype=np.int64)
+        for tree in range(self.n_trees):
+            order = self.order[tree]
+            self.end[tree, 0] = n
+            for node in range(internal):
+                lo, hi = self.start[tree, node], self.end[tree, node]
+                members = points[order[lo:hi]]
+                a, b = rng.choice(len(members), size=2, replace=False)
+                normal = members[b] - members[a]
+                if not normal.any():
+                    normal = rng.standard_normal(dim)
+                projection = members @ normal
+                ranked = np.argsort(projection, kind="stable")
+                order[lo:hi] = order[lo:hi][ranked]
+                mid = lo + (hi - lo) // 2
+                split = projection[ranked]
+                self.normals[tree, node] = normal
+                self.thresholds[tree, node] = (split[mid - lo - 1] + split[mid - lo]) / 2.0
+                left, right = 2 * node + 1, 2 * node + 2
+                self.start[tree, left], self.end[tree, left] = lo, mid
+                self.start[tree, right], self.end[tree, right] = mid, hi
+
+    def _search_built(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = self.built_rows
+        if k == 0 or n == 0:
+            return np.empty((len(points), 0)), np.empty((len(points), 0), dtype=np.int64)
+        # Deepest level whose nodes still hold max(k, leaf_size) facilities
+        wanted = max(k, self.leaf_size)
+        depth = min(self.depth, max(0, int(math.floor(math.log2(n / wanted))))) if n > wanted else 0
+        if depth == 0:
+            # Every tree's root holds all facilities: rank them all once
+            candidates = np.broadcast_to(np.arange(n), (len(points), n))
+            return _nearest_candidates(points, self.points, candidates, k)
+        width = math.ceil(n / 2**depth)
+        block = max(1, CANDIDATE_BLOCK_ELEMENTS // (self.n_trees * width))
+        if len(points) > block:
+            parts = [self._search_built(points[start : start + block], k) for start in range(0, len(points), block)]
+            return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+        columns = []
+        for tree in range(self.n_trees):
+            node = np.zeros(len(points), dtype=np.int64)
+            for _ in range(depth):
+                side = np.einsum("qd,qd->q", points, self.normals[tree, node]) > self.thresholds[tree, node]
+                node = 2 * node + 1 + side
+            slots = self.start[tree, node][:, None] + np.arange(width)
+            valid = slots < self.end[tree, node][:, None]
+            columns.append(np.where(valid, self.order[tree, np.minimum(slots, n - 1)], -1))
+        candidates = np.sort(np.concatenate(columns, axis=1), axis=1)
+        candidates[:, 1:][candidates[:, 1:] == candidates[:, :-1]] = -1
+        return _nearest_candidates(points, self.points, candidates, k)
+
+    def _state(self) -> Any:
+        return {
+            "depth": self.depth,
+            "normals": self.normals,
+            "thresholds": self.thresholds,
+            "order": self.order,
+            "start": self.start,
+            "end": self.end,
+        }
+
+    def _restore(self, state: Any) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+BACKENDS: Dict[str, Type[NeighborIndex]] = {
+    KDTreeIndex.backend: KDTreeIndex,
+    RandomProjectionForest.backend: RandomProjectionForest,
+}
+
+
+def make_index(backend: str, **params: Any) -> NeighborIndex:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown neighbor index backend '{backend}'. Known: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](**params)
+
+
+def index_params(config: PipelineConfig) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"rebuild_fraction": config.neighbor_rebuild_fraction}
+    if config.neighbor_backend == RandomProjectionForest.backend:
+        params.update(n_trees=config.neighbor_trees, leaf_size=config.neighbor_leaf_size, seed=config.neighbor_seed)
+    return params
+
+
+def refresh_index(config: PipelineConfig, keys: Sequence[str], points: np.ndarray) -> NeighborIndex:
+    """Index this run's embedding, reusing the saved index when only new facilities were added.
+
+    Reuse needs ``umap_mode = "incremental"`` (a refit moves every point), the
+    same backend and parameters, and every saved facility still present at
+    its saved coordinates; new facilities are then inserted. Otherwise the
+    index is rebuilt from scratch. The result is saved to
+    ``config.neighbor_index_dir`` either way.
+    """
+    keys = list(keys)
+    points = np.asarray(points, dtype=float)
+    fresh = make_index(config.neighbor_backend, **index_params(config))
+    saved = NeighborIndex.load(config.neighbor_index_dir) if config.umap_mode == "incremental" else None
+
+    index: Optional[NeighborIndex] = None
+    if saved is not None and saved.backend == fresh.backend and saved.params() == fresh.params():
+        current = {key: row for row, key in enumerate(keys)}
+        stored_rows = np.fromiter((current.get(key, -1) for key in saved.keys), dtype=np.int64, count=len(saved))
+        if (stored_rows >= 0).all() and np.array_equal(points[stored_rows], saved.points):
+            new_rows = np.setdiff1d(np.arange(len(keys)), stored_rows)
+            if len(new_rows):
+                saved.add(points[new_rows], [keys[row] for row in new_rows])
+            print(f"Neighbor index: inserted {len(new_rows)} facilities into the saved {saved.backend} index")
+            index = saved
+
+    if index is None:
+        index = fresh.build(points, keys)
+        print(f"Neighbor index: built {index.backend} index over {len(index)} facilities")
+    index.save(config.neighbor_index_dir)
+    return index
@@ -0,0 +1,266 @@
+"""Score single facilities against frozen batch distributions.
+
+Every percentile in the batch score stage is a ``rank(pct=True)`` over the
+whole cohort. The ``scoring_reference`` stage freezes what those ranks depend
+on: the sorted non-null values of each ``REG_COLS``/``SERVICE_COLS`` column,
+``licensed_capacity`` and ``composite_raw``, plus the k-NN imputation index
+(embedding coordinates and service values of fully observed facilities).
+:class:`OnlineScorer` then scores one facility or a small batch with binary
+searches into those arrays instead of re-ranking ~21k rows.
+
+A value already in the cohort gets exactly its batch percentile (average rank
+of its tie block); an unseen value is placed between its neighbors, i.e.
+within ``1 / (2n)`` of the percentile a full rerun would give it.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import FEATURE_COLS, REG_COLS, SERVICE_COLS, PipelineConfig, utc_now
+from .imputation import KnnServiceImputer
+from .utils import (
+    composite_scores,
+    reg_component,
+    service_component,
+    tenure_score,
+)
+
+
+CAPACITY_COL = "licensed_capacity"
+COMPOSITE_COL = "composite_raw"
+SERVICE_PREFIX = "service:"
+KEY_COLS = ["state", "state_license_number"]
+
+
+# ---------------------------------------------------------------------------
+# Sorted reference distributions
+# ---------------------------------------------------------------------------
+
+
+def sorted_distribution(values: pd.Series) -> np.ndarray:
+    """Non-null values of ``values`` as a sorted float64 array."""
+    array = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+    return np.sort(array[~np.isnan(array)])
+
+
+def lookup_percentiles(reference: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """``rank(pct=True)`` of ``values`` within the sorted ``reference``.
+
+    Ties take the average rank of their block, as pandas does; missing values
+    (and any value when the reference is empty) map to NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(reference) == 0:
+        return np.full(values.shape, np.nan)
+    below = np.searchsorted(reference, values, side="left")
+    through = np.searchsorted(reference, values, side="right")
+    percentiles = (below + through + 1) / (2.0 * len(reference))
+    return np.where(np.isnan(values), np.nan, percentiles)
+
+
+# ---------------------------------------------------------------------------
+# Frozen reference bundle
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ScoringReference:
+    distributions: Dict[str, np.ndarray]
+    index_coords: np.ndarray
+    index_values: np.ndarray
+    embedding: pd.DataFrame
+    manifest: Dict[str, Any]
+
+    @classmethod
+    def build(
+        cls,
+        config: PipelineConfig,
+        combined: pd.DataFrame,
+        final_service: pd.DataFrame,
+        features: pd.DataFrame,
+        embedding: pd.DataFrame,
+        scores: pd.DataFrame,
+    ) -> "ScoringReference":
+        distributions = {col: sorted_distribution(combined[col]) for col in [*REG_COLS, CAPACITY_COL]}
+        for col in SERVICE_COLS:
+            distributions[SERVICE_PREFIX + col] = sorted_distribution(final_service[col])
+        distributions[COMPOSITE_COL] = sorted_distribution(scores[COMPOSITE_COL])
+
+        observed = features[SERVICE_COLS].notna().all(axis=1).to_numpy()
+        coords = embedding[["umap_x", "umap_y"]].to_numpy(dtype=float)
+        return cls(
+            distributions=distributions,
+            index_coords=coords[observed],
+            index_values=features.loc[observed, SERVICE_COLS].to_numpy(dtype=float),
+            embedding=embedding[[*KEY_COLS, "umap_x", "umap_y"]].reset_index(drop=True),
+            manifest={
+                "built_at": utc_now().isoformat(timespec="seconds"),
+                "run_date": config.run_date.isoformat(),
+                "rows": int(len(scores)),
+                "base_weights": dict(config.base_weights),
+                "knn_neighbors": config.knn_neighbors,
+                "columns": {name: int(len(values)) for name, values in distributions.items()},
+            },
+        )
+
+    @classmethod
+    def load(cls, directory: Path) -> "ScoringReference":
+        with open(directory / "manifest.json", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        with np.load(directory / "distributions.npz", allow_pickle=False) as data:
+            distributions = {name: data[name] for name in data.files}
+        with np.load(directory / "imputation_index.npz", allow_pickle=False) as data:
+            index_coords, index_values = data["coords"], data["values"]
+        embedding = pd.read_parquet(directory / "embedding.parquet")
+        return cls(distributions, index_coords, index_values, embedding, manifest)
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        np.savez(directory / "distributions.npz", **self.distributions)
+        np.savez(directory / "imputation_index.npz", coords=self.index_coords, values=self.index_values)
+        self.embedding.to_parquet(directory / "embedding.parquet", index=False)
+        with open(directory / "manifest.json", "w", encoding="utf-8") as fh:
+            json.dump(self.manifest, fh, indent=2)
+
+    def percentiles(self, name: str, values: Any) -> np.ndarray:
+        return lookup_percentiles(self.distributions[name], values)
+
+
+# ---------------------------------------------------------------------------
+# Online scorer
+# ---------------------------------------------------------------------------
+
+
+class OnlineScorer:
+    """Score facilities with the same component math as the batch score stage.
+
+    ``facilities`` needs ``state`` and ``state_license_number``; any of
+    ``REG_COLS``, ``SERVICE_COLS``, ``licensed_capacity``,
+    ``license_issue_date`` and ``license_status`` it lacks are treated as
+    missing. Facilities with incomplete services are imputed from the frozen
+    k-NN index, which needs their embedding coordinates: explicit
+    ``umap_x``/``umap_y`` columns, else the coordinates stored for the same
+    license, else a ``transform`` through the saved incremental UMAP model.
+    """
+
+    def __init__(self, reference: ScoringReference, umap_model_dir: Optional[Path] = None) -> None:
+        self.reference = reference
+        self.umap_model_dir = umap_model_dir
+        self.base_weights = reference.manifest["base_weights"]
+        self.run_date = pd.Timestamp(reference.manifest["run_date"])
+        self.imputer = KnnServiceImputer(n_neighbors=reference.manifest["knn_neighbors"])
+        self.imputer.fit(reference.index_coords, reference.index_values)
+        stored = reference.embedding.astype({col: str for col in KEY_COLS}).drop_duplicates(KEY_COLS)
+        self._coords = stored.set_index(KEY_COLS)[["umap_x", "umap_y"]]
+
+    @classmethod
+    def from_config(cls, config: PipelineConfig) -> "OnlineScorer":
+        return cls(ScoringReference.load(config.scoring_reference_dir), umap_model_dir=config.umap_model_dir)
+
+    def coordinates(self, facilities: pd.DataFrame) -> np.ndarray:
+        """Embedding coordinates per facility (NaN where none can be resolved)."""
+        coords = np.full((len(facilities), 2), np.nan)
+        if {"umap_x", "umap_y"}.issubset(facilities.columns):
+            coords[:] = facilities[["umap_x", "umap_y"]].to_numpy(dtype=float)
+        pending = np.isnan(coords).any(axis=1)
+        if pending.any():
+            keys = pd.MultiIndex.from_frame(facilities.loc[pending, KEY_COLS].astype(str))
+            coords[pending] = self._coords.reindex(keys).to_numpy(dtype=float)
+            pending = np.isnan(coords).any(axis=1)
+        if pending.any() and self.umap_model_dir is not None and set(FEATURE_COLS).issubset(facilities.columns):
+            from .umap_model import UmapBundle, frozen_zscores
+
+            bundle = UmapBundle.load(self.umap_model_dir)
+            if bundle is not None:
+                z = frozen_zscores(facilities.loc[pending], bundle.feature_stats)
+                coords[pending] = bundle.reducer.transform(z)
+        return coords
+
+    def final_services(self, facilities: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray]:
+        """Observed-or-imputed service values and the imputation confidence."""
+        services = facilities[SERVICE_COLS].to_numpy(dtype=float)
+        confidence = np.ones(len(facilities))
+        missing = np.flatnonzero(np.isnan(services).any(axis=1))
+        if len(missing) and self.imputer.neigh_count >= 1:
+            coords = self.coordinates(facilities.iloc[missing])
+            unresolved = np.isnan(coords).any(axis=1)
+            if unresolved.any():
+                raise ValueError(
+                    f"No embedding coordinates for {int(unresolved.sum())} facilities with incomplete services; "
+                    "pass umap_x/umap_y or keep a saved UMAP model (--umap-mode incremental)"
+                )
+            predicted, confidence[missing] = self.imputer.predict(coords)
+            services[missing] = np.where(np.isnan(services[missing]), predicted, services[missing])
+        elif len(missing):
+            confidence[missing] = 0.0
+        return pd.DataFrame(services, columns=SERVICE_COLS, index=facilities.index), confidence
+
+    def score(self, facilities: pd.DataFrame, licensure_score: Optional[pd.Series] = None) -> pd.DataFrame:
+        """Rows shaped like ``alf_scores_v1.csv`` for ``facilities``.
+
+        ``licensure_score`` skips the tenure calculation for callers that
+        already have it (it does not depend on the reference).
+        """
+        expected = [*REG_COLS, *SERVICE_COLS, CAPACITY_COL, "license_issue_date", "license_status"]
+        facilities = facilities.reindex(columns=list(dict.fromkeys([*facilities.columns, *expected])))
+        for col in [*REG_COLS, *SERVICE_COLS, CAPACITY_COL]:
+            facilities[col] = pd.to_numeric(facilities[col], errors="coerce")
+        reference = self.reference
+        index = facilities.index
+
+        reg_available = facilities[REG_COLS].notna().any(axis=1)
+        reg_ranks = pd.DataFrame(
+            {col: reference.percentiles(col, facilities[col]) for col in REG_COLS}, index=index
+        )
+        reg_score = reg_component(reg_ranks, reg_available)
+
+        final_service, confidence = self.final_services(facilities)
+        service_ranks = pd.DataFrame(
+            {col: reference.percentiles(SERVICE_PREFIX + col, final_service[col]) for col in SERVICE_COLS},
+            index=index,
+        )
+        service_score = service_component(service_ranks)
+
+        capacity_percentile = pd.Series(reference.percentiles(CAPACITY_COL, facilities[CAPACITY_COL]), index=index)
+        capacity_score = capacity_percentile.fillna(0.5)
+        if licensure_score is None:
+            licensure_score = tenure_score(
+                facilities["license_issue_date"],
+                facilities["license_status"],
+                self.run_date,
+            )
+
+        service_confidence = pd.Series(confidence, index=index)
+        component_matrix = pd.DataFrame(
+            {
+                "reg_score": reg_score,
+                "service_score": service_score,
+                "capacity_score": capacity_score,
+                "licensure_score": licensure_score,
+            }
+        )
+        effective_weights, composite_raw = composite_scores(
+            component_matrix, reg_available, service_confidence, self.base_weights
+        )
+
+        return pd.DataFrame(
+            {
+                "state": facilities["state"],
+                "state_license_number": facilities["state_license_number"],
+                "facility_name": facilities.get("facility_name"),
+                "sunsetwell_percentile": reference.percentiles(COMPOSITE_COL, composite_raw),
+                "composite_raw": composite_raw,
+                **component_matrix.to_dict(orient="series"),
+                **effective_weights.to_dict(orient="series"),
+                "service_confidence": service_confidence,
+                "reg_available": reg_available,
+            },
+            index=index,
+        )
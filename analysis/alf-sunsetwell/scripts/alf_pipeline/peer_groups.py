@@ -0,0 +1,110 @@
+"""Peer-group percentiles with fallback to parent groups.
+
+Peer groups nest by key prefix: with keys ``(state, capacity_band,
+provider_type)`` a facility's group is its state × band × type cell, whose
+parent is the state × band cell, then the state, then the nation. Each
+facility is ranked in the finest level whose group holds at least
+``min_size`` facilities.
+
+Ranking a facility against a parent group needs the whole parent group as
+the population, so the value columns are stacked once per level in use and
+ranked in a single ``groupby([level, group]).rank(pct=True)`` pass; each
+facility then reads its rank from its own level. Group codes come from
+vectorized ``groupby().ngroup()`` calls, so the cost grows with rows and
+levels, not with the number of groups.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+CAPACITY_BAND = "capacity_band"
+NATIONAL = "national"
+MISSING_KEY = "unknown"
+
+
+def capacity_bands(capacity: pd.Series, edges: Sequence[float]) -> pd.Series:
+    """Label licensed capacity with half-open bands ``[edge_i, edge_i+1)``; the last band is open-ended."""
+    bounds = [*edges, np.inf]
+    labels = [
+        f"{lo:g}+" if np.isinf(hi) else f"{lo:g}-{hi - 1:g}"
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+    bands = pd.cut(pd.to_numeric(capacity, errors="coerce"), bounds, right=False, labels=labels)
+    return bands.astype(object).fillna(MISSING_KEY)
+
+
+def group_key_frame(frame: pd.DataFrame, keys: Sequence[str], band_edges: Sequence[float]) -> pd.DataFrame:
+    """The key columns as strings, deriving ``capacity_band`` from ``licensed_capacity``."""
+    columns = {}
+    for key in keys:
+        if key == CAPACITY_BAND:
+            columns[key] = capacity_bands(frame["licensed_capacity"], band_edges)
+        else:
+            columns[key] = frame[key].astype(object).where(frame[key].notna(), MISSING_KEY).astype(str)
+    return pd.DataFrame(columns, index=frame.index)
+
+
+@dataclass
+class PeerGroups:
+    keys: Tuple[str, ...]
+    # codes[l] holds each facility's group id using the first l keys (level 0 = national)
+    codes: np.ndarray
+    sizes: np.ndarray
+    level: np.ndarray
+    labels: pd.Series
+
+    @classmethod
+    def assign(
+        cls,
+        frame: pd.DataFrame,
+        keys: Sequence[str],
+        min_size: int,
+        band_edges: Sequence[float] = (),
+    ) -> "PeerGroups":
+        keys = tuple(keys)
+        key_frame = group_key_frame(frame, keys, band_edges)
+        n = len(frame)
+        codes = np.zeros((len(keys) + 1, n), dtype=np.int64)
+        sizes = np.full((len(keys) + 1, n), n, dtype=np.int64)
+        for depth in range(1, len(keys) + 1):
+            grouped = key_frame.groupby(list(keys[:depth]), sort=True)
+            codes[depth] = grouped.ngroup().to_numpy()
+            sizes[depth] = np.bincount(codes[depth])[codes[depth]]
+
+        # Finest level whose group is large enough (the national level always qualifies)
+        eligible = sizes >= min_size
+        eligible[0] = True
+        level = len(keys) - np.argmax(eligible[::-1], axis=0)
+
+        labels = pd.Series(NATIONAL, index=frame.index, dtype=object)
+        prefix = None
+        for depth, key in enumerate(keys, start=1):
+            prefix = key_frame[key] if prefix is None else prefix + " / " + key_frame[key]
+            at_depth = level == depth
+            labels[at_depth] = prefix[at_depth]
+        return cls(keys=keys, codes=codes, sizes=sizes, level=level, labels=labels)
+
+    @property
+    def group_size(self) -> np.ndarray:
+        return self.sizes[self.level, np.arange(self.sizes.shape[1])]
+
+    def rank(self, values: pd.DataFrame) -> pd.DataFrame:
+        """``rank(pct=True)`` of every column within each facility's peer group."""
+        n = len(values)
+        used: List[int] = sorted(int(level) for level in np.unique(self.level))
+        stacked = pd.DataFrame(
+            {col: np.tile(values[col].to_numpy(dtype=float), len(used)) for col in values.columns}
+        )
+        stacked["_level"] = np.repeat(used, n)
+        stacked["_group"] = np.concatenate([self.codes[level] for level in used])
+        ranks = stacked.groupby(["_level", "_group"], sort=False)[list(values.columns)].rank(pct=True)
+
+        slot = np.searchsorted(used, self.level)
+        picked = ranks.to_numpy()[slot * n + np.arange(n)]
+        return pd.DataFrame(picked, columns=values.columns, index=values.index)
@@ -0,0 +1,148 @@
+"""Diagnostic figures, rendered from persisted artifacts in worker processes.
+
+Each figure is a small function that receives pyplot, seaborn, the output
+path, and the (already reduced) data it plots. :func:`render_figures` fans the
+figures out over a process pool; matplotlib and seaborn are only imported
+inside the renderers, with the non-interactive Agg backend, so runs that skip
+the plots stage never load them.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+import pandas as pd
+
+
+def _pyplot() -> Tuple[Any, Any]:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    return plt, sns
+
+
+# ---------------------------------------------------------------------------
+# Figures
+# ---------------------------------------------------------------------------
+
+
+def missing_overall(plt: Any, sns: Any, path: Path, plot_missing: pd.Series) -> None:
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x=plot_missing.values, y=plot_missing.index, color="#1f77b4")
+    plt.xlabel("Share Missing")
+    plt.ylabel("Column")
+    plt.title("Overall Missingness by Column")
+    plt.tight_layout()
+    plt.savefig(path, dpi=200)
+    plt.close()
+
+
+def missing_by_state(plt: Any, sns: Any, path: Path, missing: pd.DataFrame) -> None:
+    plt.figure(figsize=(8, 4))
+    missing.plot(kind="bar", figsize=(12, 6))
+    plt.ylabel("Share Missing")
+    plt.title("Missingness by State")
+    plt.legend(title="State")
+    plt.tight_layout()
+    plt.savefig(path, dpi=200)
+    plt.close()
+
+
+def umap_state_scatter(plt: Any, sns: Any, path: Path, embedding_df: pd.DataFrame) -> None:
+    plt.figure(figsize=(10, 7))
+    sns.scatterplot(
+        data=embedding_df,
+        x="umap_x",
+        y="umap_y",
+        hue="state",
+        s=12,
+        alpha=0.6,
+    )
+    plt.title("UMAP Embedding by State")
+    plt.tight_layout()
+    plt.savefig(path, dpi=250)
+    plt.close()
+
+
+def umap_complaints(plt: Any, sns: Any, path: Path, scatter_df: pd.DataFrame) -> None:
+    plt.figure(figsize=(10, 7))
+    sns.scatterplot(
+        data=scatter_df,
+        x="umap_x",
+        y="umap_y",
+        hue="complaint_count",
+        palette="viridis",
+        s=12,
+        alpha=0.65,
+    )
+    plt.title("Complaints Across UMAP Embedding")
+    plt.tight_layout()
+    plt.savefig(path, dpi=250)
+    plt.close()
+
+
+def service_confidence_hist(plt: Any, sns: Any, path: Path, service_confidence: pd.Series) -> None:
+    plt.figure(figsize=(6, 4))
+    sns.histplot(service_confidence, bins=30, color="#ff7f0e")
+    plt.xlabel("Service Confidence")
+    plt.ylabel("Facilities")
+    plt.title("Distribution of Service Confidence Scores")
+    plt.tight_layout()
+    plt.savefig(path, dpi=200)
+    plt.close()
+
+
+FIGURES: Dict[str, Callable[..., None]] = {
+    "missing_overall.png": missing_overall,
+    "missing_by_state.png": missing_by_state,
+    "umap_state_scatter.png": umap_state_scatter,
+    "umap_complaints.png": umap_complaints,
+    "service_confidence_hist.png": service_confidence_hist,
+}
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+
+def figure_jobs(
+    column_profile: Dict[str, Any],
+    features: pd.DataFrame,
+    embedding: pd.DataFrame,
+    scores: pd.DataFrame,
+) -> Dict[str, Any]:
+    """Data for every figure, keyed by filename and reduced up front so workers get little."""
+    plot_missing = (1.0 - pd.Series(column_profile["coverage"])).sort_values(ascending=False)
+    scatter_df = embedding.assign(complaint_count=features["complaint_count"].fillna(0))
+    return {
+        "missing_overall.png": plot_missing,
+        "missing_by_state.png": pd.DataFrame(column_profile["state_missing"]),
+        "umap_state_scatter.png": embedding,
+        "umap_complaints.png": scatter_df,
+        "service_confidence_hist.png": scores["service_confidence"],
+    }
+
+
+def _render(filename: str, path: str, data: Any) -> str:
+    plt, sns = _pyplot()
+    FIGURES[filename](plt, sns, Path(path), data)
+    return path
+
+
+def render_figures(data_dir: Path, jobs: Dict[str, Any], workers: int = 0) -> None:
+    """Render each ``{filename: data}`` job into ``data_dir``, in parallel when workers allow."""
+    args = [(filename, str(data_dir / filename), data) for filename, data in jobs.items()]
+    workers = min(workers or os.cpu_count() or 1, len(args))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render, *zip(*args)))
+    else:
+        for job in args:
+            _render(*job)
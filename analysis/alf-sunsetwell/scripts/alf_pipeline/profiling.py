@@ -0,0 +1,180 @@
+"""Mergeable one-pass accumulators for the profiling and feature statistics.
+
+:class:`ProfileAccumulator` consumes the combined table one chunk at a time
+(or all at once) and tracks row counts, per-column and per-state missingness,
+license counts per state, and count/mean/variance/min/max of every numeric
+column. Per-chunk moments come from pandas and are merged with Chan et al.'s
+parallel update, so a single chunk reproduces pandas' mean/std exactly and
+accumulators built from separate chunks or states can be merged in any order.
+Quartiles are not mergeable; they are taken one column at a time at the end.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import pandas as pd
+
+from .config import NUMERIC_COLS
+
+
+DESCRIBE_QUANTILES = (0.25, 0.5, 0.75)
+
+
+@dataclass
+class NumericMoments:
+    count: int = 0
+    mean: float = math.nan
+    var: float = math.nan
+    min: float = math.nan
+    max: float = math.nan
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "NumericMoments":
+        series = series.dropna()
+        count = len(series)
+        if count == 0:
+            return cls()
+        return cls(
+            count=count,
+            mean=float(series.mean()),
+            var=float(series.var()),
+            min=float(series.min()),
+            max=float(series.max()),
+        )
+
+    def _m2(self) -> float:
+        return self.var * (self.count - 1) if self.count > 1 else 0.0
+
+    def merge(self, other: "NumericMoments") -> "NumericMoments":
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self._m2() + other._m2() + delta * delta * self.count * other.count / count
+        return NumericMoments(
+            count=count,
+            mean=mean,
+            var=m2 / (count - 1),
+            min=min(self.min, other.min),
+            max=max(self.max, other.max),
+        )
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var) if self.count > 1 else math.nan
+
+
+@dataclass
+class ProfileAccumulator:
+    numeric_cols: Sequence[str] = field(default_factory=lambda: list(NUMERIC_COLS))
+    rows: int = 0
+    columns: List[str] = field(default_factory=list)
+    missing: Dict[str, int] = field(default_factory=dict)
+    state_rows: Dict[str, int] = field(default_factory=dict)
+    state_missing: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    state_licenses: Dict[str, int] = field(default_factory=dict)
+    moments: Dict[str, NumericMoments] = field(default_factory=dict)
+
+    def update(self, chunk: pd.DataFrame) -> "ProfileAccumulator":
+        """Fold one chunk of the combined table into the running totals."""
+        for col in chunk.columns:
+            if col not in self.missing:
+                self.columns.append(col)
+                self.missing[col] = 0
+        self.rows += len(chunk)
+
+        isna = chunk.isna()
+        for col, count in isna.sum().items():
+            self.missing[col] += int(count)
+
+        state = chunk["state"].astype(str)
+        for value, frame in isna.groupby(state, sort=False):
+            per_state = self.state_missing.setdefault(value, {})
+            for col, count in frame.sum().items():
+                per_state[col] = per_state.get(col, 0) + int(count)
+            self.state_rows[value] = self.state_rows.get(value, 0) + len(frame)
+        for value, count in chunk.groupby(state, sort=False)["state_license_number"].count().items():
+            self.state_licenses[value] = self.state_licenses.get(value, 0) + int(count)
+
+        for col in self.numeric_cols:
+            if col in chunk.columns:
+                chunk_moments = NumericMoments.from_series(chunk[col])
+                self.moments[col] = self.moments.get(col, NumericMoments()).merge(chunk_moments)
+        return self
+
+    def merge(self, other: "ProfileAccumulator") -> "ProfileAccumulator":
+        for col in other.columns:
+            if col not in self.missing:
+                self.columns.append(col)
+                self.missing[col] = 0
+            self.missing[col] += other.missing[col]
+        self.rows += other.rows
+        for state, count in other.state_rows.items():
+            self.state_rows[state] = self.state_rows.get(state, 0) + count
+            per_state = self.state_missing.setdefault(state, {})
+            for col, missing in other.state_missing[state].items():
+                per_state[col] = per_state.get(col, 0) + missing
+        for state, count in other.state_licenses.items():
+            self.state_licenses[state] = self.state_licenses.get(state, 0) + count
+        for col, moments in other.moments.items():
+            self.moments[col] = self.moments.get(col, NumericMoments()).merge(moments)
+        return self
+
+    def finalize(self, column_reader: Callable[[str], pd.Series]) -> Dict[str, Any]:
+        """JSON-ready profile; ``column_reader`` loads one numeric column for its quartiles."""
+        coverage = {col: 1.0 - self.missing[col] / self.rows for col in self.columns}
+        state_missing = {
+            state: {
+                col: self.state_missing[state].get(col, self.state_rows[state]) / self.state_rows[state]
+                for col in self.columns
+            }
+            for state in sorted(self.state_rows)
+        }
+        numeric: Dict[str, Dict[str, float]] = {}
+        for col in self.numeric_cols:
+            if col not in self.moments:
+                continue
+            moments = self.moments[col]
+            quartiles = (
+                column_reader(col).quantile(list(DESCRIBE_QUANTILES)).tolist()
+                if moments.count
+                else [math.nan] * len(DESCRIBE_QUANTILES)
+            )
+            numeric[col] = {
+                "count": float(moments.count),
+                "mean": moments.mean,
+                "std": moments.std,
+                "min": moments.min,
+                **{f"{q:.0%}": value for q, value in zip(DESCRIBE_QUANTILES, quartiles)},
+                "max": moments.max,
+            }
+        return {
+            "rows": self.rows,
+            "coverage": coverage,
+            "state_missing": state_missing,
+            "state_counts": {state: self.state_licenses[state] for state in sorted(self.state_licenses)},
+            "numeric": numeric,
+        }
+
+
+def describe_frame(profile: Mapping[str, Any]) -> pd.DataFrame:
+    """``profile["numeric"]`` in the layout of ``DataFrame.describe().transpose()``."""
+    return pd.DataFrame.from_dict(profile["numeric"], orient="index")
+
+
+def feature_stats_from_profile(profile: Mapping[str, Any], feature_cols: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """The ``umap_feature_stats.json`` mean/std entries for ``feature_cols``."""
+    numeric = profile["numeric"]
+    return {col: {"mean": numeric[col]["mean"], "std": numeric[col]["std"]} for col in feature_cols}
+
+
+def profile_frame(frame: pd.DataFrame, numeric_cols: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Profile an in-memory table in one update."""
+    accumulator = ProfileAccumulator(numeric_cols=list(numeric_cols or NUMERIC_COLS)).update(frame)
+    return accumulator.finalize(lambda col: frame[col])
@@ -0,0 +1,171 @@
+"""One CPU budget for the whole run, split into processes and threads per stage.
+
+UMAP (numba), scikit-learn and BLAS-backed NumPy each size their own thread
+pools, and the process-pool stages add one worker per CPU on top of that. The
+runner instead gives every stage a :class:`StagePlan` drawn from
+``config.cpu_budget`` (0 = every CPU this process may use) and applies it
+while the stage runs: BLAS/OpenMP pools through ``threadpoolctl``, numba
+through ``numba.set_num_threads``, and the usual ``*_NUM_THREADS`` variables
+for worker processes started during the stage.
+
+Stages that fan out over a process pool declare the config field holding
+their worker count (``workers="bootstrap_workers"``); they get
+``min(field or budget, budget)`` processes with the leftover budget divided
+between them as threads. Every other stage runs one process with the whole
+budget as threads.
+
+``config.run_mode`` picks between two contracts:
+
+* ``"reproducible"`` (default) seeds UMAP with ``umap_random_state`` and pins
+  native thread pools to one thread, so reductions happen in a fixed order
+  and outputs are bit-stable across machines and budgets. Process pools still
+  use the budget; their results never depend on the worker count.
+* ``"fast"`` fits UMAP unseeded across the stage's threads and lets BLAS and
+  numba use them too. Embeddings (and everything downstream) differ between
+  runs.
+"""
+
+from __future__ import annotations
+
+import os
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+from .config import PipelineConfig
+
+try:
+    from threadpoolctl import threadpool_info, threadpool_limits
+except ImportError:  # optional; worker processes still read the environment variables
+    threadpool_info = threadpool_limits = None
+
+try:
+    import numba
+except ImportError:  # only needed to size UMAP's threads
+    numba = None
+
+# numba prefers TBB, whose pool hangs interpreter exit once a process pool has forked
+# after it started (GNU OpenMP is not fork-safe either); an explicit
+# NUMBA_THREADING_LAYER or NUMBA_THREADING_LAYER_PRIORITY still wins
+if (
+    numba is not None
+    and numba.config.THREADING_LAYER == "default"
+    and "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ
+):
+    numba.config.THREADING_LAYER_PRIORITY = ["workqueue", "omp", "tbb"]
+
+
+RUN_MODES = ("reproducible", "fast")
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+)
+
+
+@dataclass(frozen=True)
+class StagePlan:
+    """Share of the CPU budget one stage runs with."""
+
+    mode: str
+    processes: int
+    threads: int
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (the affinity mask where the OS exposes one)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def check_mode(config: PipelineConfig) -> str:
+    if config.run_mode not in RUN_MODES:
+        raise ValueError(f"Unknown run_mode '{config.run_mode}'; expected one of {', '.join(RUN_MODES)}")
+    return config.run_mode
+
+
+def cpu_budget(config: PipelineConfig) -> int:
+    return max(1, config.cpu_budget or available_cpus())
+
+
+def worker_count(config: PipelineConfig, requested: int = 0) -> int:
+    """Worker processes for a pool stage: ``requested`` (0 = the budget), capped by the budget."""
+    budget = cpu_budget(config)
+    return min(requested or budget, budget)
+
+
+def stage_plan(config: PipelineConfig, workers: Optional[str] = None) -> StagePlan:
+    """Processes and per-process threads for a stage (``workers`` names its worker-count field)."""
+    mode = check_mode(config)
+    budget = cpu_budget(config)
+    processes = worker_count(config, getattr(config, workers)) if workers else 1
+    threads = 1 if mode == "reproducible" else max(1, budget // processes)
+    return StagePlan(mode=mode, processes=processes, threads=threads)
+
+
+def umap_threads(config: PipelineConfig) -> int:
+    """``n_jobs`` for UMAP: the budget in fast mode; seeded UMAP is single-threaded anyway."""
+    if check_mode(config) != "fast":
+        return 1
+    budget = cpu_budget(config)
+    return min(budget, numba.config.NUMBA_NUM_THREADS) if numba is not None else budget
+
+
+@contextmanager
+def _environment(values: Dict[str, str]) -> Iterator[None]:
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@contextmanager
+def _numba_threads(threads: int) -> Iterator[None]:
+    if numba is None:
+        yield
+        return
+    previous = numba.get_num_threads()
+    numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+    try:
+        yield
+    finally:
+        numba.set_num_threads(previous)
+
+
+@contextmanager
+def apply_plan(plan: StagePlan) -> Iterator[StagePlan]:
+    """Limit native thread pools here and in worker processes started inside the block."""
+    with ExitStack() as stack:
+        stack.enter_context(_environment({name: str(plan.threads) for name in THREAD_ENV_VARS}))
+        if threadpool_limits is not None:
+            stack.enter_context(threadpool_limits(limits=plan.threads))
+        stack.enter_context(_numba_threads(plan.threads))
+        yield plan
+
+
+def runtime_summary(config: PipelineConfig) -> Dict[str, Any]:
+    """Mode, budget and native thread pools for the run report."""
+    summary: Dict[str, Any] = {
+        "mode": check_mode(config),
+        "cpu_budget": cpu_budget(config),
+        "available_cpus": available_cpus(),
+        "umap_seed": config.umap_random_state if config.run_mode == "reproducible" else None,
+        "umap_threads": umap_threads(config),
+    }
+    if threadpool_info is not None:
+        summary["thread_pools"] = [
+            {key: pool.get(key) for key in ("user_api", "internal_api", "version")}
+            for pool in threadpool_info()
+        ]
+    return summary
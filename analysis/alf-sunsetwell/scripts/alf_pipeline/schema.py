@@ -0,0 +1,91 @@
+"""Typed schema for the combined ALF table.
+
+State exports arrive as CSV text. Columns listed here are converted once, when
+the state file is read (numeric) or when the states are combined (categorical,
+date, boolean), so later stages never re-parse strings. Columns not listed
+stay as text.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Mapping, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+
+from .config import NUMERIC_COLS
+
+
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+DATE = "date"
+BOOLEAN = "boolean"
+
+# Sentinels the state processors use for missing values
+NA_SENTINELS = ["", "NA", "N/A", "None"]
+
+DATE_FORMAT = "%Y-%m-%d"
+
+COMBINED_SCHEMA: Dict[str, str] = {
+    **{col: NUMERIC for col in NUMERIC_COLS},
+    "state": CATEGORICAL,
+    "license_status": CATEGORICAL,
+    "provider_type": CATEGORICAL,
+    "facility_type_detail": CATEGORICAL,
+    "city": CATEGORICAL,
+    "county": CATEGORICAL,
+    "license_issue_date": DATE,
+    "license_expiration_date": DATE,
+    "last_updated_date": DATE,
+    "is_closed": BOOLEAN,
+}
+
+
+def columns_of_kind(kind: str, schema: Mapping[str, str] = COMBINED_SCHEMA) -> list:
+    return [col for col, col_kind in schema.items() if col_kind == kind]
+
+
+def coerce_numeric(df: pd.DataFrame, schema: Mapping[str, str] = COMBINED_SCHEMA) -> pd.DataFrame:
+    """Convert the schema's numeric columns present in ``df`` (per-state, before concat)."""
+    for col in columns_of_kind(NUMERIC, schema):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def apply_schema(
+    df: pd.DataFrame,
+    schema: Mapping[str, str] = COMBINED_SCHEMA,
+    categories: Optional[Mapping[str, Sequence[str]]] = None,
+) -> pd.DataFrame:
+    """Cast the combined table to the schema's dtypes in place and return it.
+
+    ``categories`` fixes the levels of categorical columns, so chunks cast
+    separately share one encoding; otherwise levels come from ``df``.
+    """
+    coerce_numeric(df, schema)
+    for col in columns_of_kind(CATEGORICAL, schema):
+        if col in df.columns:
+            if categories is not None and col in categories:
+                df[col] = pd.Categorical(df[col], categories=categories[col])
+            else:
+                df[col] = df[col].astype("category")
+    for col in columns_of_kind(DATE, schema):
+        # Columns parsed at ingest (``licensure.normalize_dates``) are kept as they are
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col].dtype):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in columns_of_kind(BOOLEAN, schema):
+        series = df[col] if col in df.columns else pd.Series(pd.NA, index=df.index)
+        df[col] = series.astype(str).str.lower().map({"true": True, "false": False}).astype("boolean")
+    return df
+
+
+def arrow_schema(columns: Sequence[str], schema: Mapping[str, str] = COMBINED_SCHEMA) -> pa.Schema:
+    """Fixed Arrow types for ``columns`` so independently cast chunks share one Parquet schema."""
+    types = {
+        NUMERIC: pa.float64(),
+        CATEGORICAL: pa.dictionary(pa.int32(), pa.string()),
+        DATE: pa.timestamp("us"),
+        BOOLEAN: pa.bool_(),
+    }
+    return pa.schema([(col, types.get(schema.get(col), pa.large_string())) for col in columns])
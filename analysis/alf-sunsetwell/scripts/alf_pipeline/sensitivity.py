@@ -0,0 +1,200 @@
+"""Batched weight-sensitivity analysis for the composite score.
+
+A :class:`WeightGrid` holds any number of component weightings, either one
+weight vector per grid point or one per group (e.g. per state). All grid
+points are evaluated against the facility component matrix as a single
+(grid × facility × component) NumPy computation, processed in grid chunks
+sized to ``max_bytes``. For each grid point the report gives the mean and 95th
+percentile absolute composite shift plus two rank-stability measures: Kendall
+tau against the baseline composite and top-decile churn.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.stats import kendalltau
+
+from .config import COMPONENT_COLS
+
+
+# Weight-vector order matches COMPONENT_COLS; labels match weight_sensitivity.csv
+WEIGHT_KEYS = ["reg", "service", "capacity", "licensure"]
+WEIGHT_LABELS = ["reg", "services", "capacity", "licensure"]
+
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+
+@dataclass
+class WeightGrid:
+    """Weight vectors of shape (grid, groups, component) plus a label table.
+
+    ``groups`` lists the group value each middle-axis slot applies to; ``None``
+    means a single national weighting applied to every facility.
+    """
+
+    weights: np.ndarray
+    labels: pd.DataFrame
+    groups: Optional[Sequence[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    @classmethod
+    def from_vectors(cls, vectors: np.ndarray, labels: Optional[pd.DataFrame] = None) -> "WeightGrid":
+        vectors = np.asarray(vectors, dtype=float).reshape(-1, len(COMPONENT_COLS))
+        if labels is None:
+            labels = pd.DataFrame(vectors, columns=WEIGHT_LABELS)
+        return cls(weights=vectors[:, np.newaxis, :], labels=labels.reset_index(drop=True))
+
+    @classmethod
+    def product(
+        cls,
+        reg_weights: Iterable[float],
+        service_weights: Iterable[float],
+        licensure_weight: float,
+    ) -> "WeightGrid":
+        """Cartesian reg × service grid; capacity takes the remainder and must stay positive."""
+        rows = []
+        for reg_weight in reg_weights:
+            for service_weight in service_weights:
+                cap_weight = 1.0 - (reg_weight + service_weight + licensure_weight)
+                if cap_weight <= 0:
+                    continue
+                rows.append((reg_weight, service_weight, cap_weight, licensure_weight))
+        return cls.from_vectors(np.array(rows, dtype=float))
+
+    @classmethod
+    def dirichlet(
+        cls,
+        base_weights: Mapping[str, float],
+        samples: int,
+        concentration: float,
+        seed: int,
+    ) -> "WeightGrid":
+        """Random weightings centred on ``base_weights`` (higher concentration = tighter)."""
+        alpha = concentration * np.array([base_weights[key] for key in WEIGHT_KEYS], dtype=float)
+        rng = np.random.default_rng(seed)
+        return cls.from_vectors(rng.dirichlet(alpha, size=samples))
+
+    @classmethod
+    def per_group(cls, grids: Mapping[str, "WeightGrid"]) -> "WeightGrid":
+        """Combine equally sized national grids into one grid with a weighting per group.
+
+        Grid point ``i`` applies ``grids[group]`` point ``i`` to that group's
+        facilities; label columns are prefixed with the group name.
+        """
+        sizes = {len(grid) for grid in grids.values()}
+        if len(sizes) != 1:
+            raise ValueError(f"per-group grids must have the same length, got {sorted(sizes)}")
+        groups = list(grids)
+        weights = np.concatenate([grids[group].weights for group in groups], axis=1)
+        labels = pd.concat(
+            [grids[group].labels.add_prefix(f"{group}_") for group in groups],
+            axis=1,
+        )
+        return cls(weights=weights, labels=labels, groups=groups)
+
+
+def composite_batch(
+    weights: np.ndarray,
+    group_index: np.ndarray,
+    components: np.ndarray,
+    modifiers: np.ndarray,
+) -> np.ndarray:
+    """Composites for a chunk of grid points, shape (grid, facility).
+
+    Effective weights are ``weights[g, group[f]] * modifiers[f]``; like the
+    scoring stage, a zero weight sum or a missing component yields 0.
+    """
+    effective = weights[:, group_index, :] * modifiers
+    weight_sum = effective.sum(axis=2)
+    weighted = np.einsum("gfc,fc->gf", effective, components)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        composite = weighted / np.where(weight_sum == 0, np.nan, weight_sum)
+    return np.where(np.isnan(composite), 0.0, composite)
+
+
+def top_mask(values: np.ndarray, k: int) -> np.ndarray:
+    """Boolean mask of the ``k`` largest entries along the last axis."""
+    mask = np.zeros(values.shape, dtype=bool)
+    if k <= 0:
+        return mask
+    top = np.argpartition(-values, k - 1, axis=-1)[..., :k]
+    np.put_along_axis(mask, top, True, axis=-1)
+    return mask
+
+
+def evaluate_grid(
+    grid: WeightGrid,
+    components: np.ndarray,
+    modifiers: np.ndarray,
+    baseline: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    tau_sample: Optional[int] = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Composite-shift and rank-stability metrics for every grid point.
+
+    ``components`` and ``modifiers`` are (facility × component) arrays;
+    ``modifiers`` scales each facility's weights (e.g. reg availability and
+    service confidence). ``groups`` gives each facility's group for per-group
+    grids. Kendall tau is computed on a fixed random sample of ``tau_sample``
+    facilities when the cohort is larger.
+    """
+    n_rows = len(components)
+    if grid.groups is None:
+        group_index = np.zeros(n_rows, dtype=np.intp)
+    else:
+        if groups is None:
+            raise ValueError("a per-group grid needs each facility's group")
+        lookup = {group: position for position, group in enumerate(grid.groups)}
+        unknown = sorted(set(pd.unique(groups)) - set(lookup))
+        if unknown:
+            raise ValueError(f"no weights for groups {unknown}")
+        group_index = pd.Series(groups).map(lookup).to_numpy(dtype=np.intp)
+
+    tau_rows = np.arange(n_rows)
+    if tau_sample is not None and n_rows > tau_sample:
+        tau_rows = np.sort(np.random.default_rng(seed).choice(n_rows, size=tau_sample, replace=False))
+    decile = int(np.ceil(n_rows / 10))
+    baseline_top = top_mask(baseline, decile)
+
+    # The (chunk × facility × component) effective-weight block dominates memory
+    per_point = max(n_rows * components.shape[1] * 8 * 2, 1)
+    chunk = max(1, int(max_bytes // per_point))
+
+    avg_change, p95_change, tau, churn = [], [], [], []
+    for start in range(0, len(grid), chunk):
+        composite = composite_batch(grid.weights[start : start + chunk], group_index, components, modifiers)
+        delta = np.abs(composite - baseline)
+        avg_change.append(delta.mean(axis=1))
+        p95_change.append(np.quantile(delta, 0.95, axis=1))
+        overlap = (top_mask(composite, decile) & baseline_top).sum(axis=1)
+        churn.append(1.0 - overlap / decile if decile else np.zeros(len(composite)))
+        tau.append([kendalltau(baseline[tau_rows], row[tau_rows]).statistic for row in composite])
+
+    report = grid.labels.copy()
+    report["avg_change"] = np.concatenate(avg_change) if avg_change else []
+    report["p95_change"] = np.concatenate(p95_change) if p95_change else []
+    report["kendall_tau"] = np.concatenate(tau) if tau else []
+    report["top_decile_churn"] = np.concatenate(churn) if churn else []
+    return report
+
+
+def score_inputs(scores: pd.DataFrame) -> tuple:
+    """Component matrix and per-facility weight modifiers from the scores table."""
+    components = scores[COMPONENT_COLS].to_numpy(dtype=float)
+    modifiers = np.column_stack(
+        [
+            scores["reg_available"].to_numpy(dtype=float),
+            scores["service_confidence"].to_numpy(dtype=float),
+            np.ones(len(scores)),
+            np.ones(len(scores)),
+        ]
+    )
+    return components, modifiers
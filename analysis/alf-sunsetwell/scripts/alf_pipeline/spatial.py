@@ -0,0 +1,159 @@
+"""Geographic neighbors and density features from facility coordinates.
+
+Geocoded facilities (finite, in-range ``latitude``/``longitude``) are placed
+on the unit sphere as 3-D vectors and indexed with a Euclidean
+:class:`~sklearn.neighbors.KDTree`. The chord between two points is monotone
+in their great-circle distance, so neighbors and radius counts are exactly
+those a haversine BallTree would give, without trigonometry per distance.
+Every feature is a batched tree query over all facilities at once:
+
+* ``within_<r>mi`` counts other facilities within each radius
+  (``query_radius(count_only=True)``);
+* the k nearest facilities give the serving neighbor table and
+  ``nearest_facility_miles``;
+* ``nearest_better_miles`` is the distance to the closest facility with a
+  strictly higher score. Ranking facilities by score turns "better than me"
+  into a prefix of the ranking, and any prefix is a union of at most one
+  aligned power-of-two block per level. Blocks of ``tail`` or more rows get
+  a tree each (built once, queried by every facility whose prefix uses it);
+  the remaining short tail of each prefix is searched with a vectorized
+  distance over a (facility × tail) gather. The result is exact.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+
+EARTH_RADIUS_MILES = 3958.8
+DEFAULT_LEAF_SIZE = 40
+DEFAULT_TAIL = 64
+TAIL_CHUNK_ROWS = 16384
+
+
+def geocoded_mask(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    with np.errstate(invalid="ignore"):
+        return (
+            np.isfinite(latitude)
+            & np.isfinite(longitude)
+            & (np.abs(latitude) <= 90)
+            & (np.abs(longitude) <= 180)
+        )
+
+
+def unit_vectors(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """(n × 3) points on the unit sphere for degree coordinates."""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_miles(chord: np.ndarray) -> np.ndarray:
+    """Great-circle miles for unit-sphere chord lengths (``inf`` stays ``inf``)."""
+    chord = np.asarray(chord, dtype=float)
+    with np.errstate(invalid="ignore"):
+        miles = 2 * np.arcsin(np.clip(chord / 2, 0.0, 1.0)) * EARTH_RADIUS_MILES
+    return np.where(np.isinf(chord), np.inf, miles)
+
+
+def miles_to_chord(miles: float) -> float:
+    return 2 * np.sin(min(miles / EARTH_RADIUS_MILES, np.pi) / 2)
+
+
+class GeoIndex:
+    """KD-tree over the geocoded subset of a facility table.
+
+    ``rows`` maps tree positions back to table rows; all distances returned
+    are in miles.
+    """
+
+    def __init__(self, latitude: np.ndarray, longitude: np.ndarray, leaf_size: int = DEFAULT_LEAF_SIZE) -> None:
+        self.rows = np.flatnonzero(geocoded_mask(latitude, longitude))
+        self.points = unit_vectors(
+            np.asarray(latitude, dtype=float)[self.rows], np.asarray(longitude, dtype=float)[self.rows]
+        )
+        self.leaf_size = leaf_size
+        self.tree = KDTree(self.points, leaf_size=leaf_size) if len(self.rows) else None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def counts_within(self, radii_miles: Sequence[float]) -> Dict[float, np.ndarray]:
+        """Other facilities within each radius, per geocoded facility."""
+        if self.tree is None:
+            return {radius: np.zeros(0, dtype=np.int64) for radius in radii_miles}
+        return {
+            radius: self.tree.query_radius(self.points, r=miles_to_chord(radius), count_only=True) - 1
+            for radius in radii_miles
+        }
+
+    def nearest(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """``(miles, positions)`` of each facility's k nearest other facilities (tree positions)."""
+        k = min(k, len(self) - 1)
+        if k < 1:
+            return np.empty((len(self), 0)), np.empty((len(self), 0), dtype=np.int64)
+        distances, positions = self.tree.query(self.points, k=k + 1)
+        # Drop each facility itself; with co-located facilities it need not come first
+        distances[positions == np.arange(len(self))[:, np.newaxis]] = np.inf
+        keep = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, keep, axis=1)
+        positions = np.take_along_axis(positions, keep, axis=1)
+        return chord_to_miles(distances), positions
+
+    def nearest_better(self, scores: np.ndarray, tail: int = DEFAULT_TAIL) -> Tuple[np.ndarray, np.ndarray]:
+        """``(miles, position)`` of the nearest facility with a strictly higher score.
+
+        ``scores`` align with tree positions; facilities with no better one
+        (and NaN scores, which rank last) get ``inf`` and position -1.
+        """
+        n = len(self)
+        scores = np.where(np.isnan(scores), -np.inf, np.asarray(scores, dtype=float))
+        order = np.argsort(-scores, kind="stable")
+        ranked_points = self.points[order]
+        # Facilities strictly better than each one form the ranking prefix [0, prefix)
+        prefix = np.searchsorted(-scores[order], -scores, side="left")
+
+        best = np.full(n, np.inf)
+        best_rank = np.full(n, -1, dtype=np.int64)
+        tail = 1 << max(0, int(tail - 1).bit_length())
+        tail_bits = tail.bit_length() - 1
+
+        # Short tail of each prefix: [prefix rounded down to a multiple of tail, prefix)
+        base = prefix & ~(tail - 1)
+        offsets = np.arange(tail)
+        for start in range(0, n, TAIL_CHUNK_ROWS):
+            rows = slice(start, min(start + TAIL_CHUNK_ROWS, n))
+            candidates = base[rows, np.newaxis] + offsets
+            valid = candidates < prefix[rows, np.newaxis]
+            candidates = np.where(valid, candidates, 0)
+            chords = np.linalg.norm(ranked_points[candidates] - self.points[rows, np.newaxis], axis=2)
+            distances = np.where(valid, chords, np.inf)
+            pick = np.argmin(distances, axis=1)
+            best[rows] = distances[np.arange(len(pick)), pick]
+            best_rank[rows] = np.where(np.isfinite(best[rows]), candidates[np.arange(len(pick)), pick], -1)
+
+        # Aligned blocks [start, start + 2**level) for every set bit of prefix at or above the tail
+        for level in range(tail_bits, max(n.bit_length(), tail_bits)):
+            queries = np.flatnonzero((prefix >> level) & 1)
+            if not len(queries):
+                continue
+            starts = (prefix[queries] >> (level + 1)) << (level + 1)
+            perm = np.argsort(starts, kind="stable")
+            grouped, sorted_starts = queries[perm], starts[perm]
+            blocks = np.unique(sorted_starts)
+            bounds = np.append(np.searchsorted(sorted_starts, blocks), len(queries))
+            for block_start, lo, hi in zip(blocks, bounds[:-1], bounds[1:]):
+                members = grouped[lo:hi]
+                block_points = ranked_points[block_start : block_start + (1 << level)]
+                tree = KDTree(block_points, leaf_size=self.leaf_size)
+                distances, positions = tree.query(self.points[members], k=1)
+                closer = distances[:, 0] < best[members]
+                best[members[closer]] = distances[closer, 0]
+                best_rank[members[closer]] = block_start + positions[closer, 0]
+
+        positions = np.where(best_rank >= 0, order[np.maximum(best_rank, 0)], -1)
+        return chord_to_miles(best), positions
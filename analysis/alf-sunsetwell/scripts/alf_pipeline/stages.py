@@ -0,0 +1,1282 @@
+"""Pipeline stages, one per section of the original rebuild script.
+
+Every stage receives the shared :class:`PipelineConfig` plus its declared input
+artifacts as keyword arguments, writes its published files under
+``config.data_dir``, and returns its output artifacts for downstream stages.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .bootstrap import BootstrapInputs, bootstrap_intervals
+from .changeset import score_changeset
+from .config import (
+    COMPONENT_COLS,
+    FEATURE_COLS,
+    NUMERIC_COLS,
+    NUMERIC_OPTIONAL,
+    REG_COLS,
+    SERVICE_COLS,
+    Z_COLS,
+    PipelineConfig,
+)
+from .dag import Pipeline
+from .imputation import ImputationNeighbors, impute_services
+from .ingest import ingest_states
+from .frames import core_frame, footprint, table_footprint, write_core_table
+from .generalization import HOLDOUT_TABLE_COLS, FoldSettings, compare_fold, fold_arrays, fold_table, run_folds
+from .instrument import note, section
+from .leaderboard import (
+    assign_metros,
+    build_leaderboards,
+    grouped_boards,
+    load_metros,
+    metro_document,
+    metro_slug,
+    top_positions,
+)
+from .licensure import parse_report
+from .linkage import load_source, match_table
+from .matrices import write_matrices
+from .neighbors import NeighborIndex, refresh_index
+from .online import CAPACITY_COL, COMPOSITE_COL, ScoringReference
+from .peer_groups import CAPACITY_BAND, PeerGroups
+from .plots import FIGURES, figure_jobs, render_figures
+from .profiling import ProfileAccumulator, describe_frame, feature_stats_from_profile, profile_frame
+from .runtime import stage_plan, worker_count
+from .schema import CATEGORICAL, DATE_FORMAT, NUMERIC, apply_schema, arrow_schema, columns_of_kind
+from .sensitivity import WeightGrid, evaluate_grid, score_inputs
+from .spatial import GeoIndex
+from .store import TableWriter, publish_table
+from .umap_model import fit_embedding, incremental_embedding, model_fingerprint, scaler_stats, umap_params
+from .utils import (
+    column_union,
+    composite_scores,
+    ensure_columns,
+    display_path,
+    ordered_columns,
+    percentile_scores,
+    reg_component,
+    row_keys,
+    service_component,
+    tenure_score,
+    zscore,
+)
+from .versions import evaluate_versions, load_weight_file, score_versions
+
+
+PIPELINE = Pipeline()
+# Skipped by a default refresh (too costly to run every time); run when selected by name
+OPT_IN_STAGES = ("generalization",)
+
+
+def _previous_header(config: PipelineConfig) -> List[str]:
+    previous_path = config.previous_combined_path()
+    return ordered_columns(previous_path, [])
+
+
+def _linkage_sources(config: PipelineConfig) -> List[List[Any]]:
+    return [[str(path), path.stat().st_size, path.stat().st_mtime_ns] for path in config.linkage_sources]
+
+
+def _score_version_files(config: PipelineConfig) -> List[List[Any]]:
+    return [[str(path), path.stat().st_size, path.stat().st_mtime_ns] for path in config.score_version_files]
+
+
+def _metro_definitions(config: PipelineConfig) -> Optional[List[Any]]:
+    path = config.metro_definitions
+    return [str(path), path.stat().st_size, path.stat().st_mtime_ns] if path.exists() else None
+
+
+def _previous_scores(config: PipelineConfig) -> Optional[List[Any]]:
+    previous_path = config.previous_scores_path()
+    if previous_path is None:
+        return None
+    stat = previous_path.stat()
+    return [previous_path.name, stat.st_size, stat.st_mtime_ns]
+
+
+# ---------------------------------------------------------------------------
+# 1. Load and combine state data
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "ingest",
+    outputs=("state_manifest",),
+    params=("state_codes",),
+    workers="ingest_workers",
+    cached=False,
+)
+def ingest(config: PipelineConfig) -> Dict[str, Any]:
+    """Normalize the latest processed licensing export for each state (parallel, cached)."""
+    return {"state_manifest": ingest_states(config)}
+
+
+# ---------------------------------------------------------------------------
+# 2–3. Numeric conversions and combined dataset
+# ---------------------------------------------------------------------------
+
+
+def _finish_combined(
+    combined: pd.DataFrame,
+    categories: Optional[Dict[str, List[str]]] = None,
+) -> pd.DataFrame:
+    # Preserve license numbers as strings
+    combined["state_license_number"] = (
+        combined["state_license_number"].astype(str).str.strip().replace("", np.nan)
+    )
+    combined["state"] = combined["state"].astype(str).str.upper()
+
+    # Numeric columns were coerced per state at load; cast the rest of the schema
+    return apply_schema(combined, categories=categories)
+
+
+def _category_levels(state_manifest: Dict[str, Dict[str, Any]], target_order: List[str]) -> Dict[str, List[str]]:
+    """Sorted levels of each categorical column across all states (what a full-table cast yields)."""
+    levels: Dict[str, set] = {col: set() for col in columns_of_kind(CATEGORICAL) if col in target_order}
+    for entry in state_manifest.values():
+        present = [col for col in levels if col in entry["columns"]]
+        frame = _finish_combined(
+            pd.read_parquet(entry["frame"], columns=present).reindex(columns=["state_license_number", *levels])
+        )
+        for col in levels:
+            levels[col].update(frame[col].dropna().astype(str))
+    return {col: sorted(values) for col, values in levels.items()}
+
+
+def _stream_combined(
+    config: PipelineConfig,
+    state_manifest: Dict[str, Dict[str, Any]],
+    target_order: List[str],
+) -> Dict[str, Any]:
+    """Write the combined table chunk by chunk, profiling it on the way through, then its core projection."""
+    accumulator = ProfileAccumulator()
+    categories = _category_levels(state_manifest, target_order)
+    # Concatenating states with missing values promotes numeric columns to float; match that per chunk
+    float_cols = {col: "float64" for col in columns_of_kind(NUMERIC) if col in target_order}
+    with TableWriter(
+        config,
+        config.combined_filename,
+        arrow_schema(target_order),
+        date_format=DATE_FORMAT,
+    ) as writer:
+        for entry in state_manifest.values():
+            state_file = pq.ParquetFile(entry["frame"])
+            for batch in state_file.iter_batches(batch_size=config.stream_chunk_rows):
+                chunk = _finish_combined(batch.to_pandas().reindex(columns=target_order), categories)
+                chunk = chunk.astype(float_cols)
+                writer.write(chunk)
+                accumulator.update(chunk)
+
+    combined = writer.table
+    profile = accumulator.finalize(lambda col: combined.read([col])[col])
+    # Later stages get the compact core, still read lazily from Parquet
+    core = write_core_table(combined, config.stream_dir / "combined_core.parquet", config.stream_chunk_rows)
+    note("memory_footprint", table_footprint(combined, core))
+    return {"combined": core, "column_profile": profile}
+
+
+@PIPELINE.stage(
+    "combine",
+    inputs=("state_manifest",),
+    outputs=("combined", "column_profile"),
+    params=("stream_chunk_rows",),
+    files=(
+        "{state_file_prefix}_{run_stamp}.csv",
+        "{state_file_prefix}_{run_stamp}.parquet",
+        "date_parse_report.csv",
+        "date_parse_report.parquet",
+    ),
+    fingerprint=_previous_header,
+)
+def combine(config: PipelineConfig, state_manifest: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge the cached per-state frames, cast to the schema, and write the combined table."""
+    # The column union comes from the manifest, so frames are read already aligned.
+    # Guarantee expected numeric columns are present.
+    union_cols = column_union(
+        ensure_columns(entry["columns"], REG_COLS + SERVICE_COLS + NUMERIC_OPTIONAL)
+        for entry in state_manifest.values()
+    )
+    target_order = ordered_columns(config.previous_combined_path(), union_cols)
+
+    config.data_dir.mkdir(parents=True, exist_ok=True)
+    combined_output_path = config.data_dir / config.combined_filename
+    if config.stream_chunk_rows:
+        outputs = _stream_combined(config, state_manifest, target_order)
+    else:
+        combined = pd.concat(
+            [pd.read_parquet(entry["frame"]).reindex(columns=target_order) for entry in state_manifest.values()],
+            ignore_index=True,
+            sort=False,
+        )
+        _finish_combined(combined)
+        publish_table(config, combined, config.combined_filename, index=False, date_format=DATE_FORMAT)
+        profile = profile_frame(combined)
+        # Later stages get the compact core; free text stays in the published files
+        core = core_frame(combined)
+        note("memory_footprint", footprint(combined, core))
+        outputs = {"combined": core, "column_profile": profile}
+    print(f"Combined dataset written to {display_path(combined_output_path)}")
+
+    # Date formats were detected and parsed per state at ingest
+    date_report = parse_report({state: entry["dates"] for state, entry in state_manifest.items()})
+    publish_table(config, date_report, "date_parse_report.csv", index=False)
+    note("date_failure_rates", date_report.groupby("state")["failure_rate"].max().to_dict())
+
+    return outputs
+
+
+# ---------------------------------------------------------------------------
+# 4. Profiling diagnostics
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "profile",
+    inputs=("column_profile",),
+    params=("run_day",),
+    files=(
+        "profiling_metrics.json",
+        "profiling_numeric.csv",
+        "profiling_summary.md",
+    ),
+)
+def profile(config: PipelineConfig, column_profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Coverage and numeric summaries from the combine-time profile."""
+    data_dir = config.data_dir
+    overall_coverage = pd.Series(column_profile["coverage"]).to_frame(name="coverage")
+    overall_coverage.to_json(data_dir / "profiling_metrics.json", orient="index", indent=2)
+
+    numeric_summary = describe_frame(column_profile)
+    numeric_summary.to_csv(data_dir / "profiling_numeric.csv")
+
+    state_counts = column_profile["state_counts"]
+
+    with open(data_dir / "profiling_summary.md", "w", encoding="utf-8") as fh:
+        fh.write(f"# SunsetWell Intake Snapshot — {config.run_date.date()}\n\n")
+        fh.write("## Facility Counts by State\n")
+        for state, count in state_counts.items():
+            fh.write(f"- {state}: {count:,} facilities\n")
+        fh.write("\n## Field Coverage (non-null ratios)\n")
+        for col, row in overall_coverage["coverage"].items():
+            fh.write(f"- {col}: {row:.3f}\n")
+
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# 5. Feature stats, z-scores, and UMAP embedding
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "features",
+    inputs=("combined", "column_profile"),
+    columns={"combined": ["state", "state_license_number", "facility_name", *FEATURE_COLS]},
+    outputs=("features", "feature_stats"),
+    params=(
+        "umap_mode",
+        "umap_n_neighbors",
+        "umap_min_dist",
+        "umap_random_state",
+        "run_mode",
+        "umap_drift_threshold",
+    ),
+    files=(
+        "umap_feature_stats.json",
+        "umap_feature_stats_current.json",
+        "umap_features.csv",
+        "umap_features.parquet",
+        "umap_missing_mask.csv",
+    ),
+    fingerprint=model_fingerprint,
+)
+def features(config: PipelineConfig, combined: pd.DataFrame, column_profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Standardize the modeling features and write the UMAP feature table.
+
+    Incremental UMAP mode standardizes with the saved model's scaler while it
+    still applies, so the published z-scores are the ones the embedding uses.
+    """
+    data_dir = config.data_dir
+    # Counts arrive as float32; the modeling table is float64
+    feature_frame = combined[["state", "state_license_number", "facility_name"] + FEATURE_COLS].astype(
+        {col: "float64" for col in FEATURE_COLS}
+    )
+
+    # Mean/std were accumulated while combining; no second pass over the columns
+    current_stats = feature_stats_from_profile(column_profile, FEATURE_COLS)
+    feature_stats = scaler_stats(config, current_stats)
+    feature_frame = feature_frame.assign(
+        **{f"{col}_z": zscore(feature_frame[col], feature_stats[col]) for col in FEATURE_COLS}
+    )
+
+    # Persist the scaler in use, and this cohort's own stats (the same unless a saved scaler is kept)
+    with open(data_dir / "umap_feature_stats.json", "w", encoding="utf-8") as fh:
+        json.dump(feature_stats, fh, indent=2)
+    with open(data_dir / "umap_feature_stats_current.json", "w", encoding="utf-8") as fh:
+        json.dump(current_stats, fh, indent=2)
+
+    publish_table(config, feature_frame, "umap_features.csv", index=False)
+
+    # Missing mask for diagnostics
+    reg_missing = feature_frame[REG_COLS].isna().all(axis=1)
+    service_missing = feature_frame[SERVICE_COLS].isna().all(axis=1)
+    pd.DataFrame(
+        {
+            "state_license_number": feature_frame["state_license_number"],
+            "state": feature_frame["state"],
+            "reg_missing": reg_missing,
+            "service_missing": service_missing,
+        }
+    ).to_csv(data_dir / "umap_missing_mask.csv", index=False)
+
+    return {"features": feature_frame, "feature_stats": feature_stats}
+
+
+@PIPELINE.stage(
+    "umap",
+    inputs=("features", "feature_stats"),
+    outputs=("embedding",),
+    params=(
+        "umap_n_neighbors",
+        "umap_min_dist",
+        "umap_random_state",
+        "run_mode",
+        "umap_mode",
+        "umap_refit_fraction",
+        "umap_drift_threshold",
+    ),
+    files=("umap_embedding.csv", "umap_embedding.parquet"),
+    fingerprint=model_fingerprint,
+)
+def umap(
+    config: PipelineConfig,
+    features: pd.DataFrame,
+    feature_stats: Dict[str, Dict[str, float]],
+) -> Dict[str, Any]:
+    """Fit (or incrementally update) the UMAP embedding over the z-scored features."""
+    with section("fit"):
+        if config.umap_mode == "incremental":
+            embedding = incremental_embedding(config, features, feature_stats)
+        else:
+            _, embedding = fit_embedding(config, features[Z_COLS].to_numpy())
+
+    embedding_df = pd.DataFrame(
+        {
+            "umap_x": embedding[:, 0],
+            "umap_y": embedding[:, 1],
+            "state": features["state"],
+            "state_license_number": features["state_license_number"],
+        }
+    )
+    publish_table(config, embedding_df, "umap_embedding.csv", index=False)
+
+    return {"embedding": embedding_df}
+
+
+# ---------------------------------------------------------------------------
+# 6. Neighbor index, peer facilities, and k-NN service imputations
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "neighbors",
+    inputs=("embedding",),
+    outputs=("neighbor_index",),
+    params=(
+        "umap_mode",
+        "neighbor_backend",
+        "neighbor_trees",
+        "neighbor_leaf_size",
+        "neighbor_seed",
+        "neighbor_rebuild_fraction",
+    ),
+    files=("neighbor_index/manifest.json",),
+)
+def neighbors(config: PipelineConfig, embedding: pd.DataFrame) -> Dict[str, Any]:
+    """Build (or extend) the persistent neighbor index over the UMAP embedding."""
+    index = refresh_index(config, row_keys(embedding), embedding[["umap_x", "umap_y"]].to_numpy())
+    return {"neighbor_index": index}
+
+
+@PIPELINE.stage(
+    "peers",
+    inputs=("neighbor_index", "features"),
+    columns={"features": ["state", "state_license_number", "facility_name"]},
+    params=("peer_count", "knn_chunk_size"),
+    files=("facility_peers.csv", "facility_peers.parquet"),
+)
+def peers(config: PipelineConfig, neighbor_index: NeighborIndex, features: pd.DataFrame) -> Dict[str, Any]:
+    """Most similar facilities in UMAP space, one row per (facility, peer)."""
+    rows = neighbor_index.positions(row_keys(features).tolist())
+    peer_count = min(config.peer_count, len(rows) - 1)
+    distances, ids = neighbor_index.query(
+        neighbor_index.points[rows], peer_count + 1, chunk_size=config.knn_chunk_size
+    )
+
+    # Drop each facility itself (or the farthest hit when duplicates pushed it out)
+    drop = ids == rows[:, np.newaxis]
+    drop[~drop.any(axis=1), -1] = True
+    keep = np.argsort(drop, axis=1, kind="stable")[:, :peer_count]
+    distances = np.take_along_axis(distances, keep, axis=1)
+    ids = np.take_along_axis(ids, keep, axis=1)
+
+    facility_of = np.empty(len(neighbor_index), dtype=np.int64)
+    facility_of[rows] = np.arange(len(rows))
+    source = np.repeat(np.arange(len(rows)), peer_count)
+    target = facility_of[ids.ravel()]
+    facility_peers = pd.DataFrame(
+        {
+            "state": features["state"].to_numpy()[source],
+            "state_license_number": features["state_license_number"].to_numpy()[source],
+            "facility_name": features["facility_name"].to_numpy()[source],
+            "peer_rank": np.tile(np.arange(1, peer_count + 1), len(rows)),
+            "peer_state": features["state"].to_numpy()[target],
+            "peer_state_license_number": features["state_license_number"].to_numpy()[target],
+            "peer_facility_name": features["facility_name"].to_numpy()[target],
+            "umap_distance": distances.ravel(),
+        }
+    )
+    publish_table(config, facility_peers, "facility_peers.csv", index=False)
+    return {}
+
+
+@PIPELINE.stage(
+    "impute",
+    inputs=("features", "embedding", "neighbor_index"),
+    outputs=("service_imputations", "final_service", "imputation_neighbors"),
+    columns={
+        "features": ["state", "state_license_number", *SERVICE_COLS],
+        "embedding": ["umap_x", "umap_y"],
+    },
+    params=("knn_neighbors",),
+    files=("service_imputations.csv", "service_imputations.parquet"),
+)
+def impute(
+    config: PipelineConfig,
+    features: pd.DataFrame,
+    embedding: pd.DataFrame,
+    neighbor_index: NeighborIndex,
+) -> Dict[str, Any]:
+    """Impute missing service counts from their UMAP neighbors."""
+    coords = embedding[["umap_x", "umap_y"]].to_numpy()
+    imputation_neighbors = ImputationNeighbors.empty(len(SERVICE_COLS))
+    imputed, service_confidence, _ = impute_services(
+        coords,
+        features[SERVICE_COLS].to_numpy(dtype=float),
+        n_neighbors=config.knn_neighbors,
+        chunk_size=config.knn_chunk_size,
+        index=neighbor_index,
+        index_rows=neighbor_index.positions(row_keys(features).tolist()),
+        neighbors=imputation_neighbors,
+    )
+
+    service_imputations = pd.DataFrame(
+        imputed,
+        columns=[f"{col}_imputed" for col in SERVICE_COLS],
+    )
+    service_imputations.insert(0, "state_license_number", features["state_license_number"])
+    service_imputations["imputation_confidence"] = service_confidence
+    publish_table(config, service_imputations, "service_imputations.csv", index=False)
+
+    # Final service values (observed where available, else imputed)
+    final_service = features[SERVICE_COLS].copy()
+    for col in SERVICE_COLS:
+        imputed_col = f"{col}_imputed"
+        final_service[col] = features[col].fillna(service_imputations[imputed_col])
+
+    return {
+        "service_imputations": service_imputations,
+        "final_service": final_service,
+        "imputation_neighbors": imputation_neighbors,
+    }
+
+
+# ---------------------------------------------------------------------------
+# 7. Score computation
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "score",
+    inputs=("combined", "final_service", "service_imputations", "imputation_neighbors"),
+    outputs=("scores",),
+    columns={
+        "combined": [
+            "state",
+            "state_license_number",
+            "facility_name",
+            "licensed_capacity",
+            "license_issue_date",
+            "license_status",
+            *REG_COLS,
+        ],
+        "service_imputations": ["imputation_confidence"],
+    },
+    params=(
+        "base_weights",
+        "run_day",
+        "bootstrap_replicates",
+        "bootstrap_level",
+        "bootstrap_concentration",
+        "bootstrap_seed",
+    ),
+    files=("alf_scores_v1.csv", "alf_scores_v1.parquet"),
+    workers="bootstrap_workers",
+)
+def score(
+    config: PipelineConfig,
+    combined: pd.DataFrame,
+    final_service: pd.DataFrame,
+    service_imputations: pd.DataFrame,
+    imputation_neighbors: ImputationNeighbors,
+) -> Dict[str, Any]:
+    """Percentile components, the confidence-weighted composite and its bootstrap intervals."""
+    reg_available = combined[REG_COLS].notna().any(axis=1)
+
+    reg_ranks = combined[REG_COLS].rank(pct=True)
+    reg_score = reg_component(reg_ranks, reg_available)
+
+    service_ranks = final_service.rank(pct=True)
+    service_score = service_component(service_ranks)
+
+    capacity_percentile = percentile_scores(combined["licensed_capacity"])
+    capacity_score = capacity_percentile.fillna(0.5)
+
+    licensure_score = tenure_score(combined["license_issue_date"], combined["license_status"], config.run_date)
+
+    service_confidence_series = service_imputations["imputation_confidence"]
+
+    component_matrix = pd.DataFrame(
+        {
+            "reg_score": reg_score,
+            "service_score": service_score,
+            "capacity_score": capacity_score,
+            "licensure_score": licensure_score,
+        }
+    )
+
+    effective_weights, composite_raw = composite_scores(
+        component_matrix, reg_available, service_confidence_series, config.base_weights
+    )
+    sunsetwell_percentile = composite_raw.rank(pct=True)
+
+    scores_df = pd.DataFrame(
+        {
+            "state": combined["state"],
+            "state_license_number": combined["state_license_number"],
+            "facility_name": combined["facility_name"],
+            "sunsetwell_percentile": sunsetwell_percentile,
+            "composite_raw": composite_raw,
+            "reg_score": component_matrix["reg_score"],
+            "service_score": component_matrix["service_score"],
+            "capacity_score": component_matrix["capacity_score"],
+            "licensure_score": component_matrix["licensure_score"],
+            **effective_weights.to_dict(orient="series"),
+            "service_confidence": service_confidence_series,
+            "reg_available": reg_available,
+        }
+    )
+
+    if config.bootstrap_replicates > 0:
+        bootstrap_inputs = BootstrapInputs.build(
+            component_matrix.to_numpy(dtype=float),
+            reg_available.to_numpy(dtype=float),
+            final_service.to_numpy(dtype=float),
+            service_confidence_series.to_numpy(dtype=float),
+            imputation_neighbors,
+        )
+        with section("bootstrap"):
+            intervals = bootstrap_intervals(
+                bootstrap_inputs,
+                config.base_weights,
+                replicates=config.bootstrap_replicates,
+                level=config.bootstrap_level,
+                concentration=config.bootstrap_concentration,
+                seed=config.bootstrap_seed,
+                workers=worker_count(config, config.bootstrap_workers),
+            )
+        scores_df = pd.concat([scores_df, intervals.set_axis(scores_df.index)], axis=1)
+
+    publish_table(config, scores_df, "alf_scores_v1.csv", index=False)
+
+    return {"scores": scores_df}
+
+
+@PIPELINE.stage(
+    "scoring_reference",
+    inputs=("combined", "final_service", "features", "embedding", "scores"),
+    columns={
+        "combined": [CAPACITY_COL, *REG_COLS],
+        "features": SERVICE_COLS,
+        "embedding": ["state", "state_license_number", "umap_x", "umap_y"],
+        "scores": [COMPOSITE_COL],
+    },
+    params=("base_weights", "run_day", "knn_neighbors"),
+    files=(
+        "scoring_reference/manifest.json",
+        "scoring_reference/distributions.npz",
+        "scoring_reference/imputation_index.npz",
+        "scoring_reference/embedding.parquet",
+    ),
+)
+def scoring_reference(
+    config: PipelineConfig,
+    combined: pd.DataFrame,
+    final_service: pd.DataFrame,
+    features: pd.DataFrame,
+    embedding: pd.DataFrame,
+    scores: pd.DataFrame,
+) -> Dict[str, Any]:
+    """Freeze the percentile distributions and imputation index for online scoring."""
+    ScoringReference.build(config, combined, final_service, features, embedding, scores).save(
+        config.scoring_reference_dir
+    )
+    return {}
+
+
+@PIPELINE.stage(
+    "matrices",
+    inputs=("features", "embedding", "final_service", "scores"),
+    columns={
+        "features": ["state", "state_license_number", "facility_name", *Z_COLS],
+        "embedding": ["umap_x", "umap_y"],
+        "scores": COMPONENT_COLS,
+    },
+    files=(
+        "matrices/manifest.json",
+        "matrices/rows.arrow",
+        "matrices/features_z.npy",
+        "matrices/embedding.npy",
+        "matrices/services.npy",
+        "matrices/components.npy",
+    ),
+)
+def matrices(
+    config: PipelineConfig,
+    features: pd.DataFrame,
+    embedding: pd.DataFrame,
+    final_service: pd.DataFrame,
+    scores: pd.DataFrame,
+) -> Dict[str, Any]:
+    """Row-aligned ``.npy`` matrices and an Arrow row index for memory-mapped reuse."""
+    rows = features[["state", "state_license_number", "facility_name"]].assign(row_key=row_keys(features))
+    manifest = write_matrices(
+        config.matrices_dir,
+        rows[["row_key", "state", "state_license_number", "facility_name"]],
+        {
+            "features_z": features[Z_COLS],
+            "embedding": embedding[["umap_x", "umap_y"]],
+            "services": final_service[SERVICE_COLS],
+            "components": scores[COMPONENT_COLS],
+        },
+    )
+    print(f"Matrices for {manifest['rows']} facilities written to {display_path(config.matrices_dir)}")
+    return {}
+
+
+@PIPELINE.stage(
+    "peer_scores",
+    inputs=("combined", "final_service", "scores"),
+    columns={
+        "combined": lambda config: [
+            "state",
+            "state_license_number",
+            "facility_name",
+            "licensed_capacity",
+            *REG_COLS,
+            *(key for key in config.peer_group_keys if key != CAPACITY_BAND),
+        ],
+        "scores": [
+            "sunsetwell_percentile",
+            "composite_raw",
+            *COMPONENT_COLS,
+            "service_confidence",
+            "reg_available",
+        ],
+    },
+    params=("base_weights", "peer_group_keys", "peer_capacity_bands", "peer_min_group_size"),
+    files=("alf_peer_scores.csv", "alf_peer_scores.parquet"),
+)
+def peer_scores(
+    config: PipelineConfig,
+    combined: pd.DataFrame,
+    final_service: pd.DataFrame,
+    scores: pd.DataFrame,
+) -> Dict[str, Any]:
+    """Component and composite percentiles within peer groups, next to the national ones."""
+    groups = PeerGroups.assign(
+        combined, config.peer_group_keys, config.peer_min_group_size, config.peer_capacity_bands
+    )
+    reg_available = scores["reg_available"].astype(bool)
+
+    ranks = groups.rank(pd.concat([combined[[*REG_COLS, "licensed_capacity"]], final_service], axis=1))
+    component_matrix = pd.DataFrame(
+        {
+            "reg_score": reg_component(ranks[REG_COLS], reg_available),
+            "service_score": service_component(ranks[SERVICE_COLS]),
+            "capacity_score": ranks["licensed_capacity"].fillna(0.5),
+            "licensure_score": scores["licensure_score"],
+        }
+    )
+    _, peer_composite = composite_scores(
+        component_matrix, reg_available, scores["service_confidence"], config.base_weights
+    )
+    peer_percentile = groups.rank(peer_composite.to_frame("composite"))["composite"]
+
+    peer_df = pd.DataFrame(
+        {
+            "state": combined["state"],
+            "state_license_number": combined["state_license_number"],
+            "facility_name": combined["facility_name"],
+            "peer_group": groups.labels,
+            "peer_level": groups.level,
+            "peer_group_size": groups.group_size,
+            "sunsetwell_percentile": scores["sunsetwell_percentile"],
+            "peer_percentile": peer_percentile,
+            "composite_raw": scores["composite_raw"],
+            "peer_composite_raw": peer_composite,
+            "reg_score": scores["reg_score"],
+            "peer_reg_score": component_matrix["reg_score"],
+            "service_score": scores["service_score"],
+            "peer_service_score": component_matrix["service_score"],
+            "capacity_score": scores["capacity_score"],
+            "peer_capacity_score": component_matrix["capacity_score"],
+            "licensure_score": scores["licensure_score"],
+        }
+    )
+    publish_table(config, peer_df, "alf_peer_scores.csv", index=False)
+
+    return {}
+
+
+@PIPELINE.stage(
+    "extremes",
+    inputs=("scores",),
+    params=("extremes_per_state", "prototype_top_n"),
+    files=("alf_scores_summary.csv", "score_extremes.csv", "prototype_scores.csv"),
+)
+def extremes(config: PipelineConfig, scores: pd.DataFrame) -> Dict[str, Any]:
+    """State summaries, per-state score extremes, and the prototype export."""
+    data_dir = config.data_dir
+
+    # Summary by state
+    summary = scores.groupby("state")["sunsetwell_percentile"].describe()
+    summary.to_csv(data_dir / "alf_scores_summary.csv")
+
+    # Score extremes: top and bottom N per state by partial selection, each list in overall rank order
+    percentile = scores["sunsetwell_percentile"].to_numpy(dtype=float)
+    boards = grouped_boards(pd.factorize(scores["state"])[0], percentile, config.extremes_per_state)
+    top_rows = boards.loc[boards["board"] == "top", "row"].to_numpy()
+    bottom_rows = boards.loc[boards["board"] == "bottom", "row"].to_numpy()
+    top_rows = top_rows[top_positions(percentile[top_rows], len(top_rows))]
+    bottom_rows = bottom_rows[top_positions(percentile[bottom_rows], len(bottom_rows), descending=False)]
+    score_extremes = scores.iloc[np.concatenate([top_rows, bottom_rows])]
+    score_extremes.to_csv(data_dir / "score_extremes.csv", index=False)
+
+    # Prototype export (top N overall)
+    scores.iloc[top_positions(percentile, config.prototype_top_n)][
+        ["state", "state_license_number", "facility_name", "sunsetwell_percentile", "reg_score", "service_score"]
+    ].to_csv(data_dir / "prototype_scores.csv", index=False)
+
+    return {}
+
+
+@PIPELINE.stage(
+    "leaderboards",
+    inputs=("combined", "scores"),
+    columns={
+        "combined": ["state", "county", "city"],
+        "scores": ["state_license_number", "facility_name", "sunsetwell_percentile", "composite_raw"],
+    },
+    params=("leaderboard_size", "high_performer_score"),
+    files=(
+        "alf_leaderboards.csv",
+        "alf_leaderboards.parquet",
+        "alf_leaderboard_groups.csv",
+        "alf_leaderboard_groups.parquet",
+        "alf_metros/index.json",
+    ),
+    fingerprint=_metro_definitions,
+)
+def leaderboards(config: PipelineConfig, combined: pd.DataFrame, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Ranked state, county and metro leaderboards plus metro aggregates for the web app."""
+    metros = load_metros(config.metro_definitions)
+    state = combined["state"].astype("string")
+    county = combined["county"].astype("string").str.strip().replace("", pd.NA)
+    metro = assign_metros(combined["city"], state, metros)
+
+    entries, aggregates = build_leaderboards(
+        scores,
+        {"state": (state, state), "county": (county, state), "metro": (metro, state)},
+        size=config.leaderboard_size,
+        high_performer_score=config.high_performer_score,
+    )
+    publish_table(config, entries, "alf_leaderboards.csv", index=False)
+    publish_table(config, aggregates, "alf_leaderboard_groups.csv", index=False)
+
+    # One file per listed metro in the data/metros/<slug>.json shape, including metros with no facilities
+    metro_dir = config.data_dir / "alf_metros"
+    metro_dir.mkdir(parents=True, exist_ok=True)
+    metro_boards = entries.loc[(entries["scope"] == "metro") & (entries["board"] == "top")]
+    metro_stats = aggregates.loc[aggregates["scope"] == "metro"].set_index("group")
+    index = []
+    for definition in metros:
+        slug = metro_slug(definition["name"])
+        aggregate = metro_stats.loc[slug].to_dict() if slug in metro_stats.index else {}
+        document = metro_document(
+            definition, aggregate, metro_boards.loc[metro_boards["group"] == slug], config.high_performer_score
+        )
+        with open(metro_dir / f"{slug}.json", "w", encoding="utf-8") as fh:
+            json.dump(document, fh, indent=2)
+        index.append({"slug": slug, **{key: document[key] for key in ("metro", "state", "count", "averageScore")}})
+    with open(metro_dir / "index.json", "w", encoding="utf-8") as fh:
+        json.dump(index, fh, indent=2)
+
+    covered = int(metro.notna().sum())
+    print(f"Leaderboards for {aggregates.groupby('scope').size().to_dict()} groups; {covered} facilities in listed metros")
+    note("leaderboard_groups", aggregates.groupby("scope").size().to_dict())
+    return {}
+
+
+@PIPELINE.stage(
+    "score_diff",
+    inputs=("scores",),
+    params=("diff_tolerances", "run_day"),
+    files=(
+        "score_changes.csv",
+        "score_changes.parquet",
+        "score_changes_summary.json",
+        "score_history/alf_scores_{run_stamp}.parquet",
+    ),
+    fingerprint=_previous_scores,
+)
+def score_diff(config: PipelineConfig, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Facilities inserted, removed or moved since the previous run's scores."""
+    previous_path = config.previous_scores_path()
+    previous = pd.read_parquet(previous_path) if previous_path else scores.iloc[:0]
+    changes, summary = score_changeset(
+        previous,
+        scores,
+        numeric_cols=["sunsetwell_percentile", "composite_raw", *COMPONENT_COLS, "service_confidence"],
+        label_cols=["facility_name"],
+        tolerances=config.diff_tolerances,
+    )
+    publish_table(config, changes, "score_changes.csv", index=False)
+
+    summary = {"run_date": config.run_day, "previous": previous_path.name if previous_path else None, **summary}
+    with open(config.data_dir / "score_changes_summary.json", "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+    note("score_changes", {key: summary[key] for key in ("previous", "inserted", "removed", "changed")})
+
+    config.score_history_dir.mkdir(parents=True, exist_ok=True)
+    scores.to_parquet(config.score_history_dir / config.scores_snapshot_filename, index=False)
+    print(
+        f"Score changes vs {summary['previous'] or 'empty baseline'}: "
+        f"{summary['inserted']} inserted, {summary['removed']} removed, {summary['changed']} changed"
+    )
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# 8. Diagnostics & sensitivity analysis
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "diagnostics",
+    inputs=("combined", "scores"),
+    columns={
+        "combined": ["state", "facility_type_detail", "provider_type"],
+        "scores": [
+            "state",
+            "sunsetwell_percentile",
+            "service_confidence",
+            "reg_score",
+            "service_score",
+            "capacity_score",
+        ],
+    },
+    files=("generalization_summary.csv", "generalization_report.json", "generalization_states.json"),
+)
+def diagnostics(config: PipelineConfig, combined: pd.DataFrame, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Per-state generalization summary and reports."""
+    data_dir = config.data_dir
+
+    # Generalization summary
+    generalization_summary = scores.groupby("state").agg(
+        mean_pct=("sunsetwell_percentile", "mean"),
+        var_pct=("sunsetwell_percentile", "var"),
+        mean_conf=("service_confidence", "mean"),
+    )
+    generalization_summary.to_csv(data_dir / "generalization_summary.csv")
+
+    generalization_report = [
+        {
+            "metric": "generalization_summary",
+            "data": generalization_summary.to_dict(),
+        }
+    ]
+
+    provider_mix = {
+        str(state): counts.value_counts().to_dict()
+        for state, counts in combined["provider_type"].astype(object).groupby(combined["state"].astype(str))
+    }
+    if provider_mix:
+        generalization_report.append(
+            {
+                "metric": "provider_mix",
+                "data": provider_mix,
+            }
+        )
+
+    with open(data_dir / "generalization_report.json", "w", encoding="utf-8") as fh:
+        json.dump(generalization_report, fh, indent=2)
+
+    # Per-state report (replaces the TX-only sample exports); holdout folds are in the generalization stage
+    states = scores["state"].astype(str)
+    service_type = combined["facility_type_detail"].astype(object).fillna(combined["provider_type"].astype(object))
+    reports = {}
+    for state in states.unique():
+        mask = (states == state).to_numpy()
+        state_scores = scores.loc[mask]
+        reports[state] = {
+            "facilities": int(mask.sum()),
+            "in_sample": {
+                "mean_pct": float(state_scores["sunsetwell_percentile"].mean()),
+                "var_pct": float(state_scores["sunsetwell_percentile"].var()),
+                "mean_conf": float(state_scores["service_confidence"].mean()),
+                "percentile_capacity_spearman": float(
+                    state_scores["sunsetwell_percentile"].corr(state_scores["capacity_score"], method="spearman")
+                ),
+            },
+            "components": state_scores[["reg_score", "service_score", "capacity_score"]].describe().to_dict(),
+            "service_types": service_type.loc[mask].value_counts().to_dict(),
+        }
+    with open(data_dir / "generalization_states.json", "w", encoding="utf-8") as fh:
+        json.dump(reports, fh, indent=2)
+
+    return {}
+
+
+@PIPELINE.stage(
+    "sensitivity",
+    inputs=("scores",),
+    columns={"scores": [*COMPONENT_COLS, "state", "composite_raw", "service_confidence", "reg_available"]},
+    params=(
+        "base_weights",
+        "sensitivity_grid",
+        "sensitivity_reg_weights",
+        "sensitivity_service_weights",
+        "sensitivity_samples",
+        "sensitivity_concentration",
+        "sensitivity_seed",
+        "sensitivity_tau_sample",
+    ),
+    files=("weight_sensitivity.csv",),
+)
+def sensitivity(config: PipelineConfig, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Composite shifts and rank stability under alternate component weightings."""
+    if config.sensitivity_grid == "dirichlet":
+        grid = WeightGrid.dirichlet(
+            config.base_weights,
+            samples=config.sensitivity_samples,
+            concentration=config.sensitivity_concentration,
+            seed=config.sensitivity_seed,
+        )
+    else:
+        grid = WeightGrid.product(
+            config.sensitivity_reg_weights,
+            config.sensitivity_service_weights,
+            config.base_weights["licensure"],
+        )
+
+    components, modifiers = score_inputs(scores)
+    report = evaluate_grid(
+        grid,
+        components,
+        modifiers,
+        baseline=scores["composite_raw"].to_numpy(dtype=float),
+        groups=scores["state"].astype(str).to_numpy(),
+        max_bytes=config.sensitivity_max_bytes,
+        tau_sample=config.sensitivity_tau_sample,
+        seed=config.sensitivity_seed,
+    )
+    report.to_csv(config.data_dir / "weight_sensitivity.csv", index=False)
+
+    return {}
+
+
+@PIPELINE.stage(
+    "compare_versions",
+    inputs=("scores",),
+    columns={
+        "scores": [
+            "state",
+            "state_license_number",
+            "facility_name",
+            *COMPONENT_COLS,
+            "service_confidence",
+            "reg_available",
+        ]
+    },
+    params=("base_weights", "version_top_n", "run_day"),
+    files=("alf_scores_versions.csv", "alf_scores_versions.parquet", "score_versions_evaluation.json"),
+    fingerprint=_score_version_files,
+)
+def compare_versions(config: PipelineConfig, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Composites and percentiles for every weight version, plus pairwise agreement."""
+    versions: Dict[str, Dict[str, float]] = {"base": dict(config.base_weights)}
+    sources: Dict[str, str] = {"base": "base_weights"}
+    for path in config.score_version_files:
+        name, weights = load_weight_file(path)
+        name = name if name not in versions else f"{name}_{len(versions) + 1}"
+        versions[name], sources[name] = weights, str(path)
+
+    components, modifiers = score_inputs(scores)
+    composites, percentiles = score_versions(versions, components, modifiers)
+
+    table = scores[["state", "state_license_number", "facility_name"]].copy()
+    for position, name in enumerate(versions):
+        table[f"composite_raw_{name}"] = composites[:, position]
+        table[f"sunsetwell_percentile_{name}"] = percentiles[:, position]
+    publish_table(config, table, "alf_scores_versions.csv", index=False)
+
+    evaluation = {
+        "run_date": config.run_day,
+        "versions": {name: {"source": sources[name], "weights": weights} for name, weights in versions.items()},
+        "pairs": evaluate_versions(list(versions), composites, percentiles, top_n=config.version_top_n),
+    }
+    with open(config.data_dir / "score_versions_evaluation.json", "w", encoding="utf-8") as fh:
+        json.dump(evaluation, fh, indent=2)
+    print(f"Scored {len(versions)} weight versions over {len(scores)} facilities")
+    return {}
+
+
+@PIPELINE.stage(
+    "generalization",
+    inputs=("features", "scores"),
+    columns={
+        "features": FEATURE_COLS,
+        "scores": [
+            "state",
+            "state_license_number",
+            "facility_name",
+            "sunsetwell_percentile",
+            "composite_raw",
+            *COMPONENT_COLS,
+            "service_confidence",
+        ],
+    },
+    params=(
+        "state_codes",
+        "holdout_states",
+        "umap_n_neighbors",
+        "umap_min_dist",
+        "umap_random_state",
+        "run_mode",
+        "knn_neighbors",
+        "base_weights",
+        "run_day",
+    ),
+    files=(
+        "generalization_holdout.csv",
+        "generalization_holdout.parquet",
+        "generalization_holdout_scores.csv",
+        "generalization_holdout_scores.parquet",
+    ),
+    workers="holdout_workers",
+)
+def generalization(config: PipelineConfig, features: pd.DataFrame, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Leave-one-state-out holdout scores against the in-sample run."""
+    codes, labels = pd.factorize(scores["state"].astype(str))
+    # A fold needs at least one other state to refit on
+    requested = config.holdout_states or tuple(config.state_codes.values())
+    holdout = [state for state in requested if state in labels] if len(labels) > 1 else []
+
+    plan = stage_plan(config, "holdout_workers")
+    settings = FoldSettings(
+        umap_params=umap_params(config),
+        knn_neighbors=config.knn_neighbors,
+        chunk_size=config.knn_chunk_size,
+        base_weights=dict(config.base_weights),
+        run_date=config.run_date.isoformat(),
+        threads=plan.threads,
+    )
+    print(f"Holding out {len(holdout)} state(s) on up to {plan.processes} worker(s) ({plan.mode})")
+    with section("folds"):
+        folds = run_folds(
+            fold_arrays(features, scores["licensure_score"], codes),
+            [int(labels.get_loc(state)) for state in holdout],
+            settings,
+            workers=plan.processes,
+        )
+
+    tables = {labels[fold["code"]]: fold_table(scores, fold) for fold in folds}
+    metrics = {labels[fold["code"]]: compare_fold(tables[labels[fold["code"]]], fold) for fold in folds}
+    holdout_df = pd.DataFrame.from_dict(metrics, orient="index").rename_axis("state").reset_index()
+    publish_table(config, holdout_df, "generalization_holdout.csv", index=False)
+    holdout_scores = (
+        pd.concat(tables.values(), ignore_index=True) if tables else pd.DataFrame(columns=HOLDOUT_TABLE_COLS)
+    )
+    publish_table(config, holdout_scores, "generalization_holdout_scores.csv", index=False)
+
+    for state, row in metrics.items():
+        print(
+            f"  {state}: spearman {row['spearman']:.3f}, mean shift {row['mean_shift']:+.3f}, "
+            f"confidence shift {row['confidence_shift']:+.3f}"
+        )
+    note("holdout_states", {state: round(row["spearman"], 4) for state, row in metrics.items()})
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# 9. Record linkage
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "link",
+    inputs=("combined",),
+    columns={
+        "combined": ["state", "state_license_number", "facility_name", "address", "city", "zip_code", "phone"],
+    },
+    params=("linkage_min_confidence", "linkage_max_block_pairs"),
+    files=("facility_links.csv", "facility_links.parquet", "linkage_report.json"),
+    fingerprint=_linkage_sources,
+    workers="linkage_workers",
+)
+def link(config: PipelineConfig, combined: pd.DataFrame) -> Dict[str, Any]:
+    """Link cohort facilities to records in other facility sources (CMS feeds, rosters)."""
+    sources: Dict[str, pd.DataFrame] = {}
+    for path in config.linkage_sources:
+        name = path.stem if path.stem not in sources else f"{path.stem}_{len(sources) + 1}"
+        sources[name] = load_source(path)
+    if not sources:
+        print("No linkage sources configured (--link-source); writing an empty match table")
+
+    links, report = match_table(
+        combined,
+        sources,
+        min_confidence=config.linkage_min_confidence,
+        max_block_pairs=config.linkage_max_block_pairs,
+        workers=worker_count(config, config.linkage_workers),
+    )
+    publish_table(config, links, "facility_links.csv", index=False)
+    with open(config.data_dir / "linkage_report.json", "w", encoding="utf-8") as fh:
+        json.dump({"min_confidence": config.linkage_min_confidence, "sources": report}, fh, indent=2)
+    for name, stats in report.items():
+        print(
+            f"Linked {stats['matched']} of {len(combined)} facilities to {name} "
+            f"({stats['records']} records, {stats['candidate_pairs']} candidate pairs)"
+        )
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# 10. Spatial features
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "spatial",
+    inputs=("combined", "scores"),
+    columns={
+        "combined": ["state", "state_license_number", "facility_name", "latitude", "longitude"],
+        "scores": ["sunsetwell_percentile"],
+    },
+    params=("spatial_radii_miles", "spatial_neighbors"),
+    files=(
+        "facility_geo_features.csv",
+        "facility_geo_features.parquet",
+        "facility_geo_neighbors.csv",
+        "facility_geo_neighbors.parquet",
+    ),
+)
+def spatial(config: PipelineConfig, combined: pd.DataFrame, scores: pd.DataFrame) -> Dict[str, Any]:
+    """Local density, nearest better-scored facility, and a nearest-facility table for serving."""
+    geo = GeoIndex(combined["latitude"].to_numpy(dtype=float), combined["longitude"].to_numpy(dtype=float))
+    rows = geo.rows
+    state = combined["state"].astype(str).to_numpy()
+    license_number = combined["state_license_number"].astype(str).to_numpy()
+    facility_name = combined["facility_name"].astype(str).to_numpy()
+    percentile = scores["sunsetwell_percentile"].to_numpy(dtype=float)
+
+    features = pd.DataFrame(
+        {"state": state, "state_license_number": license_number, "facility_name": facility_name}
+    )
+    features["geocoded"] = False
+    features.loc[rows, "geocoded"] = True
+    for radius, counts in geo.counts_within(config.spatial_radii_miles).items():
+        column = f"within_{radius:g}mi"
+        features[column] = pd.Series(counts, index=rows, dtype="Int64").reindex(features.index)
+
+    distances, positions = geo.nearest(config.spatial_neighbors)
+    nearest = distances[:, 0] if distances.shape[1] else np.full(len(rows), np.nan)
+    features["nearest_facility_miles"] = pd.Series(nearest, index=rows).reindex(features.index).round(3)
+
+    better_miles, better_position = geo.nearest_better(percentile[rows])
+    found = better_position >= 0
+    better_rows = rows[better_position[found]]
+    features["nearest_better_miles"] = (
+        pd.Series(better_miles[found], index=rows[found]).reindex(features.index).round(3)
+    )
+    features["nearest_better_state"] = pd.Series(state[better_rows], index=rows[found]).reindex(features.index)
+    features["nearest_better_state_license_number"] = pd.Series(
+        license_number[better_rows], index=rows[found]
+    ).reindex(features.index)
+    publish_table(config, features, "facility_geo_features.csv", index=False)
+
+    neighbor_count = distances.shape[1]
+    source = np.repeat(rows, neighbor_count)
+    target = rows[positions.ravel()]
+    geo_neighbors = pd.DataFrame(
+        {
+            "state": state[source],
+            "state_license_number": license_number[source],
+            "neighbor_rank": np.tile(np.arange(1, neighbor_count + 1), len(rows)),
+            "neighbor_state": state[target],
+            "neighbor_state_license_number": license_number[target],
+            "neighbor_facility_name": facility_name[target],
+            "distance_miles": distances.ravel().round(3),
+            "neighbor_percentile": percentile[target],
+        }
+    )
+    publish_table(config, geo_neighbors, "facility_geo_neighbors.csv", index=False)
+    print(f"Indexed {len(rows)} of {len(combined)} facilities with coordinates")
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# 11. Figures
+# ---------------------------------------------------------------------------
+
+
+@PIPELINE.stage(
+    "plots",
+    inputs=("column_profile", "features", "embedding", "scores"),
+    columns={"features": ["complaint_count"], "scores": ["service_confidence"]},
+    files=tuple(FIGURES),
+    workers="plot_workers",
+)
+def plots(
+    config: PipelineConfig,
+    column_profile: Dict[str, Any],
+    features: pd.DataFrame,
+    embedding: pd.DataFrame,
+    scores: pd.DataFrame,
+) -> Dict[str, Any]:
+    """Missingness, UMAP, and service-confidence figures, rendered in worker processes."""
+    render_figures(
+        config.data_dir,
+        figure_jobs(column_profile, features, embedding, scores),
+        workers=worker_count(config, config.plot_workers),
+    )
+    return {}
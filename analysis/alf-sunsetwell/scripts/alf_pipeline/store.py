@@ -0,0 +1,183 @@
+"""Columnar artifact storage for stage outputs and published tables.
+
+DataFrames are stored as Parquet (including dicts of frames, one file per
+key), NumPy arrays as ``.npy``, JSON-compatible values as JSON, and anything
+else falls back to pickle. Parquet reads accept a column projection so a
+stage only materializes the columns it declared. A :class:`ParquetTable` is a
+table that was streamed to disk; it is cached as a copy of the file and only
+read when (and as far as) a consumer projects it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import PipelineConfig
+
+
+FORMAT_PARQUET = "parquet"
+FORMAT_PARQUET_DICT = "parquet_dict"
+FORMAT_NPY = "npy"
+FORMAT_JSON = "json"
+FORMAT_PICKLE = "pickle"
+
+
+@dataclass(frozen=True)
+class ParquetTable:
+    """A table already written to a Parquet file, read lazily with projection."""
+
+    path: Path
+
+    def read(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        return pd.read_parquet(self.path, columns=_projection(columns))
+
+
+def _is_json_value(value: Any) -> bool:
+    """True when ``value`` survives a JSON round trip unchanged (str keys only)."""
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json_value(v) for k, v in value.items())
+    if isinstance(value, list):
+        return all(_is_json_value(v) for v in value)
+    return value is None or isinstance(value, (str, bool, int, float))
+
+
+def artifact_format(value: Any) -> str:
+    if isinstance(value, (pd.DataFrame, ParquetTable)):
+        return FORMAT_PARQUET
+    if isinstance(value, dict) and value and all(isinstance(v, pd.DataFrame) for v in value.values()):
+        return FORMAT_PARQUET_DICT
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return FORMAT_NPY
+    if isinstance(value, (dict, list)) and _is_json_value(value):
+        return FORMAT_JSON
+    return FORMAT_PICKLE
+
+
+def save_artifact(directory: Path, name: str, value: Any) -> str:
+    """Write ``value`` under ``directory`` and return the format used."""
+    fmt = artifact_format(value)
+    if fmt == FORMAT_PARQUET and isinstance(value, ParquetTable):
+        shutil.copyfile(value.path, directory / f"{name}.parquet")
+    elif fmt == FORMAT_PARQUET:
+        value.to_parquet(directory / f"{name}.parquet")
+    elif fmt == FORMAT_PARQUET_DICT:
+        frame_dir = directory / name
+        frame_dir.mkdir()
+        keys = list(value)
+        for position, frame in enumerate(value.values()):
+            frame.to_parquet(frame_dir / f"{position:04d}.parquet")
+        with open(frame_dir / "keys.json", "w", encoding="utf-8") as fh:
+            json.dump(keys, fh)
+    elif fmt == FORMAT_NPY:
+        np.save(directory / f"{name}.npy", value, allow_pickle=False)
+    elif fmt == FORMAT_JSON:
+        with open(directory / f"{name}.json", "w", encoding="utf-8") as fh:
+            json.dump(value, fh)
+    else:
+        with open(directory / f"{name}.pkl", "wb") as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    return fmt
+
+
+def load_artifact(
+    directory: Path,
+    name: str,
+    fmt: str,
+    columns: Optional[Sequence[str]] = None,
+) -> Any:
+    """Read an artifact written by :func:`save_artifact`, projecting Parquet columns."""
+    if fmt == FORMAT_PARQUET:
+        return pd.read_parquet(directory / f"{name}.parquet", columns=_projection(columns))
+    if fmt == FORMAT_PARQUET_DICT:
+        frame_dir = directory / name
+        with open(frame_dir / "keys.json", encoding="utf-8") as fh:
+            keys = json.load(fh)
+        return {
+            key: pd.read_parquet(frame_dir / f"{position:04d}.parquet", columns=_projection(columns))
+            for position, key in enumerate(keys)
+        }
+    if fmt == FORMAT_NPY:
+        return np.load(directory / f"{name}.npy", allow_pickle=False)
+    if fmt == FORMAT_JSON:
+        with open(directory / f"{name}.json", encoding="utf-8") as fh:
+            return json.load(fh)
+    with open(directory / f"{name}.pkl", "rb") as fh:
+        return pickle.load(fh)
+
+
+def _projection(columns: Optional[Sequence[str]]) -> Optional[list]:
+    return list(columns) if columns is not None else None
+
+
+def project(value: Any, columns: Optional[Sequence[str]]) -> Any:
+    """Apply a column projection to an in-memory artifact."""
+    if isinstance(value, ParquetTable):
+        return value.read(columns)
+    if columns is None:
+        return value
+    if isinstance(value, pd.DataFrame):
+        return value[list(columns)]
+    if isinstance(value, dict):
+        return {key: project(frame, columns) for key, frame in value.items()}
+    return value
+
+
+def publish_table(config: PipelineConfig, frame: pd.DataFrame, filename: str, **csv_kwargs: Any) -> None:
+    """Write a published table as Parquet for the pipeline and CSV for the web import path."""
+    csv_path = config.data_dir / filename
+    frame.to_parquet(csv_path.with_suffix(".parquet"), index=csv_kwargs.get("index", True))
+    frame.to_csv(csv_path, **csv_kwargs)
+
+
+class TableWriter:
+    """Append chunks to a published table's CSV and Parquet files.
+
+    The streaming counterpart of :func:`publish_table`: chunks are cast to
+    ``schema`` so the Parquet row groups line up, and the CSV header is only
+    written with the first chunk.
+    """
+
+    def __init__(self, config: PipelineConfig, filename: str, schema: pa.Schema, **csv_kwargs: Any) -> None:
+        self.csv_path = config.data_dir / filename
+        self.parquet_path = self.csv_path.with_suffix(".parquet")
+        self.schema = schema
+        self.csv_kwargs = {**csv_kwargs, "index": False}
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._tmp_csv = self.csv_path.with_name(self.csv_path.name + ".tmp")
+        self._tmp_parquet = self.parquet_path.with_name(self.parquet_path.name + ".tmp")
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+        first = self._writer is None
+        if first:
+            self._writer = pq.ParquetWriter(self._tmp_parquet, table.schema)
+        self._writer.write_table(table)
+        chunk.to_csv(self._tmp_csv, mode="w" if first else "a", header=first, **self.csv_kwargs)
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if exc_type is None and self._writer is not None:
+            os.replace(self._tmp_parquet, self.parquet_path)
+            os.replace(self._tmp_csv, self.csv_path)
+        else:
+            for tmp in (self._tmp_parquet, self._tmp_csv):
+                tmp.unlink(missing_ok=True)
+
+    @property
+    def table(self) -> ParquetTable:
+        return ParquetTable(self.parquet_path)
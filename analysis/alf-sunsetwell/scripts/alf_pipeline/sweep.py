@@ -0,0 +1,243 @@
+"""Held-out imputation accuracy across a grid of UMAP and k-NN settings.
+
+A share of the facilities with fully observed services in the holdout state
+(FL, the only state reporting them today) is masked: their service values
+become NaN and their service z-scores take the "missing" value 0, exactly as
+an unreported facility looks to the features stage. For every
+``(umap_n_neighbors, min_dist)`` pair UMAP is refit on the masked features,
+and every ``knn_neighbors`` value re-imputes the masked facilities from the
+remaining donors with :func:`~.imputation.impute_services`.
+
+Each setting is scored on
+
+* ``nmae``: mean absolute error per service, divided by the donors' standard
+  deviation of that service, averaged over services and facilities;
+* ``calibration_mae``: mean gap between the imputation confidence
+  (``service_confidence_from_dist``, ``1 / (1 + mean distance)``) and the same
+  transform of the facility's normalized error, ``1 / (1 + error)``;
+* ``confidence_error_spearman``: rank correlation of confidence with error
+  (negative when confident imputations really are the accurate ones).
+
+The table is ranked by ``nmae`` with ``calibration_mae`` breaking ties.
+
+UMAP's fuzzy graph starts from the same k-nearest-neighbor graph for every
+``min_dist``, so that graph is computed once per ``n_neighbors`` (in parallel)
+and cached as ``knn_<key>.npz`` under the sweep cache directory, keyed by the
+masked input, ``n_neighbors`` and seed; each fit passes it to UMAP as
+``precomputed_knn``. Below :data:`UMAP_EXACT_ROWS` rows UMAP computes exact
+pairwise distances instead of a kNN graph, so small cohorts fit without one.
+Fits run in a process pool; workers read the masked input from one ``.npy``
+file by memory map.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+from sklearn.utils import check_random_state
+from umap import UMAP
+from umap.umap_ import nearest_neighbors
+
+from .config import SERVICE_COLS, Z_COLS
+from .dag import content_hash
+from .imputation import impute_services
+
+
+# UMAP's fit switches from exact pairwise distances to an approximate kNN graph at this size
+UMAP_EXACT_ROWS = 4096
+SERVICE_Z_COLS = [f"{col}_z" for col in SERVICE_COLS]
+RESULT_COLS = [
+    "rank",
+    "umap_n_neighbors",
+    "umap_min_dist",
+    "knn_neighbors",
+    "nmae",
+    "calibration_mae",
+    "confidence_error_spearman",
+    "mean_confidence",
+    *[f"mae_{col}" for col in SERVICE_COLS],
+    "fit_seconds",
+]
+
+
+@dataclass
+class Holdout:
+    """Masked sweep inputs, saved once and shared with every worker."""
+
+    umap_input: np.ndarray
+    services: np.ndarray
+    rows: np.ndarray
+    truth: np.ndarray
+    scale: np.ndarray
+
+    def save(self, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "umap_input.npy", self.umap_input)
+        np.savez(directory / "holdout.npz", services=self.services, rows=self.rows, truth=self.truth, scale=self.scale)
+        return directory
+
+    @classmethod
+    def load(cls, directory: Path) -> "Holdout":
+        with np.load(directory / "holdout.npz") as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(umap_input=np.load(directory / "umap_input.npy", mmap_mode="r"), **arrays)
+
+
+def make_holdout(features: pd.DataFrame, state: str, share: float, seed: int) -> Holdout:
+    """Mask ``share`` of ``state``'s facilities with every service observed."""
+    services = features[SERVICE_COLS].to_numpy(dtype=float, copy=True)
+    eligible = np.flatnonzero((features["state"].astype(str) == state).to_numpy() & ~np.isnan(services).any(axis=1))
+    count = int(round(len(eligible) * share))
+    if count < 1:
+        raise ValueError(f"No {state} facilities with observed services to hold out (share {share})")
+    rows = np.sort(np.random.default_rng(seed).choice(eligible, size=count, replace=False))
+
+    truth = services[rows].copy()
+    services[rows] = np.nan
+    umap_input = features[Z_COLS].to_numpy(dtype=float, copy=True)
+    umap_input[np.ix_(rows, [Z_COLS.index(col) for col in SERVICE_Z_COLS])] = 0.0
+    donors = ~np.isnan(services).any(axis=1)
+    scale = np.nanstd(services[donors], axis=0)
+    return Holdout(
+        umap_input=np.ascontiguousarray(umap_input),
+        services=services,
+        rows=rows,
+        truth=truth,
+        scale=np.where(scale > 0, scale, 1.0),
+    )
+
+
+def score_imputation(holdout: Holdout, predicted: np.ndarray, confidence: np.ndarray) -> Dict[str, float]:
+    """Error and calibration metrics for the held-out rows."""
+    absolute = np.abs(predicted - holdout.truth)
+    error = (absolute / holdout.scale).mean(axis=1)
+    agreement = spearmanr(confidence, error).statistic if np.ptp(confidence) > 0 and np.ptp(error) > 0 else np.nan
+    return {
+        "nmae": float(error.mean()),
+        "calibration_mae": float(np.abs(confidence - 1.0 / (1.0 + error)).mean()),
+        "confidence_error_spearman": float(agreement),
+        "mean_confidence": float(confidence.mean()),
+        **{f"mae_{col}": float(value) for col, value in zip(SERVICE_COLS, absolute.mean(axis=0))},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Shared kNN graphs and worker tasks
+# ---------------------------------------------------------------------------
+
+
+def graph_path(directory: Path, input_key: str, n_neighbors: int, seed: Optional[int]) -> Path:
+    return directory / f"knn_{content_hash([input_key, n_neighbors, seed])[:16]}.npz"
+
+
+def _build_graph(workdir: str, path: str, n_neighbors: int, seed: Optional[int], threads: int) -> str:
+    if not os.path.exists(path):
+        indices, distances, _ = nearest_neighbors(
+            Holdout.load(Path(workdir)).umap_input,
+            n_neighbors,
+            "euclidean",
+            {},
+            False,
+            check_random_state(seed),
+            n_jobs=threads,
+        )
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, indices=indices, distances=distances)
+        os.replace(tmp, path)
+    return path
+
+
+def _fit_and_score(
+    workdir: str,
+    graph: Optional[str],
+    n_neighbors: int,
+    min_dist: float,
+    knn_grid: Sequence[int],
+    seed: Optional[int],
+    threads: int,
+    chunk_size: int,
+) -> List[Dict[str, Any]]:
+    holdout = Holdout.load(Path(workdir))
+    started = time.perf_counter()
+    precomputed = (None, None, None)
+    if graph is not None:
+        with np.load(graph) as data:
+            precomputed = (data["indices"], data["distances"], None)
+    reducer = UMAP(
+        n_neighbors=n_neighbors,
+        min_dist=min_dist,
+        metric="euclidean",
+        random_state=seed,
+        n_jobs=threads,
+        precomputed_knn=precomputed,
+    )
+    embedding = reducer.fit_transform(np.asarray(holdout.umap_input))
+    fit_seconds = time.perf_counter() - started
+
+    results = []
+    for knn in knn_grid:
+        imputed, confidence, _ = impute_services(embedding, holdout.services, n_neighbors=knn, chunk_size=chunk_size)
+        results.append(
+            {
+                "umap_n_neighbors": n_neighbors,
+                "umap_min_dist": min_dist,
+                "knn_neighbors": knn,
+                **score_imputation(holdout, imputed[holdout.rows], confidence[holdout.rows]),
+                "fit_seconds": round(fit_seconds, 3),
+            }
+        )
+    return results
+
+
+def _run(pool: Optional[ProcessPoolExecutor], func: Any, jobs: List[Tuple[Any, ...]]) -> List[Any]:
+    if pool is None:
+        return [func(*job) for job in jobs]
+    return list(pool.map(func, *zip(*jobs))) if jobs else []
+
+
+def run_sweep(
+    holdout: Holdout,
+    workdir: Path,
+    umap_neighbors: Sequence[int],
+    min_dists: Sequence[float],
+    knn_neighbors: Sequence[int],
+    seed: Optional[int],
+    workers: int = 1,
+    threads: int = 1,
+    chunk_size: int = 8192,
+) -> pd.DataFrame:
+    """Ranked results, one row per ``(umap_n_neighbors, umap_min_dist, knn_neighbors)``."""
+    holdout.save(workdir)
+    input_key = content_hash(np.asarray(holdout.umap_input))
+    graphs: Dict[int, Optional[str]] = {n: None for n in umap_neighbors}
+    graph_jobs = []
+    if len(holdout.umap_input) >= UMAP_EXACT_ROWS:
+        for n in umap_neighbors:
+            graphs[n] = str(graph_path(workdir, input_key, n, seed))
+            graph_jobs.append((str(workdir), graphs[n], n, seed, threads))
+
+    fit_jobs = [
+        (str(workdir), graphs[n], n, min_dist, tuple(knn_neighbors), seed, threads, chunk_size)
+        for n, min_dist in itertools.product(umap_neighbors, min_dists)
+    ]
+    workers = max(1, min(workers, len(fit_jobs)))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        _run(pool, _build_graph, graph_jobs)
+        rows = [row for block in _run(pool, _fit_and_score, fit_jobs) for row in block]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    results = pd.DataFrame(rows).sort_values(["nmae", "calibration_mae"], kind="stable").reset_index(drop=True)
+    results.insert(0, "rank", np.arange(1, len(results) + 1))
+    return results[RESULT_COLS]
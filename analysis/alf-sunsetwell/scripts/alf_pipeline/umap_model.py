@@ -0,0 +1,234 @@
+"""UMAP fitting with an optional persisted, incrementally updated model.
+
+In ``refit`` mode the embedding is fit from scratch every run, exactly as the
+original script did. In ``incremental`` mode the fitted reducer, the feature
+scaler (``umap_feature_stats.json``), and a reference table of z-scored
+features and coordinates per facility are saved under ``umap_model/``. Later
+runs standardize with the frozen scaler, keep stored coordinates for
+facilities whose features did not change, and call ``transform`` only for new
+or changed facilities. A full refit is forced when the saved model is missing,
+its UMAP parameters differ, feature distributions drift past
+``umap_drift_threshold``, or more than ``umap_refit_fraction`` of the cohort
+needs transforming.
+
+The features stage standardizes with :func:`scaler_stats`: the saved scaler
+while the model still applies, so the published z-scores and
+``umap_feature_stats.json`` are the ones the embedding and imputation use.
+The cohort's own stats go to ``umap_feature_stats_current.json``; the saved
+scaler only changes when the model is refit.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import pickle
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from umap import UMAP
+
+from .config import FEATURE_COLS, Z_COLS, PipelineConfig
+from .dag import content_hash
+from .runtime import umap_threads
+from .utils import row_keys, zscore
+
+
+FeatureStats = Dict[str, Dict[str, float]]
+
+# z-scores closer than this are treated as unchanged between runs
+CHANGE_TOLERANCE = 1e-9
+
+
+def umap_params(config: PipelineConfig) -> Dict[str, Any]:
+    return {
+        "n_neighbors": config.umap_n_neighbors,
+        "min_dist": config.umap_min_dist,
+        "metric": "euclidean",
+        # Fast mode trades the fixed seed for UMAP's parallel optimizer
+        "random_state": config.umap_random_state if config.run_mode == "reproducible" else None,
+    }
+
+
+def fit_embedding(config: PipelineConfig, umap_input: np.ndarray) -> Tuple[UMAP, np.ndarray]:
+    umap_model = UMAP(**umap_params(config), n_jobs=umap_threads(config))
+    embedding = umap_model.fit_transform(umap_input)
+    return umap_model, embedding
+
+
+def frozen_zscores(features: pd.DataFrame, feature_stats: FeatureStats) -> np.ndarray:
+    return np.column_stack([zscore(features[col], feature_stats[col]).to_numpy() for col in FEATURE_COLS])
+
+
+def drift_score(frozen: FeatureStats, current: FeatureStats) -> float:
+    """Largest standardized mean shift or log std ratio across features."""
+    worst = 0.0
+    for col in FEATURE_COLS:
+        old, new = frozen.get(col), current.get(col)
+        if old is None or new is None:
+            return math.inf
+        old_std, new_std = old["std"], new["std"]
+        if any(math.isnan(v) for v in (old["mean"], new["mean"], old_std, new_std)):
+            if math.isnan(old_std) != math.isnan(new_std):
+                return math.inf
+            continue
+        if old_std <= 1e-9 or new_std <= 1e-9:
+            if (old_std <= 1e-9) != (new_std <= 1e-9):
+                return math.inf
+            continue
+        worst = max(worst, abs(new["mean"] - old["mean"]) / old_std, abs(math.log(new_std / old_std)))
+    return worst
+
+
+@dataclass
+class UmapBundle:
+    reducer: UMAP
+    feature_stats: FeatureStats
+    reference: pd.DataFrame
+    manifest: Dict[str, Any]
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["UmapBundle"]:
+        manifest_path = directory / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        with open(directory / "reducer.pkl", "rb") as fh:
+            reducer = pickle.load(fh)
+        with open(directory / "umap_feature_stats.json", encoding="utf-8") as fh:
+            feature_stats = json.load(fh)
+        reference = pd.read_parquet(directory / "reference.parquet")
+        return cls(reducer=reducer, feature_stats=feature_stats, reference=reference, manifest=manifest)
+
+    def save(self, directory: Path, reducer_changed: bool = True) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        if reducer_changed:
+            with open(directory / "reducer.pkl", "wb") as fh:
+                pickle.dump(self.reducer, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(directory / "umap_feature_stats.json", "w", encoding="utf-8") as fh:
+                json.dump(self.feature_stats, fh, indent=2)
+        self.reference.to_parquet(directory / "reference.parquet")
+        self.manifest["reference_hash"] = content_hash(self.reference)
+        with open(directory / "manifest.json", "w", encoding="utf-8") as fh:
+            json.dump(self.manifest, fh, indent=2)
+
+
+def model_fingerprint(config: PipelineConfig) -> Optional[str]:
+    """Identify the saved model state so the umap stage cache follows it."""
+    if config.umap_mode != "incremental":
+        return None
+    manifest_path = config.umap_model_dir / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    return f"{manifest.get('fitted_at')}:{manifest.get('reference_hash')}"
+
+
+def reference_frame(keys: pd.Series, z: np.ndarray, embedding: np.ndarray) -> pd.DataFrame:
+    reference = pd.DataFrame(z, columns=Z_COLS)
+    reference.insert(0, "row_key", keys.to_numpy())
+    reference["umap_x"] = embedding[:, 0]
+    reference["umap_y"] = embedding[:, 1]
+    return reference
+
+
+def _scaler_reason(
+    config: PipelineConfig,
+    manifest: Dict[str, Any],
+    frozen: FeatureStats,
+    feature_stats: FeatureStats,
+) -> Optional[str]:
+    if manifest.get("params") != umap_params(config):
+        return "UMAP parameters changed"
+    drift = drift_score(frozen, feature_stats)
+    if drift > config.umap_drift_threshold:
+        return f"feature drift {drift:.3f} exceeds {config.umap_drift_threshold}"
+    return None
+
+
+def refit_reason(
+    config: PipelineConfig,
+    bundle: Optional[UmapBundle],
+    feature_stats: FeatureStats,
+) -> Optional[str]:
+    if bundle is None:
+        return "no saved model"
+    return _scaler_reason(config, bundle.manifest, bundle.feature_stats, feature_stats)
+
+
+def scaler_stats(config: PipelineConfig, current: FeatureStats) -> FeatureStats:
+    """Stats to standardize with: the saved model's scaler while it still applies, else ``current``.
+
+    Only incremental mode keeps a scaler. The saved model is kept when its
+    parameters match and ``current`` has not drifted from it, the same test
+    :func:`incremental_embedding` applies before reusing the model.
+    """
+    model_dir = config.umap_model_dir
+    if config.umap_mode != "incremental" or not (model_dir / "manifest.json").exists():
+        return current
+    with open(model_dir / "manifest.json", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    with open(model_dir / "umap_feature_stats.json", encoding="utf-8") as fh:
+        frozen = json.load(fh)
+    return current if _scaler_reason(config, manifest, frozen, current) else frozen
+
+
+def incremental_embedding(
+    config: PipelineConfig,
+    features: pd.DataFrame,
+    feature_stats: FeatureStats,
+) -> np.ndarray:
+    """Embed ``features`` against the saved model, refitting when required.
+
+    ``feature_stats`` is the scaler ``features`` was standardized with
+    (:func:`scaler_stats`); a refit saves it as the model's scaler.
+    """
+    model_dir = config.umap_model_dir
+    keys = row_keys(features)
+    bundle = UmapBundle.load(model_dir)
+    reason = refit_reason(config, bundle, feature_stats)
+
+    if reason is None:
+        z = frozen_zscores(features, bundle.feature_stats)
+        aligned = bundle.reference.set_index("row_key").reindex(keys)
+        known = aligned["umap_x"].notna().to_numpy()
+        unchanged = known & (np.abs(aligned[Z_COLS].to_numpy() - z) <= CHANGE_TOLERANCE).all(axis=1)
+        pending = ~unchanged
+        share = float(pending.mean()) if len(pending) else 0.0
+        if share > config.umap_refit_fraction:
+            reason = f"{share:.1%} of facilities changed (limit {config.umap_refit_fraction:.0%})"
+
+    if reason is not None:
+        print(f"UMAP full refit: {reason}")
+        z = features[Z_COLS].to_numpy()
+        reducer, embedding = fit_embedding(config, z)
+        bundle = UmapBundle(
+            reducer=reducer,
+            feature_stats=feature_stats,
+            reference=reference_frame(keys, z, embedding),
+            manifest={
+                "params": umap_params(config),
+                "fitted_at": config.run_date.isoformat(),
+                "fit_rows": int(len(z)),
+                "transformed_rows": 0,
+            },
+        )
+        bundle.save(model_dir)
+        return embedding
+
+    # Copy-on-write hands back a read-only view when the columns are already float32
+    embedding = aligned[["umap_x", "umap_y"]].to_numpy(dtype=np.float32, copy=True)
+    if pending.any():
+        embedding[pending] = bundle.reducer.transform(z[pending])
+    print(f"UMAP incremental update: transformed {int(pending.sum())} of {len(z)} facilities")
+
+    bundle.reference = reference_frame(keys, z, embedding)
+    bundle.manifest["updated_at"] = config.run_date.isoformat()
+    bundle.manifest["transformed_rows"] = int(bundle.manifest.get("transformed_rows", 0) + pending.sum())
+    bundle.save(model_dir, reducer_changed=False)
+    return embedding
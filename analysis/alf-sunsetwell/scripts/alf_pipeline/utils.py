@@ -0,0 +1,188 @@
+"""Utility helpers shared by the pipeline stages."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import REPO_ROOT
+from .licensure import parse_dates, status_weights
+from .schema import NA_SENTINELS, coerce_numeric
+
+
+@dataclass
+class StateFrame:
+    state: str
+    path: Path
+    frame: pd.DataFrame
+
+
+def display_path(path: Path) -> Path:
+    try:
+        return path.relative_to(REPO_ROOT)
+    except ValueError:
+        return path
+
+
+def latest_state_file(state_data_dir: Path, state_code: str) -> Path:
+    pattern_parent = state_data_dir / state_code
+    matches = sorted(pattern_parent.glob("alf-processed_*.csv"))
+    if not matches:
+        raise FileNotFoundError(
+            f"No processed file found for state '{state_code}' in {pattern_parent}"
+        )
+    return matches[-1]
+
+
+def normalize_state_chunk(df: pd.DataFrame, state: str) -> pd.DataFrame:
+    df.columns = [col.strip().lower() for col in df.columns]
+    df["state"] = state
+    return coerce_numeric(df)
+
+
+def load_state_frame(path: Path, state: str) -> StateFrame:
+    # Blank strings and NA sentinels become NaN while parsing, not in a second pass
+    df = pd.read_csv(path, dtype=str, na_values=NA_SENTINELS, low_memory=False)
+    return StateFrame(state=state, path=path, frame=normalize_state_chunk(df, state))
+
+
+def iter_state_chunks(path: Path, state: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """``load_state_frame`` for one block of ``chunk_rows`` rows at a time."""
+    reader = pd.read_csv(path, dtype=str, na_values=NA_SENTINELS, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            yield normalize_state_chunk(chunk, state)
+
+
+def ensure_columns(columns: Sequence[str], required: Iterable[str]) -> List[str]:
+    """``columns`` with any missing ``required`` columns appended."""
+    return list(columns) + [col for col in required if col not in columns]
+
+
+def column_union(column_lists: Iterable[Sequence[str]]) -> List[str]:
+    cols: List[str] = []
+    seen = set()
+    for columns in column_lists:
+        for col in columns:
+            if col not in seen:
+                seen.add(col)
+                cols.append(col)
+    return cols
+
+
+def ordered_columns(existing_path: Optional[Path], union_cols: Sequence[str]) -> List[str]:
+    base: List[str] = []
+    if existing_path and existing_path.exists():
+        base = list(pd.read_csv(existing_path, nrows=0).columns)
+
+    ordered = list(base)
+    for col in union_cols:
+        if col not in ordered:
+            ordered.append(col)
+    return ordered
+
+
+def to_numeric(series: pd.Series) -> pd.Series:
+    return pd.to_numeric(series, errors="coerce")
+
+
+def service_confidence_from_dist(distances: np.ndarray) -> float:
+    if len(distances) == 0:
+        return 0.0
+    mean_distance = float(np.mean(distances))
+    # Empirically scale to ~0.1–0.2 for distant neighbors (CA/TX/CO) and ~1 for direct observations
+    confidence = 1.0 / (1.0 + mean_distance)
+    return max(0.1, min(1.0, confidence))
+
+
+def service_confidence_from_distances(distances: np.ndarray) -> np.ndarray:
+    """Row-wise ``service_confidence_from_dist`` for a (rows × neighbors) matrix."""
+    if distances.shape[1] == 0:
+        return np.zeros(len(distances))
+    mean_distance = distances.mean(axis=1)
+    return np.clip(1.0 / (1.0 + mean_distance), 0.1, 1.0)
+
+
+def tenure_score(issue_dates: pd.Series, status: pd.Series, run_date: datetime) -> pd.Series:
+    # Ingest already parsed the dates per state; raw strings get their format detected once
+    issued, _ = parse_dates(issue_dates)
+    tenure_years = ((run_date - issued) / pd.Timedelta(days=365.25)).clip(lower=0)
+    tenure_ratio = (tenure_years / 25.0).clip(upper=1.0)
+    tenure_component = tenure_ratio.pow(0.8)  # diminishing returns after ~20 years
+
+    status_norm = pd.Series(status_weights(status), index=status.index)
+    score = tenure_component * status_norm
+    # For missing issue dates, fall back to status weight only (scaled down to avoid optimistic bias)
+    score = score.where(issued.notna(), status_norm * 0.4)
+    return score.clip(lower=0.0, upper=1.0)
+
+
+def percentile_scores(df: pd.Series) -> pd.Series:
+    if df.dropna().empty:
+        return pd.Series(np.nan, index=df.index)
+    return df.rank(pct=True)
+
+
+def reg_component(reg_ranks: pd.DataFrame, reg_available: pd.Series) -> pd.Series:
+    """Mean inverted regulatory percentile (fewer findings score higher); 0.5 when nothing is reported."""
+    reg_score = (1.0 - reg_ranks).mean(axis=1)
+    return reg_score.where(reg_available, 0.5)
+
+
+def service_component(service_ranks: pd.DataFrame) -> pd.Series:
+    return service_ranks.mean(axis=1).fillna(0.5)
+
+
+def composite_scores(
+    component_matrix: pd.DataFrame,
+    reg_available: pd.Series,
+    service_confidence: pd.Series,
+    base_weights: Mapping[str, float],
+) -> Tuple[pd.DataFrame, pd.Series]:
+    """Confidence-adjusted effective weights and the weighted composite (0 when no weight applies)."""
+    effective_weights = pd.DataFrame(
+        {
+            "reg_weight": np.where(reg_available, base_weights["reg"], 0.0),
+            "service_weight": base_weights["service"] * service_confidence,
+            "capacity_weight": base_weights["capacity"],
+            "licensure_weight": base_weights["licensure"],
+        }
+    )
+
+    weight_sum = effective_weights.sum(axis=1)
+    weight_sum = weight_sum.replace(0, np.nan)
+
+    weighted_sum = (
+        component_matrix["reg_score"] * effective_weights["reg_weight"]
+        + component_matrix["service_score"] * effective_weights["service_weight"]
+        + component_matrix["capacity_score"] * effective_weights["capacity_weight"]
+        + component_matrix["licensure_score"] * effective_weights["licensure_weight"]
+    )
+
+    composite_raw = (weighted_sum / weight_sum).fillna(0.0)
+    return effective_weights, composite_raw
+
+
+def safe_mean(series: pd.Series) -> float:
+    return float(series.dropna().mean()) if not series.dropna().empty else float("nan")
+
+
+def row_keys(features: pd.DataFrame) -> pd.Series:
+    """Stable facility key: state, license number, and occurrence for duplicates."""
+    base = features["state"].astype(str) + "|" + features["state_license_number"].astype(str)
+    occurrence = base.groupby(base).cumcount().astype(str)
+    return base + "|" + occurrence
+
+
+def zscore(series: pd.Series, stats: Dict[str, float]) -> pd.Series:
+    """Standardize ``series`` with a ``{"mean", "std"}`` entry from umap_feature_stats.json."""
+    std = stats["std"]
+    if math.isclose(std, 0.0, abs_tol=1e-9) or math.isnan(std):
+        return pd.Series(0.0, index=series.index)
+    return ((series - stats["mean"]) / std).fillna(0.0)
@@ -0,0 +1,100 @@
+"""Score several weight versions side by side from one component matrix.
+
+A version is a named component weighting, read from a JSON file such as::
+
+    {"version": "v1", "weights": {"reg": 0.4, "service": 0.25, "capacity": 0.2, "licensure": 0.15}}
+
+(a bare ``{"reg": ..., ...}`` mapping also works; the name then comes from
+the file stem). All versions are stacked into one (version × 1 × component)
+:class:`~.sensitivity.WeightGrid` and scored against the shared component
+matrix in a single :func:`~.sensitivity.composite_batch` call; percentiles
+are one column-wise rank over the (facility × version) matrix.
+
+The evaluation compares every pair of versions: Pearson correlation of the
+composites, Spearman rank correlation (one ``spearmanr`` call over all
+versions), mean absolute percentile shift, and overlap of the top-N sets
+(one boolean matrix product per N).
+"""
+
+from __future__ import annotations
+
+import json
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+
+from .sensitivity import WEIGHT_KEYS, WeightGrid, composite_batch, top_mask
+
+
+def load_weight_file(path: Path) -> Tuple[str, Dict[str, float]]:
+    """``(version name, weights)`` from an ALF weight file."""
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    weights = data.get("weights", data) if isinstance(data, dict) else None
+    if not isinstance(weights, dict):
+        weights = {}
+    missing = [key for key in WEIGHT_KEYS if not isinstance(weights.get(key), (int, float))]
+    if missing:
+        raise ValueError(
+            f"{path} is not an ALF weight file: needs numeric weights for {WEIGHT_KEYS}, missing {missing}"
+        )
+    return str(data.get("version", path.stem)), {key: float(weights[key]) for key in WEIGHT_KEYS}
+
+
+def version_grid(versions: Mapping[str, Mapping[str, float]]) -> WeightGrid:
+    vectors = np.array([[weights[key] for key in WEIGHT_KEYS] for weights in versions.values()], dtype=float)
+    labels = pd.DataFrame({"version": list(versions)})
+    return WeightGrid.from_vectors(vectors, labels=labels)
+
+
+def score_versions(
+    versions: Mapping[str, Mapping[str, float]],
+    components: np.ndarray,
+    modifiers: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(facility × version) composites and their cohort percentiles."""
+    grid = version_grid(versions)
+    composites = composite_batch(grid.weights, np.zeros(len(components), dtype=np.intp), components, modifiers).T
+    percentiles = pd.DataFrame(composites).rank(pct=True).to_numpy()
+    return composites, percentiles
+
+
+def _correlation_matrix(values: np.ndarray, method: str) -> np.ndarray:
+    if values.shape[1] < 2:
+        return np.ones((values.shape[1], values.shape[1]))
+    if method == "spearman":
+        return np.atleast_2d(spearmanr(values).statistic)
+    return np.corrcoef(values, rowvar=False)
+
+
+def evaluate_versions(
+    names: Sequence[str],
+    composites: np.ndarray,
+    percentiles: np.ndarray,
+    top_n: Sequence[int] = (100,),
+) -> Dict[str, Any]:
+    """Pairwise agreement between versions, keyed ``"<a>__vs__<b>"``."""
+    n_rows = composites.shape[0]
+    sizes = {str(n): min(int(n), n_rows) for n in top_n}
+    sizes["decile"] = int(np.ceil(n_rows / 10))
+    pearson = _correlation_matrix(composites, "pearson")
+    spearman = _correlation_matrix(composites, "spearman")
+    overlaps = {}
+    for label, size in sizes.items():
+        masks = top_mask(composites.T, size).astype(np.int64)
+        overlaps[label] = (masks @ masks.T) / size if size else np.ones((len(names), len(names)))
+
+    pairs = {}
+    for a, b in combinations(range(len(names)), 2):
+        pairs[f"{names[a]}__vs__{names[b]}"] = {
+            "n": int(n_rows),
+            "pearson": float(pearson[a, b]),
+            "spearman": float(spearman[a, b]),
+            "mean_abs_percentile_shift": float(np.abs(percentiles[:, a] - percentiles[:, b]).mean()),
+            "top_n_overlap": {label: float(matrix[a, b]) for label, matrix in overlaps.items()},
+        }
+    return pairs
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Benchmark the ALF rebuild pipeline on synthetic multi-state cohorts.
+
+Each scenario generates synthetic ``alf-processed_*.csv`` exports (facility
+count × number of states, regulatory/service columns on ~14% of rows), runs
+every stage without caches in a fresh process, and records per-stage wall
+time, CPU time, and peak RSS. Results are compared with a stored baseline and
+the script exits non-zero when a stage regresses past the tolerance.
+
+Run from the repository root:
+
+    python analysis/alf-sunsetwell/scripts/benchmark_pipeline.py --scale 20k
+    python analysis/alf-sunsetwell/scripts/benchmark_pipeline.py --scale 100k --states 6 --states 50
+    python analysis/alf-sunsetwell/scripts/benchmark_pipeline.py --scale 20k --update-baseline
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from alf_pipeline.benchmark import (
+    SCALES,
+    SyntheticCohort,
+    compare_to_baseline,
+    load_baseline,
+    run_scenario,
+    save_baseline,
+    scenario_table,
+)
+from alf_pipeline.config import SCRIPTS_DIR
+
+
+DEFAULT_BASELINE = SCRIPTS_DIR / "benchmarks" / "baseline.json"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--scale",
+        action="append",
+        choices=sorted(SCALES, key=SCALES.get),
+        dest="scales",
+        help="Facility count to benchmark (repeatable; default 20k)",
+    )
+    parser.add_argument(
+        "--states",
+        action="append",
+        type=int,
+        dest="state_counts",
+        metavar="N",
+        help="Number of states in the cohort, 1-50 (repeatable; default 6)",
+    )
+    parser.add_argument("--detail-share", type=float, default=0.14, help="Share of rows with regulatory/service columns")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument("--stream", type=int, default=0, metavar="ROWS", help="Benchmark streaming mode with ROWS-row blocks")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown / memory growth")
+    parser.add_argument("--output", type=Path, help="Also write the results JSON here")
+    parser.add_argument("--workdir", type=Path, help="Directory for synthetic inputs and outputs (default: temp)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated data and pipeline outputs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    workroot = args.workdir or Path(tempfile.mkdtemp(prefix="alf-bench-"))
+
+    scenarios = {}
+    for scale in args.scales or ["20k"]:
+        for states in args.state_counts or [6]:
+            cohort = SyntheticCohort(SCALES[scale], states, detail_share=args.detail_share, seed=args.seed)
+            print(f"=== {cohort.name}: {cohort.facilities:,} facilities across {states} states")
+            scenarios[cohort.name] = run_scenario(
+                cohort, workroot / cohort.name, stream_chunk_rows=args.stream, keep=args.keep
+            )
+
+    table = scenario_table(scenarios)
+    print(table.to_string(index=False))
+    for name, result in scenarios.items():
+        print(f"{name}: peak RSS {result['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(scenarios, fh, indent=2)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, scenarios)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; rerun with --update-baseline to record one.")
+        return 0
+
+    regressions = compare_to_baseline(scenarios, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print(f"✅ No stage regressed beyond {args.tolerance:.0%} of the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Regression checks for pipeline behavior that a single run cannot show.
+
+``changeset``: generates a synthetic cohort, runs the pipeline through
+``score_diff`` twice with only the run date moved forward a week, and fails
+when the second run reports more than ``--max-changed`` of the facilities as
+changed (tenure ageing and percentile rank jitter must stay under the
+score_diff tolerances).
+
+``cache-keys``: copies ``alf_pipeline``, edits one helper module at a time
+and fails unless the stages using that helper (directly or through another
+module) get a new cache key while unrelated stages keep theirs.
+
+Exits non-zero when a check fails. Run from the repository root:
+
+    python analysis/alf-sunsetwell/scripts/check_pipeline.py
+    python analysis/alf-sunsetwell/scripts/check_pipeline.py --check changeset --facilities 3000
+    python analysis/alf-sunsetwell/scripts/check_pipeline.py --check cache-keys
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import alf_pipeline
+from alf_pipeline import PIPELINE, PipelineConfig
+from alf_pipeline.benchmark import BENCHMARK_RUN_DATE, SyntheticCohort, generate_state_files
+
+
+# Helper module edited -> (stages whose key must change, a stage whose key must not)
+HELPER_EDITS = {
+    "changeset": (["score_diff"], "umap"),
+    "imputation": (["impute", "score"], "combine"),
+    "umap_model": (["umap"], "score_diff"),
+    "licensure": (["ingest", "combine", "score"], "score_diff"),
+}
+CODE_HASHES = (
+    "import json; from alf_pipeline import PIPELINE; "
+    "print(json.dumps({name: stage.code_hash() for name, stage in PIPELINE.stages.items()}))"
+)
+
+
+def check_changeset(args: argparse.Namespace, workdir: Path) -> List[str]:
+    """A date-only rerun must yield an (almost) empty changeset."""
+    cohort = SyntheticCohort(args.facilities, args.states, seed=args.seed)
+    state_dir = workdir / "state"
+    codes = generate_state_files(state_dir, cohort)
+    summary: Dict[str, int] = {}
+    for run_date in (BENCHMARK_RUN_DATE, BENCHMARK_RUN_DATE + timedelta(days=7)):
+        config = PipelineConfig(
+            state_data_dir=state_dir,
+            data_dir=workdir / "data",
+            cache_dir=workdir / "data" / ".cache",
+            run_date=run_date,
+            state_codes=codes,
+        )
+        config.data_dir.mkdir(parents=True, exist_ok=True)
+        PIPELINE.run(config, until="score_diff")
+        with open(config.data_dir / "score_changes_summary.json", encoding="utf-8") as fh:
+            summary = json.load(fh)
+
+    allowed = int(args.max_changed * cohort.facilities)
+    print(
+        f"Date-only rerun: {summary['inserted']} inserted, {summary['removed']} removed, "
+        f"{summary['changed']} changed (allowed {allowed} of {cohort.facilities})"
+    )
+    failures = []
+    if summary["inserted"] or summary["removed"]:
+        failures.append(f"changeset: {summary['inserted']} inserted / {summary['removed']} removed, expected none")
+    if summary["changed"] > allowed:
+        failures.append(f"changeset: {summary['changed']} facilities changed, more than {allowed}")
+    return failures
+
+
+def _code_hashes(package_parent: Path) -> Dict[str, str]:
+    output = subprocess.run(
+        [sys.executable, "-c", CODE_HASHES], cwd=package_parent, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def check_cache_keys(args: argparse.Namespace, workdir: Path) -> List[str]:
+    """Editing a helper module must change the code hash of the stages using it, and only those."""
+    package = Path(alf_pipeline.__file__).parent
+    pristine = workdir / "pristine"
+    shutil.copytree(package, pristine / package.name, ignore=shutil.ignore_patterns("__pycache__"))
+    baseline = _code_hashes(pristine)
+
+    failures = []
+    for helper, (affected, unaffected) in HELPER_EDITS.items():
+        edited = workdir / helper
+        shutil.copytree(pristine, edited)
+        with open(edited / package.name / f"{helper}.py", "a", encoding="utf-8") as fh:
+            fh.write("\n_CHECK_EDIT = True\n")
+        changed = sorted(name for name, digest in _code_hashes(edited).items() if digest != baseline[name])
+        print(f"Editing {helper}.py changes the keys of: {', '.join(changed)}")
+        failures += [
+            f"cache-keys: editing {helper}.py left '{name}' cached" for name in affected if name not in changed
+        ]
+        if unaffected in changed:
+            failures.append(f"cache-keys: editing {helper}.py invalidated unrelated stage '{unaffected}'")
+    return failures
+
+
+CHECKS: Dict[str, Callable[[argparse.Namespace, Path], List[str]]] = {
+    "changeset": check_changeset,
+    "cache-keys": check_cache_keys,
+}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--check", action="append", choices=sorted(CHECKS), dest="checks", help="Check to run (repeatable; default all)"
+    )
+    parser.add_argument("--facilities", type=int, default=1500, help="Synthetic cohort size for pipeline runs")
+    parser.add_argument("--states", type=int, default=6, help="Synthetic cohort state count")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument(
+        "--max-changed", type=float, default=0.01, help="Share of facilities a date-only rerun may change"
+    )
+    parser.add_argument("--workdir", type=Path, help="Directory for synthetic inputs and outputs (default: temp)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated data and pipeline outputs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    workroot = args.workdir or Path(tempfile.mkdtemp(prefix="alf-check-"))
+
+    failures = []
+    for name in args.checks or list(CHECKS):
+        print(f"=== {name}")
+        workdir = workroot / name
+        shutil.rmtree(workdir, ignore_errors=True)
+        try:
+            failures += CHECKS[name](args, workdir)
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"❌ {len(failures)} check(s) failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("✅ All checks passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
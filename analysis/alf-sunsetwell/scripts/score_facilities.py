@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Score individual facilities against the last pipeline run without rerunning it.
+
+Reads facility rows (CSV or JSON records with the combined-table columns) and
+scores them with the frozen distributions the ``scoring_reference`` stage
+saved under ``analysis/alf-sunsetwell/data/scoring_reference``. Facilities
+already in the cohort reproduce their batch percentiles; new or edited ones
+are placed within the frozen distributions.
+
+Run from the repository root:
+
+    python analysis/alf-sunsetwell/scripts/score_facilities.py updated_facility.csv
+    python analysis/alf-sunsetwell/scripts/score_facilities.py preview.json --output preview_scores.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from alf_pipeline import PipelineConfig
+from alf_pipeline.online import OnlineScorer, ScoringReference
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("facilities", type=Path, help="CSV or JSON (records) file of facilities to score")
+    parser.add_argument("--output-dir", type=Path, help="Pipeline output directory holding scoring_reference/")
+    parser.add_argument("--output", type=Path, help="Write scores to this CSV instead of printing them")
+    return parser.parse_args(argv)
+
+
+def read_facilities(path: Path) -> pd.DataFrame:
+    if path.suffix.lower() == ".json":
+        return pd.read_json(path, orient="records", dtype={"state_license_number": str})
+    return pd.read_csv(path, dtype={"state_license_number": str}, low_memory=False)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    config = PipelineConfig()
+    if args.output_dir:
+        config.data_dir = args.output_dir.resolve()
+
+    scorer = OnlineScorer(ScoringReference.load(config.scoring_reference_dir), umap_model_dir=config.umap_model_dir)
+    facilities = read_facilities(args.facilities)
+    started = time.perf_counter()
+    scores = scorer.score(facilities)
+    elapsed = time.perf_counter() - started
+
+    if args.output:
+        scores.to_csv(args.output, index=False)
+        print(f"Scored {len(scores)} facilities in {elapsed * 1000:.1f} ms -> {args.output}")
+    else:
+        print(scores.to_string(index=False))
+        print(f"Scored {len(scores)} facilities in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
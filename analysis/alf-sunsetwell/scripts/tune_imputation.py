@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Sweep UMAP/k-NN settings against held-out FL service values.
+
+Masks a share of the holdout state's facilities with fully observed
+services, refits UMAP for every ``--umap-neighbors`` × ``--min-dist`` pair
+(in a process pool, sharing one cached kNN graph per neighbor count),
+re-imputes the masked services for every ``--knn`` value, and writes a
+ranked results table to ``imputation_sweep.csv`` (lowest normalized error
+first) plus ``imputation_sweep.json`` with the holdout and the best setting.
+The features stage is brought up to date first, from cache when possible.
+
+Run from the repository root:
+
+    python analysis/alf-sunsetwell/scripts/tune_imputation.py
+    python analysis/alf-sunsetwell/scripts/tune_imputation.py --umap-neighbors 15 25 --min-dist 0.1 0.3 --knn 10 25
+    python analysis/alf-sunsetwell/scripts/tune_imputation.py --holdout-share 0.3 --cpus 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from alf_pipeline import PIPELINE, PipelineConfig
+from alf_pipeline.runtime import apply_plan, stage_plan
+from alf_pipeline.store import publish_table
+from alf_pipeline.sweep import make_holdout, run_sweep
+from alf_pipeline.utils import display_path
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--state-dir", type=Path, help="Override the data/state input directory")
+    parser.add_argument("--output-dir", type=Path, help="Override the analysis data output directory")
+    parser.add_argument("--cache-dir", type=Path, help="Override the artifact cache directory")
+    parser.add_argument("--umap-neighbors", type=int, nargs="+", metavar="N", help="UMAP n_neighbors values")
+    parser.add_argument("--min-dist", type=float, nargs="+", metavar="D", help="UMAP min_dist values")
+    parser.add_argument("--knn", type=int, nargs="+", metavar="K", help="Imputation neighbor counts")
+    parser.add_argument("--holdout-state", help="State whose observed services are masked (default FL)")
+    parser.add_argument("--holdout-share", type=float, help="Share of its fully observed facilities to mask (default 0.2)")
+    parser.add_argument("--seed", type=int, help="Seed for choosing the masked facilities")
+    parser.add_argument("--mode", choices=("reproducible", "fast"), help="Seeded UMAP fits (default) or unseeded, multi-threaded")
+    parser.add_argument("--cpus", type=int, metavar="N", help="CPU budget for the sweep (default: all available)")
+    parser.add_argument("--workers", type=int, help="Concurrent UMAP fits (default: the CPU budget)")
+    return parser.parse_args(argv)
+
+
+def build_config(args: argparse.Namespace) -> PipelineConfig:
+    config = PipelineConfig()
+    if args.state_dir:
+        config.state_data_dir = args.state_dir.resolve()
+    if args.output_dir:
+        config.data_dir = args.output_dir.resolve()
+        if not args.cache_dir:
+            config.cache_dir = config.data_dir / ".cache"
+    if args.cache_dir:
+        config.cache_dir = args.cache_dir.resolve()
+    if args.umap_neighbors:
+        config.sweep_umap_neighbors = tuple(args.umap_neighbors)
+    if args.min_dist:
+        config.sweep_min_dist = tuple(args.min_dist)
+    if args.knn:
+        config.sweep_knn_neighbors = tuple(args.knn)
+    if args.holdout_state:
+        config.sweep_holdout_state = args.holdout_state.upper()
+    if args.holdout_share is not None:
+        config.sweep_holdout_share = args.holdout_share
+    if args.seed is not None:
+        config.sweep_seed = args.seed
+    if args.mode:
+        config.run_mode = args.mode
+    if args.cpus is not None:
+        config.cpu_budget = args.cpus
+    if args.workers is not None:
+        config.sweep_workers = args.workers
+    return config
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    config = build_config(parse_args(argv))
+    PIPELINE.run(config, until="features")
+    features = pd.read_parquet(config.data_dir / "umap_features.parquet")
+
+    holdout = make_holdout(features, config.sweep_holdout_state, config.sweep_holdout_share, config.sweep_seed)
+    fits = len(config.sweep_umap_neighbors) * len(config.sweep_min_dist)
+    plan = stage_plan(config, "sweep_workers")
+    print(
+        f"Masked {len(holdout.rows)} {config.sweep_holdout_state} facilities; {fits} UMAP fits × "
+        f"{len(config.sweep_knn_neighbors)} k-NN settings on {plan.processes} worker(s) ({plan.mode})"
+    )
+    with apply_plan(plan):
+        results = run_sweep(
+            holdout,
+            config.sweep_dir,
+            umap_neighbors=config.sweep_umap_neighbors,
+            min_dists=config.sweep_min_dist,
+            knn_neighbors=config.sweep_knn_neighbors,
+            seed=config.umap_random_state if plan.mode == "reproducible" else None,
+            workers=plan.processes,
+            threads=plan.threads,
+            chunk_size=config.knn_chunk_size,
+        )
+
+    publish_table(config, results, "imputation_sweep.csv", index=False)
+    current = results.loc[
+        (results["umap_n_neighbors"] == config.umap_n_neighbors)
+        & (results["umap_min_dist"] == config.umap_min_dist)
+        & (results["knn_neighbors"] == config.knn_neighbors)
+    ]
+    summary = {
+        "mode": plan.mode,
+        "holdout": {
+            "state": config.sweep_holdout_state,
+            "share": config.sweep_holdout_share,
+            "seed": config.sweep_seed,
+            "facilities": int(len(holdout.rows)),
+        },
+        "grid": {
+            "umap_n_neighbors": list(config.sweep_umap_neighbors),
+            "umap_min_dist": list(config.sweep_min_dist),
+            "knn_neighbors": list(config.sweep_knn_neighbors),
+        },
+        "best": json.loads(results.head(1).to_json(orient="records"))[0],
+        "current": json.loads(current.to_json(orient="records"))[0] if len(current) else None,
+    }
+    summary_path = config.data_dir / "imputation_sweep.json"
+    with open(summary_path, "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+
+    print(results.head(10).to_string(index=False))
+    print(f"Sweep results written to {display_path(config.data_dir / 'imputation_sweep.csv')} and {display_path(summary_path)}")
+
+
+if __name__ == "__main__":
+    main()